@@ -0,0 +1,2335 @@
+# ===================================================================================
+#  DASHBOARD ANALISIS PENJUALAN & KOMPETITOR - LOGIKA DATA & ANALITIK
+#  Pengambilan & normalisasi data, snapshot, view turunan, dan pencocokan produk tanpa UI.
+#  Dipakai oleh app.py (dashboard Streamlit) dan batch.py (pipeline headless, mis. cron).
+# ===================================================================================
+
+import streamlit as st
+from streamlit import config as st_config, logger as st_logger
+import pandas as pd
+import os
+import io
+import re
+import csv
+import gzip
+import json
+import time
+import glob
+import shutil
+import hashlib
+import random
+import sqlite3
+import threading
+import functools
+import itertools
+import contextlib
+from collections import deque
+import gspread
+from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Import library untuk TF-IDF
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# Snapshot disk (Feather/Arrow) bersifat opsional
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Backend query SQL DuckDB bersifat opsional (SQLite bawaan Python dipakai jika tidak terpasang)
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Pencocokan fuzzy SKU HPP (opsional; tanpa paket ini hanya SKU persis/ternormalisasi yang dicocokkan)
+try:
+    import Levenshtein
+except ImportError:
+    Levenshtein = None
+
+# Untuk SBERT (opsional, mesin pencocokan semantik)
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# ================================
+# KONFIGURASI
+# ================================
+def setting(name, default=None):
+    """Nilai konfigurasi: variabel lingkungan DASHBOARD_<NAME> lebih dulu, lalu st.secrets, lalu `default`.
+
+    Dibaca tanpa error jika secrets.toml tidak ada, sehingga modul ini bisa diimpor di luar Streamlit.
+    """
+    value = os.environ.get(f"DASHBOARD_{name.upper()}")
+    if value is not None: return value
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:
+        return default
+
+SPREADSHEET_KEY = setting("spreadsheet_key")  # Key Google Sheets, atau path folder CSV / file .xlsx lokal
+MY_STORE_NAME = setting("my_store_name")
+SNAPSHOT_DIR = setting("snapshot_dir", "snapshot_data")
+PRECOMPUTED_DIR = setting("precomputed_dir", "")  # "" = <SNAPSHOT_DIR>/views
+EMBEDDING_MODEL_NAME = setting("embedding_model", "paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_CACHE_DIR = setting("embedding_cache_dir", "embedding_cache")
+TIMING_LOG_PATH = setting("timing_log_path", "timing_log.jsonl")  # "" = tanpa log file
+RETENTION_WEEKS = int(setting("retention_weeks", 0))  # Minggu data harian yang disimpan penuh; 0 = simpan semua
+QUERY_BACKEND = setting("query_backend", "pandas")  # "pandas" | "duckdb" | "sqlite", lihat resolve_query_backend
+
+def quiet_streamlit_logging():
+    """Menurunkan log Streamlit ke level error untuk pemakaian headless (batch.py, benchmark.py, tes).
+
+    Tanpa runtime, setiap cache st.* mencatat "No runtime found" / "missing ScriptRunContext" saat dibuat & dipakai.
+    """
+    # set_option mem-parse config lebih dulu; parse pertama itu mengembalikan level log ke nilai config
+    st_config.set_option("logger.level", "error")
+    st_logger.set_log_level("error")
+
+# Diimpor di luar `streamlit run`: harus sebelum cache st.* pertama di bawah, yang sudah mencatat saat didefinisikan
+if not st.runtime.exists(): quiet_streamlit_logging()
+
+# ================================
+# INSTRUMENTASI (WAKTU, MEMORI & CACHE)
+# ================================
+# Waktu per tahap dikumpulkan ke dict {tahap: {'Detik', 'Baris', 'Panggilan'}}: satu untuk setiap penyegaran
+# data (fetch_report['stages']) dan satu untuk setiap run skrip. Keduanya ditulis sebagai JSON lines ke
+# TIMING_LOG_PATH bersama versi kode, sehingga regresi antar versi dan sheet yang lambat bisa dilacak.
+CODE_VERSION = hashlib.sha1(b''.join(open(path, 'rb').read() for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))))).hexdigest()[:8]
+RECENT_TIMINGS = 200  # Jumlah catatan terakhir yang disimpan di memori untuk panel admin
+
+@st.cache_resource
+def _metrics_store():
+    return {'lock': threading.Lock(), 'cache': {}, 'recent': deque(maxlen=RECENT_TIMINGS)}
+
+@contextlib.contextmanager
+def timed(stages, stage, rows=None):
+    """Menambahkan waktu blok ke `stages[stage]` (akumulatif jika tahap yang sama dipanggil berulang)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stages is not None:
+            entry = stages.setdefault(stage, {'Detik': 0.0, 'Baris': 0, 'Panggilan': 0})
+            entry['Detik'] += time.perf_counter() - started
+            entry['Panggilan'] += 1
+            if rows is not None: entry['Baris'] += int(rows)
+
+def merge_stages(target, source):
+    """Menggabungkan dict tahap dari thread pekerja ke dict tahap utama."""
+    for stage, entry in source.items():
+        total = target.setdefault(stage, {'Detik': 0.0, 'Baris': 0, 'Panggilan': 0})
+        for key, value in entry.items(): total[key] += value
+
+def count_cache(name, outcome):
+    store = _metrics_store()
+    with store['lock']:
+        counters = store['cache'].setdefault(name, {'hit': 0, 'miss': 0})
+        counters[outcome] += 1
+
+def tracked_cache(cache_decorator):
+    """Membungkus dekorator st.cache_* agar hit/miss tercatat per fungsi (miss = badan fungsi dijalankan)."""
+    def decorate(fn):
+        local = threading.local()
+
+        @functools.wraps(fn)
+        def on_miss(*args, **kwargs):
+            local.missed = True
+            return fn(*args, **kwargs)
+        cached = cache_decorator(on_miss)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            local.missed = False
+            result = cached(*args, **kwargs)
+            count_cache(fn.__name__, 'miss' if local.missed else 'hit')
+            return result
+        call.clear = cached.clear
+        return call
+    return decorate
+
+def log_timings(kind, stages, **fields):
+    """Mencatat satu record waktu (memori + JSON lines). Kegagalan menulis file tidak boleh mengganggu aplikasi."""
+    record = {'ts': datetime.now().isoformat(timespec='seconds'), 'kind': kind, 'code_version': CODE_VERSION, **fields,
+              'stages': {name: {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()} for name, entry in stages.items()}}
+    store = _metrics_store()
+    with store['lock']:
+        store['recent'].append(record)
+        if TIMING_LOG_PATH:
+            try:
+                with open(TIMING_LOG_PATH, 'a', encoding='utf-8') as f: f.write(json.dumps(record, default=str) + '\n')
+            except OSError:
+                pass
+    return record
+
+# ================================
+# FUNGSI KONEKSI GOOGLE SHEETS
+# ================================
+@st.cache_resource(show_spinner="Menghubungkan ke Google Sheets...")
+def connect_to_gsheets():
+    creds_dict = {
+        "type": st.secrets["gcp_type"], "project_id": st.secrets["gcp_project_id"],
+        "private_key_id": st.secrets["gcp_private_key_id"], "private_key": st.secrets["gcp_private_key_raw"].replace('\\n', '\n'),
+        "client_email": st.secrets["gcp_client_email"], "client_id": st.secrets["gcp_client_id"],
+        "auth_uri": st.secrets["gcp_auth_uri"], "token_uri": st.secrets["gcp_token_uri"],
+        "auth_provider_x509_cert_url": st.secrets["gcp_auth_provider_x509_cert_url"],
+        "client_x509_cert_url": st.secrets["gcp_client_x509_cert_url"]
+    }
+    gc = gspread.service_account_from_dict(creds_dict)
+    return gc
+
+def open_spreadsheet(source):
+    """Membuka sumber data: path lokal (folder CSV / file .xlsx) sebagai `LocalSpreadsheet`, selain itu key Google Sheets."""
+    if os.path.exists(source): return LocalSpreadsheet(source)
+    return connect_to_gsheets().open_by_key(source)
+
+# ================================
+# SUMBER DATA LOKAL (CSV / XLSX)
+# ================================
+# Meniru bagian API gspread.Spreadsheet yang dipakai sinkronisasi (worksheets, values_get, values_batch_get) dan
+# tulis balik (worksheet, add_worksheet, values_batch_update, resize), sehingga pipeline yang sama bisa berjalan
+# offline: satu file CSV per sheet (nama file = judul sheet) atau satu workbook .xlsx. File dibaca ulang setiap
+# pengambilan, jadi baris yang ditambahkan ikut tersinkron sebagai delta. Sheet yang ditulis disimpan sebagai
+# CSV di folder sumber; untuk sumber .xlsx hanya disimpan di memori objek ini.
+class LocalWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet, self.title = spreadsheet, title
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self.spreadsheet._sheet_values(self.title)), default=1)
+
+    @property
+    def row_count(self):
+        return len(self.spreadsheet._sheet_values(self.title))
+
+    def get_all_values(self):
+        return self.spreadsheet._sheet_values(self.title)
+
+    def resize(self, rows=None, cols=None):
+        values = self.spreadsheet._sheet_values(self.title)
+        values = [_trim_row(row[:cols]) for row in values[:rows]]
+        self.spreadsheet._write_sheet_values(self.title, values)
+
+class LocalSpreadsheet:
+    def __init__(self, path):
+        self.path = path
+        self._written = {}  # Sheet yang ditulis (sumber .xlsx tidak ditulis ulang ke file)
+
+    def _csv_paths(self):
+        return {os.path.splitext(name)[0]: os.path.join(self.path, name)
+                for name in sorted(os.listdir(self.path)) if name.lower().endswith('.csv')}
+
+    def _titles(self):
+        titles = list(self._csv_paths()) if os.path.isdir(self.path) else pd.ExcelFile(self.path).sheet_names
+        return titles + [title for title in self._written if title not in titles]
+
+    def _sheet_values(self, title):
+        """Isi sheet sebagai list baris string, dipangkas seperti respons API (sel & baris kosong di akhir dibuang)."""
+        if title in self._written: return self._written[title]
+        if os.path.isdir(self.path):
+            with open(self._csv_paths()[title], newline='', encoding='utf-8-sig') as f:
+                rows = [_trim_row(row) for row in csv.reader(f)]
+        else:
+            sheet = pd.read_excel(self.path, sheet_name=title, header=None, dtype=str, keep_default_na=False)
+            rows = [_trim_row(row) for row in sheet.values.tolist()]
+        while rows and not rows[-1]: rows.pop()
+        return rows
+
+    def _write_sheet_values(self, title, rows):
+        rows = [_trim_row('' if value is None else value for value in row) for row in rows]
+        while rows and not rows[-1]: rows.pop()
+        self._written[title] = rows
+        if os.path.isdir(self.path):
+            with open(self._csv_paths().get(title) or os.path.join(self.path, f"{title}.csv"), 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(rows)
+
+    def worksheets(self):
+        return [LocalWorksheet(self, title) for title in self._titles()]
+
+    def worksheet(self, title):
+        if title not in self._titles(): raise gspread.exceptions.WorksheetNotFound(title)
+        return LocalWorksheet(self, title)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self._write_sheet_values(title, [])
+        return LocalWorksheet(self, title)
+
+    def values_batch_update(self, body):
+        """Menulis setiap range di body['data'] (nilai RAW, sel kiri atas dari range) ke sheet lokal."""
+        grids, updated = {}, 0
+        for item in body['data']:
+            title, cells = _split_a1(item['range'])
+            if title not in grids: grids[title] = [list(row) for row in self._sheet_values(title)]
+            grid = grids[title]
+            row0, col0 = gspread.utils.a1_to_rowcol(cells.split(':')[0])
+            for offset, values in enumerate(item['values']):
+                while len(grid) < row0 + offset: grid.append([])
+                row = grid[row0 - 1 + offset]
+                if len(row) < col0 - 1 + len(values): row.extend([''] * (col0 - 1 + len(values) - len(row)))
+                row[col0 - 1:col0 - 1 + len(values)] = values
+                updated += len(values)
+        for title, grid in grids.items(): self._write_sheet_values(title, grid)
+        return {'totalUpdatedCells': updated}
+
+    def values_get(self, a1_range, params=None):
+        title, cells = _split_a1(a1_range)
+        rows = self._sheet_values(title)
+        if cells:
+            grid = gspread.utils.a1_range_to_grid_range(cells)
+            col_start, col_end = grid.get('startColumnIndex', 0), grid.get('endColumnIndex')
+            rows = [_trim_row(row[col_start:col_end]) for row in rows[grid.get('startRowIndex', 0):grid.get('endRowIndex')]]
+            while rows and not rows[-1]: rows.pop()
+        return {'range': a1_range, 'values': rows} if rows else {'range': a1_range}
+
+    def values_batch_get(self, ranges):
+        return {'valueRanges': [self.values_get(rng) for rng in ranges]}
+
+def _split_a1(a1_range):
+    """Memecah range A1 ("'Judul''s'!A1:Z" atau "Judul") menjadi (judul sheet, bagian sel atau '')."""
+    if a1_range.startswith("'"):
+        end = 1
+        while True:
+            end = a1_range.index("'", end)
+            if a1_range[end + 1:end + 2] != "'": break
+            end += 2
+        return a1_range[1:end].replace("''", "'"), a1_range[end + 2:]
+    title, _, cells = a1_range.partition('!')
+    return title, cells
+
+# ================================
+# FUNGSI PENGAMBILAN DATA (BATCH + RETRY)
+# ================================
+FETCH_BATCH_SIZE = 40        # Jumlah range per panggilan values_batch_get
+FETCH_MAX_WORKERS = 4        # Batas thread saat fallback per-sheet
+FETCH_MAX_RETRIES = 5
+FETCH_BASE_DELAY = 1.0       # Detik, dikali 2 setiap percobaan ulang
+FETCH_MAX_DELAY = 64.0
+EXTRA_SHEETS = ("DATABASE", "kamus_brand")
+_REPORT_LOCK = threading.Lock()
+
+def _is_retryable_error(e):
+    """True untuk error kuota (429) atau error server (5xx) dari Sheets API."""
+    if not isinstance(e, gspread.exceptions.APIError): return False
+    response = getattr(e, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status == 429 or (status is not None and 500 <= status < 600)
+
+def _with_backoff(fn, labels, report):
+    """Menjalankan `fn` dengan exponential backoff pada error 429/5xx.
+
+    Setiap percobaan ulang dicatat di `report['retried']` untuk semua label (judul sheet) terkait.
+    """
+    for attempt in range(FETCH_MAX_RETRIES + 1):
+        try:
+            with _REPORT_LOCK: report['api_calls'] += 1
+            return fn()
+        except Exception as e:
+            if not _is_retryable_error(e) or attempt == FETCH_MAX_RETRIES: raise
+            with _REPORT_LOCK:
+                for label in labels:
+                    report['retried'][label] = report['retried'].get(label, 0) + 1
+            delay = min(FETCH_BASE_DELAY * (2 ** attempt), FETCH_MAX_DELAY)
+            time.sleep(delay + random.uniform(0, FETCH_BASE_DELAY))
+
+def _a1_sheet(title):
+    """Nama sheet dalam notasi A1 (dengan quote) untuk dipakai sebagai range."""
+    return "'" + title.replace("'", "''") + "'"
+
+def _col_letter(col_count):
+    """Huruf kolom terakhir (mis. 'Z', 'AB') untuk jumlah kolom grid sebuah worksheet."""
+    return re.sub(r'\d', '', gspread.utils.rowcol_to_a1(1, max(int(col_count or 1), 1)))
+
+def _trim_row(row):
+    """Membuang sel kosong di akhir baris agar baris dari API bisa dibandingkan apa adanya."""
+    row = list(row)
+    while row and row[-1] == '': row.pop()
+    return row
+
+def new_fetch_report():
+    return {'api_calls': 0, 'retried': {}, 'failed': {}, 'missing': [], 'sync': {}, 'duration': 0.0, 'warnings': [], 'error': None,
+            'stages': {}, 'sheet_fetch': [], 'dropped': {}, 'date_formats': {}}
+
+def _list_worksheets(spreadsheet, report):
+    return _with_backoff(spreadsheet.worksheets, ["(daftar sheet)"], report)
+
+def _batch_get(spreadsheet, range_map, report):
+    """Mengambil banyak range sekaligus dengan jumlah panggilan API minimum.
+
+    `range_map` berisi judul sheet -> list range A1. Semua range digabung lalu diambil lewat
+    `values_batch_get` (per `FETCH_BATCH_SIZE` range). Jika satu batch gagal di luar error kuota/server,
+    range pada batch tersebut diambil satu per satu memakai thread pool terbatas; batch yang kehabisan percobaan
+    ulang 429/5xx langsung dicatat gagal untuk semua sheet di dalamnya. Mengembalikan
+    dict judul -> list nilai (satu per range, urutan sama); sheet yang gagal dicatat di
+    `report['failed']` dan tidak ikut dikembalikan.
+    """
+    flat = [(title, rng) for title, ranges in range_map.items() for rng in ranges]
+    results, fallback = {}, []
+    for i in range(0, len(flat), FETCH_BATCH_SIZE):
+        chunk = flat[i:i + FETCH_BATCH_SIZE]
+        labels = list(dict.fromkeys(title for title, _ in chunk))
+        try:
+            with timed(report['stages'], 'sheets.batch_get'):
+                call_started = time.perf_counter()
+                result = _with_backoff(lambda: spreadsheet.values_batch_get([rng for _, rng in chunk]), labels, report)
+            latency = time.perf_counter() - call_started
+            for key, value_range in zip(chunk, result.get('valueRanges', [])):
+                results[key] = value_range.get('values', [])
+                _log_sheet_fetch(report, key, results[key], latency, 'batch')
+        except Exception as e:
+            # Kuota/server sudah dicoba ulang _with_backoff; memecah batch hanya akan melipatgandakan panggilan API
+            if not _is_retryable_error(e):
+                fallback.extend(chunk)
+                continue
+            for title in labels: report['failed'][title] = str(e)
+
+    def fetch_one(key):
+        title, rng = key
+        call_started = time.perf_counter()
+        values = _with_backoff(lambda: spreadsheet.values_get(rng), [title], report).get('values', [])
+        _log_sheet_fetch(report, key, values, time.perf_counter() - call_started, 'tunggal')
+        return values
+
+    if fallback:
+        with ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS) as pool:
+            futures = {key: pool.submit(fetch_one, key) for key in fallback}
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    report['failed'][key[0]] = str(e)
+
+    return {title: [results[(title, rng)] for rng in ranges]
+            for title, ranges in range_map.items() if all((title, rng) in results for rng in ranges)}
+
+def _log_sheet_fetch(report, key, values, latency, call_type):
+    """Latensi & ukuran per range; untuk batch, latensi adalah durasi seluruh panggilan batch."""
+    with _REPORT_LOCK:
+        report['sheet_fetch'].append({'Sheet': key[0], 'Range': key[1], 'Panggilan': call_type, 'Detik': latency,
+                                      'Baris': len(values), 'Sel': sum(len(row) for row in values)})
+
+def _values_to_df(all_values):
+    """Mengubah list baris (header + data) menjadi DataFrame; baris pendek dari API di-pad dengan ''."""
+    if not all_values or len(all_values) < 2: return pd.DataFrame()
+    header, data = all_values[0], all_values[1:]
+    width = len(header)
+    data = [row if len(row) == width else row[:width] + [''] * (width - len(row)) for row in data]  # Salin hanya baris yang perlu
+    df_sheet = pd.DataFrame(data, columns=header)
+    if '' in df_sheet.columns: df_sheet = df_sheet.drop(columns=[''])
+    return df_sheet
+
+def _rekap_sheet_to_df(title, all_values):
+    """Fungsi helper untuk membaca satu sheet REKAP (header + baris) beserta kolom 'Toko' dan 'Status'."""
+    df_sheet = _values_to_df(all_values)
+    if df_sheet.empty: return df_sheet
+    store_name_match = re.match(r"^(.*?) - REKAP", title, re.IGNORECASE)
+    toko_name = store_name_match.group(1).strip() if store_name_match else "Toko Tak Dikenal"
+    df_sheet['Toko'] = toko_name
+    if 'Status' not in df_sheet.columns:
+        df_sheet['Status'] = 'Tersedia' if "READY" in title.upper() else 'Habis'
+    return df_sheet
+
+# ================================
+# NORMALISASI DATA REKAP
+# ================================
+NORMALIZE_MAX_WORKERS = 4     # Thread normalisasi paralel per sheet
+DATE_SAMPLE_SIZE = 50         # Jumlah nilai TANGGAL yang dipakai untuk mendeteksi format per sheet
+DATE_FORMATS = (              # Kandidat format, diuji berurutan (hari lebih dulu, seperti dayfirst=True)
+    '%d/%m/%Y', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y',
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%d %B %Y', '%d %b %Y',
+)
+PRICE_VECTOR_MAX_CHARS = 32   # Teks harga yang lebih panjang diproses lewat regex
+REQUIRED_COLUMNS = ['Tanggal', 'Nama Produk', 'Harga', 'Toko']
+DROPPED_SAMPLE_ROWS = 5
+
+def on_uniques(values, transform):
+    """Menjalankan `transform` (Series -> Series) hanya pada nilai unik lalu memetakan balik ke setiap baris.
+
+    Data REKAP adalah snapshot harian, sehingga nama, harga, dan brand yang sama berulang di banyak baris.
+    """
+    codes, uniques = pd.factorize(values)
+    transformed = np.asarray(transform(pd.Series(uniques, dtype=object)), dtype=object)
+    result = transformed.take(codes) if len(transformed) else np.full(len(codes), np.nan, dtype=object)
+    result[codes == -1] = np.nan
+    return pd.Series(result, index=values.index)
+
+# ================================
+# RESOLUSI BRAND (KAMUS_BRAND)
+# ================================
+# Brand_Utama ditentukan berurutan:
+#   1. kolom Brand yang dikenal kamus (alias -> brand utama, atau sudah berupa brand utama);
+#   2. alias kamus yang muncul di Nama Produk. Semua alias dikompilasi menjadi satu trie per kata dan setiap nama
+#      unik dipindai sekali; alias yang mulai paling awal menang, lalu yang terpanjang;
+#   3. kolom Brand apa adanya (huruf besar). Jika kosong atau berupa kata promosi (BRAND_NOISE_WORDS), dipakai
+#      kata pertama nama di luar tag [..]/(..) dan BRAND_NOISE_WORDS.
+# Kata dibandingkan setelah dipecah pada karakter non-alfanumerik, jadi "TP-LINK", "Tp Link", dan "tp.link" sama.
+BRAND_NOISE_WORDS = frozenset({
+    'ORIGINAL', 'ORI', 'PROMO', 'BUNDLE', 'BUNDLING', 'PAKET', 'READY', 'STOCK', 'STOK', 'NEW', 'BARU', 'SALE', 'DISKON',
+    'GRATIS', 'FREE', 'HOT', 'BEST', 'SELLER', 'MURAH', 'TERMURAH', 'COD', 'GARANSI', 'RESMI', 'OFFICIAL', 'LIMITED', 'FLASH',
+})
+BRAND_CACHE_MAX_NAMES = 2_000_000  # Hasil pindai per nama unik; dikosongkan bila melebihi batas ini
+_BRAND_WORD = re.compile(r'[^\W_]+')
+_BRAND_TAGS = re.compile(r'\[[^\]]*\]|\([^)]*\)|【[^】]*】')
+_TRIE_END = None  # Kunci penanda akhir alias di node trie (kata selalu str)
+
+def _build_kamus_brand(kamus_df):
+    if kamus_df.empty: return {}
+    return dict(zip(kamus_df['Alias'].str.upper(), kamus_df['Brand_Utama'].str.upper()))
+
+class BrandResolver:
+    """Trie kata dari semua alias kamus_brand untuk memindai nama produk; hasil disimpan per nama unik."""
+
+    def __init__(self, kamus_brand):
+        self.kamus = kamus_brand
+        self.known = set(kamus_brand) | set(kamus_brand.values())
+        self.trie, self.max_words, self.cache = {}, 0, {}
+        self._lock = threading.Lock()  # Sheet dinormalisasi paralel dengan resolver yang sama
+        for alias, brand in kamus_brand.items():
+            words = _BRAND_WORD.findall(alias)
+            if not words: continue
+            node = self.trie
+            for word in words: node = node.setdefault(word, {})
+            node[_TRIE_END] = brand
+            self.max_words = max(self.max_words, len(words))
+
+    def _scan(self, words):
+        for start in range(len(words)):
+            node, found = self.trie, None
+            for word in words[start:start + self.max_words]:
+                node = node.get(word)
+                if node is None: break
+                found = node.get(_TRIE_END, found)
+            if found is not None: return found
+        return None
+
+    def scan_names(self, names):
+        """Brand utama dari alias pertama (terpanjang) di setiap nama (Series nilai unik); None jika tidak ada."""
+        with self._lock:
+            if len(self.cache) + len(names) > BRAND_CACHE_MAX_NAMES: self.cache.clear()
+            resolved = {name: self.cache[name] for name in names if name in self.cache}
+        missing = [name for name in names if name not in resolved]
+        if missing:
+            words = pd.Series(missing, dtype=object).str.upper().str.findall(_BRAND_WORD)
+            found = dict(zip(missing, map(self._scan, words)))
+            with self._lock: self.cache.update(found)
+            resolved.update(found)
+        return [resolved[name] for name in names]
+
+_brand_resolvers = {}
+_BRAND_RESOLVERS_LOCK = threading.Lock()  # Normalisasi sheet berjalan paralel (NORMALIZE_MAX_WORKERS) & lintas sesi
+
+def brand_resolver(kamus_brand):
+    """BrandResolver untuk isi kamus ini (dipakai ulang selama kamus tidak berubah, beserta cache namanya)."""
+    key = hashlib.sha1(json.dumps(sorted(kamus_brand.items())).encode('utf-8')).hexdigest()
+    with _BRAND_RESOLVERS_LOCK:
+        resolver = _brand_resolvers.get(key)
+        if resolver is None:
+            resolver = _brand_resolvers[key] = BrandResolver(kamus_brand)
+            while len(_brand_resolvers) > 2: _brand_resolvers.pop(next(iter(_brand_resolvers)))
+    return resolver
+
+def _brand_from_name(names):
+    """Tebakan brand dari nama (Series nilai unik): kata pertama di luar tag [..]/(..) yang bukan BRAND_NOISE_WORDS."""
+    def first_brand_word(name):
+        for word in _BRAND_TAGS.sub(' ', name).upper().split():
+            if ''.join(_BRAND_WORD.findall(word)) not in BRAND_NOISE_WORDS: return word
+        first = name.split(maxsplit=1)
+        return first[0].upper() if first else ''
+    return pd.Series([first_brand_word(name) for name in names], index=names.index, dtype=object)
+
+def _map_brand_utama(frame, kamus_brand):
+    """Brand_Utama per baris dari kolom 'Brand' dan 'Nama Produk' (urutan aturan di atas)."""
+    if kamus_brand:
+        resolver = brand_resolver(kamus_brand)
+        def known_brand(uniques):
+            upper = uniques.str.upper()
+            return upper.where(upper.isin(resolver.known)).map(lambda brand: kamus_brand.get(brand, brand), na_action='ignore')
+        resolved = on_uniques(frame['Brand'], known_brand)
+        unknown = resolved.isna().to_numpy()
+        if unknown.any(): resolved[unknown] = on_uniques(frame['Nama Produk'][unknown], resolver.scan_names).to_numpy()
+    else:
+        resolved = pd.Series(np.nan, index=frame.index, dtype=object)
+    unresolved = resolved.isna().to_numpy()
+    if unresolved.any():  # Aturan 3 hanya untuk baris sisa; tebakan dari nama hanya untuk Brand kosong/promosi
+        fallback = on_uniques(frame['Brand'][unresolved],
+                              lambda uniques: uniques.str.upper().where(lambda upper: (upper != '') & ~upper.isin(BRAND_NOISE_WORDS)))
+        guess = fallback.isna().to_numpy()
+        if guess.any(): fallback[guess] = on_uniques(frame['Nama Produk'][unresolved][guess], _brand_from_name).to_numpy()
+        resolved[unresolved] = fallback.to_numpy()
+    return resolved
+
+def detect_date_format(values):
+    """Format TANGGAL pertama di DATE_FORMATS yang cocok untuk semua sampel non-kosong; None jika tidak ada."""
+    sample = values.head(DATE_SAMPLE_SIZE * 4).astype(str).str.strip()
+    sample = sample[sample != ''].head(DATE_SAMPLE_SIZE)
+    if sample.empty: return None
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(sample, format=date_format, errors='coerce').notna().all(): return date_format
+    return None
+
+def parse_dates(values, date_format):
+    """Parsing dengan format yang sudah dideteksi; baris yang tidak cocok diparsing ulang dengan tebakan dayfirst."""
+    if date_format is None: return pd.to_datetime(values, errors='coerce', dayfirst=True, format='mixed')
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    failed = parsed.isna()
+    if failed.any():
+        retry = values[failed].astype(str).str.strip()
+        retry = retry[retry != '']
+        if not retry.empty: parsed[retry.index] = pd.to_datetime(retry, errors='coerce', dayfirst=True, format='mixed')
+    return parsed
+
+def parse_price(values):
+    """Menggabungkan semua digit teks harga ('Rp 1.250.000' -> 1250000); NaN jika tidak ada digit.
+
+    Setara `to_numeric(str.replace(r'[^0-9]', ''))`, tetapi dihitung dengan numpy: teks diubah ke matriks
+    kode karakter, lalu setiap digit dikalikan 10^(jumlah digit di kanannya). Teks yang sangat panjang
+    atau lebih dari 18 digit memakai jalur regex.
+    """
+    text = values.astype(str)
+    result = pd.Series(np.nan, index=values.index)
+    short = (text.str.len() <= PRICE_VECTOR_MAX_CHARS).to_numpy()
+    if short.any():
+        chars = np.asarray(text.to_numpy()[short], dtype=str)
+        codes = chars.view(np.uint32).reshape(len(chars), -1) - 48
+        is_digit = codes < 10
+        digits_right = np.cumsum(is_digit[:, ::-1], axis=1)[:, ::-1] - is_digit
+        value = (np.where(is_digit, codes, 0).astype(np.int64) * np.power(10, digits_right, dtype=np.int64)).sum(axis=1)
+        n_digits = is_digit.sum(axis=1)
+        value = np.where(n_digits > 0, value.astype(float), np.nan)
+        short_idx = np.flatnonzero(short)
+        result.iloc[short_idx] = value
+        short[short_idx[n_digits > 18]] = False
+    if not short.all():
+        slow = text[~short]
+        result[~short] = pd.to_numeric(slow.str.replace(r'[^\d]', '', regex=True), errors='coerce')
+    return result
+
+def _normalize_rekap(rekap_df, kamus_brand, stages=None, info=None):
+    """Normalisasi baris mentah REKAP: rename kolom, parsing tanggal & harga, Omzet, dan Brand_Utama.
+
+    `info` (opsional) membawa 'date_format' dan 'row_offset' (nomor baris sheet untuk baris pertama) dari
+    pemanggil, dan diisi dengan format tanggal yang dipakai serta ringkasan baris yang dibuang ('dropped').
+    """
+    if rekap_df.empty: return rekap_df
+    info = info if info is not None else {}
+    rows = len(rekap_df)
+    rekap_df = rekap_df.copy()
+    rekap_df.columns = [str(c).strip().upper() for c in rekap_df.columns]
+    final_rename = {
+        'NAMA': 'Nama Produk', 'TERJUAL/BLN': 'Terjual per Bulan', 'TANGGAL': 'Tanggal', 'HARGA': 'Harga', 
+        'BRAND': 'Brand', 'STOK': 'Stok', 'TOKO': 'Toko', 'STATUS': 'Status'
+    }
+    rekap_df.rename(columns=final_rename, inplace=True)
+
+    if 'Nama Produk' in rekap_df.columns: rekap_df['Nama Produk'] = on_uniques(rekap_df['Nama Produk'].astype(str), lambda u: u.str.strip())
+    with timed(stages, 'normalize.tanggal', rows):
+        if 'Tanggal' in rekap_df.columns:
+            if info.get('date_format') is None: info['date_format'] = detect_date_format(rekap_df['Tanggal'])
+            rekap_df['Tanggal'] = parse_dates(rekap_df['Tanggal'], info['date_format'])
+    with timed(stages, 'normalize.harga', rows):
+        if 'Harga' in rekap_df.columns: rekap_df['Harga'] = pd.to_numeric(on_uniques(rekap_df['Harga'], parse_price))
+    if 'Terjual per Bulan' in rekap_df.columns:
+        rekap_df['Terjual per Bulan'] = pd.to_numeric(on_uniques(rekap_df['Terjual per Bulan'], lambda u: pd.to_numeric(u, errors='coerce'))).fillna(0)
+
+    # Baris tanpa Tanggal/Nama/Harga/Toko yang valid dibuang, tetapi dicatat per kolom beserta contoh nomor barisnya
+    missing = rekap_df[REQUIRED_COLUMNS].isna()
+    dropped = missing.any(axis=1)
+    if dropped.any():
+        info['dropped'] = {col: int(missing[col].sum()) for col in REQUIRED_COLUMNS if missing[col].any()}
+        info['dropped']['Total'] = int(dropped.sum())
+        info['dropped']['Contoh Baris'] = (np.flatnonzero(dropped.to_numpy())[:DROPPED_SAMPLE_ROWS] + info.get('row_offset', 2)).tolist()
+        rekap_df = rekap_df[~dropped]
+    if 'Brand' not in rekap_df.columns or rekap_df['Brand'].isnull().all():
+        rekap_df['Brand'] = on_uniques(rekap_df['Nama Produk'], _brand_from_name)
+    rekap_df['Omzet'] = (rekap_df['Harga'].fillna(0) * rekap_df.get('Terjual per Bulan', 0).fillna(0)).astype(int)
+    with timed(stages, 'normalize.brand_utama', rows):
+        rekap_df['Brand_Utama'] = _map_brand_utama(rekap_df, kamus_brand)
+    return rekap_df
+
+def _merge_dropped(total, dropped):
+    for key, value in dropped.items():
+        if key == 'Contoh Baris': total[key] = (total.get(key, []) + value)[:DROPPED_SAMPLE_ROWS]
+        else: total[key] = total.get(key, 0) + value
+    return total
+
+# ================================
+# REPRESENTASI HEMAT MEMORI
+# ================================
+# Kolom berkardinalitas rendah disimpan sebagai kategori. 'Nama Produk' juga kategori: kamus nama
+# unik (categories) + ID integer per baris (codes), sehingga setiap nama hanya disimpan sekali.
+CATEGORY_COLUMNS = ('Toko', 'Brand', 'Brand_Utama', 'Status', 'KATEGORI', 'Stok', 'SKU', 'Nama Produk')
+NUMERIC_COLUMNS = ('Harga', 'Terjual per Bulan', 'Omzet')
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+def frame_memory_mb(frame):
+    return frame.memory_usage(deep=True).sum() / 2**20
+
+def _narrow_numeric(series):
+    """int32 jika semua nilai bulat dan muat (selisih dua nilai pun tetap aman), int64 jika tidak; pecahan tetap float64."""
+    values = series.to_numpy()
+    if len(values) == 0: return series
+    if np.issubdtype(values.dtype, np.floating):
+        if not (np.isfinite(values).all() and (np.mod(values, 1) == 0).all()): return series
+    elif not np.issubdtype(values.dtype, np.integer):
+        return series
+    fits_int32 = values.min() >= INT32_MIN // 2 and values.max() <= INT32_MAX // 2
+    return series.astype(np.int32 if fits_int32 else np.int64)
+
+def compact_rekap(rekap_df):
+    """Versi hemat memori dari data REKAP (kategori + numerik tersempit yang aman). Idempoten, tidak mengubah input."""
+    if rekap_df.empty: return rekap_df
+    compact = rekap_df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col in compact.columns and not isinstance(compact[col].dtype, pd.CategoricalDtype):
+            compact[col] = compact[col].astype('category')
+    for col in NUMERIC_COLUMNS:
+        if col in compact.columns: compact[col] = _narrow_numeric(compact[col])
+    return compact
+
+# ================================
+# SINKRONISASI INKREMENTAL (DELTA)
+# ================================
+@st.cache_resource
+def _get_sync_store():
+    """State sinkronisasi per proses: {spreadsheet_key: {'sheets': {...}, 'kamus': {...}}}."""
+    return {'lock': threading.Lock(), 'spreadsheets': {}}
+
+def _build_sheet_state(title, all_values, kamus_brand, stages=None):
+    """State satu sheet REKAP setelah diambil penuh: jumlah baris, header, baris terakhir (anchor), format tanggal,
+    ringkasan baris yang dibuang, dan frame ternormalisasi."""
+    with timed(stages, 'normalize.to_frame', len(all_values)):
+        raw = _rekap_sheet_to_df(title, all_values)
+    info = {'row_offset': 2}
+    frame = compact_rekap(_normalize_rekap(raw, kamus_brand, stages, info))
+    return {
+        'header': _trim_row(all_values[0]), 'rows': len(all_values), 'anchor': _trim_row(all_values[-1]),
+        'last_tanggal': frame['Tanggal'].max() if not frame.empty else None, 'frame': frame,
+        'date_format': info.get('date_format'), 'dropped': info.get('dropped', {}),
+    }
+
+def _build_sheet_states(items, kamus_brand, report):
+    """Membangun state banyak sheet secara paralel (thread pool), lalu menggabungkan waktu tahapnya ke report.
+
+    Thread dipakai (bukan proses) karena baris mentah tidak perlu di-pickle ulang dan sebagian besar
+    operasi numpy/pandas melepas GIL.
+    """
+    def build(item):
+        title, all_values = item
+        stages = {}
+        return title, _build_sheet_state(title, all_values, kamus_brand, stages), stages
+
+    if not items: return {}
+    with ThreadPoolExecutor(max_workers=min(NORMALIZE_MAX_WORKERS, len(items))) as pool:
+        results = list(pool.map(build, items))
+    for _, _, stages in results: merge_stages(report['stages'], stages)
+    return {title: sheet_state for title, sheet_state, _ in results}
+
+def sync_rekap_data(spreadsheet, state, force_full=False, report=None):
+    """Menyinkronkan sheet REKAP ke `state` dan mengembalikan (rekap_df, database_df, report).
+
+    Sheet yang sudah pernah dimuat hanya diambil header dan baris mulai dari baris terakhir yang
+    diketahui (anchor); baris setelah anchor dinormalisasi lalu ditambahkan ke frame yang tersimpan.
+    Sheet dianggap ditulis ulang (dan diambil penuh) jika header berubah, baris anchor berbeda/hilang,
+    atau baris baru bertanggal lebih lama dari `TANGGAL` terakhir. `force_full=True` membangun ulang
+    semua sheet dari nol.
+    """
+    report = report if report is not None else new_fetch_report()
+    started = time.perf_counter()
+    if force_full:
+        state['sheets'].clear()
+        state['kamus'] = None
+
+    worksheets = _list_worksheets(spreadsheet, report)
+    titles = {ws.title for ws in worksheets}
+    rekap_ws = [ws for ws in worksheets if "REKAP" in ws.title.upper()]
+    for title in [t for t in state['sheets'] if t not in titles]:
+        del state['sheets'][title]
+        report['sync'][title] = {'Mode': 'dihapus', 'Baris Diproses': 0}
+    report['missing'] = [name for name in EXTRA_SHEETS if name not in titles]
+
+    range_map = {}
+    for ws in rekap_ws:
+        sheet_state = state['sheets'].get(ws.title)
+        if sheet_state is None:
+            range_map[ws.title] = [_a1_sheet(ws.title)]
+        else:
+            sheet_a1, col = _a1_sheet(ws.title), _col_letter(ws.col_count)
+            range_map[ws.title] = [f"{sheet_a1}!A1:{col}1", f"{sheet_a1}!A{sheet_state['rows']}:{col}"]
+    for name in EXTRA_SHEETS:
+        if name in titles: range_map[name] = [_a1_sheet(name)]
+    fetched = _batch_get(spreadsheet, range_map, report)
+
+    kamus_brand = _build_kamus_brand(_values_to_df(fetched["kamus_brand"][0])) if "kamus_brand" in fetched else state.get('kamus') or {}
+    kamus_changed = kamus_brand != state.get('kamus')
+    state['kamus'] = kamus_brand
+
+    rebuilt, rewritten, full_builds = set(), [], []
+    for ws in rekap_ws:
+        title = ws.title
+        if title not in fetched: continue  # Gagal diambil: pakai frame lama (jika ada)
+        sheet_state = state['sheets'].get(title)
+        if sheet_state is None:
+            all_values = fetched[title][0]
+            if all_values: full_builds.append((title, all_values))
+            report['sync'][title] = {'Mode': 'penuh', 'Baris Diproses': max(len(all_values) - 1, 0)}
+            continue
+
+        header_values, tail = fetched[title]
+        header = _trim_row(header_values[0]) if header_values else []
+        if header != sheet_state['header'] or not tail or _trim_row(tail[0]) != sheet_state['anchor']:
+            rewritten.append(title); continue
+        new_values = tail[1:]
+        if new_values:
+            info = {'date_format': sheet_state['date_format'], 'row_offset': sheet_state['rows'] + 1}
+            new_df = _normalize_rekap(_rekap_sheet_to_df(title, [sheet_state['header']] + new_values), kamus_brand, report['stages'], info)
+            last_tanggal = sheet_state['last_tanggal']
+            if not new_df.empty and last_tanggal is not None and new_df['Tanggal'].min() < last_tanggal:
+                rewritten.append(title); continue
+            sheet_state['frame'] = compact_rekap(pd.concat([sheet_state['frame'], new_df], ignore_index=True))
+            sheet_state['rows'] += len(new_values)
+            sheet_state['anchor'] = _trim_row(new_values[-1])
+            sheet_state['date_format'] = sheet_state['date_format'] or info.get('date_format')
+            _merge_dropped(sheet_state['dropped'], info.get('dropped', {}))
+            if not new_df.empty: sheet_state['last_tanggal'] = new_df['Tanggal'].max()
+        report['sync'][title] = {'Mode': 'delta', 'Baris Diproses': len(new_values)}
+
+    if rewritten:
+        refetched = _batch_get(spreadsheet, {t: [_a1_sheet(t)] for t in rewritten}, report)
+        for title in rewritten:
+            if title not in refetched: continue
+            all_values = refetched[title][0]
+            state['sheets'].pop(title, None)
+            if all_values: full_builds.append((title, all_values))
+            report['sync'][title] = {'Mode': 'ditulis ulang', 'Baris Diproses': max(len(all_values) - 1, 0)}
+
+    built = _build_sheet_states(full_builds, kamus_brand, report)
+    state['sheets'].update(built)
+    rebuilt.update(built)
+
+    if kamus_changed:
+        for title, sheet_state in state['sheets'].items():
+            if title not in rebuilt and not sheet_state['frame'].empty:
+                sheet_state['frame']['Brand_Utama'] = _map_brand_utama(sheet_state['frame'], kamus_brand).astype('category')
+        history = state.get('history')
+        if history is not None and not history.empty:  # Riwayat bisa sedang dipakai dataset aktif: ganti, jangan ubah in-place
+            state['history'] = history.assign(Brand_Utama=_map_brand_utama(history, kamus_brand).astype('category'))
+
+    order = [ws.title for ws in rekap_ws]
+    state['sheets'] = {title: state['sheets'][title] for title in order if title in state['sheets']}
+    report['dropped'] = {title: s['dropped'] for title, s in state['sheets'].items() if s['dropped']}
+    report['date_formats'] = {title: s['date_format'] for title, s in state['sheets'].items()}
+    frames = [s['frame'] for s in state['sheets'].values() if not s['frame'].empty]
+    with timed(report['stages'], 'concat', sum(len(f) for f in frames)):
+        rekap_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    database_df = _values_to_df(fetched["DATABASE"][0]) if "DATABASE" in fetched else pd.DataFrame()
+    report['duration'] = time.perf_counter() - started
+    return rekap_df, database_df, report
+
+# ================================
+# RETENSI DATA & RIWAYAT RINGKAS
+# ================================
+# Dengan RETENTION_WEEKS > 0 hanya N minggu terakhir (minggu berjalan dihitung) yang disimpan sebagai baris
+# harian. Baris yang lebih lama diringkas menjadi satu baris per (Minggu, Toko, Nama Produk) dan dibuang dari
+# state sinkronisasi, sehingga memori dan setiap groupby harian tetap terbatas. Ringkasan ini memuat baris
+# terakhir minggu itu (harga, status, stok, omzet terakhir) - bentuk yang sama dengan snapshot mingguan
+# (`latest_weekly`) - sehingga view mingguan dan tren jangka panjang tetap bisa memakainya.
+HISTORY_KEYS = ['Minggu', 'Toko', 'Nama Produk']
+
+def retention_cutoff(max_date, weeks):
+    """Awal (Senin 00:00) minggu tertua yang masih disimpan sebagai baris harian."""
+    max_date = pd.Timestamp(max_date).normalize()
+    return max_date - pd.Timedelta(days=max_date.dayofweek) - pd.Timedelta(weeks=weeks - 1)
+
+def compact_history(rekap_rows):
+    """Ringkasan mingguan baris REKAP: baris terakhir tiap (Minggu, Toko, Nama Produk), plus 'Terjual Maks',
+    'Tanggal Pertama', dan 'Jumlah Baris' (jumlah baris harian yang diringkas) dalam minggu tersebut."""
+    frame = rekap_rows.assign(Minggu=week_start(rekap_rows['Tanggal']))
+    stats = frame.groupby(HISTORY_KEYS, observed=True).agg(**{
+        'Terjual Maks': ('Terjual per Bulan', 'max'), 'Tanggal Pertama': ('Tanggal', 'min'),
+        'Jumlah Baris': ('Tanggal', 'size')}).reset_index()
+    history = latest_snapshot(frame, HISTORY_KEYS).merge(stats, on=HISTORY_KEYS, how='left')
+    return compact_rekap(history.sort_values('Tanggal', ignore_index=True))
+
+def merge_history(history, compacted, cutoff):
+    """Menggabungkan ringkasan baru ke riwayat: (Minggu, Toko) yang diringkas ulang menggantikan versi lama,
+    dan minggu mulai `cutoff` dibuang (sudah ada sebagai baris harian)."""
+    if history is not None and not history.empty:
+        recompacted = pd.MultiIndex.from_frame(compacted[['Minggu', 'Toko']].astype(object).drop_duplicates())
+        keep = ~pd.MultiIndex.from_frame(history[['Minggu', 'Toko']].astype(object)).isin(recompacted)
+        compacted = pd.concat([history[keep], compacted], ignore_index=True)
+    compacted = compacted[compacted['Minggu'] < cutoff.date()]
+    return compact_rekap(compacted.sort_values('Tanggal', ignore_index=True))
+
+def apply_retention(state, rekap_df, spreadsheet_key, report, weeks=None):
+    """Meringkas baris sebelum batas retensi ke `state['history']`, membuangnya dari frame per sheet di state
+    sinkronisasi, dan mengembalikan rekap_df berisi baris harian saja. Ringkasan dicatat di `report['retention']`.
+    Riwayat dimulai dari snapshot disk (jika ada) agar minggu yang sudah tidak ada di sheet tetap tersimpan."""
+    weeks = RETENTION_WEEKS if weeks is None else weeks
+    if state.get('history') is None: state['history'] = load_snapshot_history(spreadsheet_key)
+    cutoff = retention_cutoff(rekap_df['Tanggal'].max(), weeks)
+    old = (rekap_df['Tanggal'] < cutoff).to_numpy()
+    if old.any():
+        state['history'] = merge_history(state['history'], compact_history(rekap_df[old]), cutoff)
+        for sheet_state in state['sheets'].values():
+            frame = sheet_state['frame']
+            if not frame.empty and (frame['Tanggal'] < cutoff).any():
+                sheet_state['frame'] = frame[frame['Tanggal'] >= cutoff].reset_index(drop=True)
+        rekap_df = rekap_df[~old].reset_index(drop=True)
+    history = state['history'] if state['history'] is not None else pd.DataFrame()
+    report['retention'] = {'weeks': weeks, 'cutoff': cutoff.date().isoformat(), 'compacted_rows': int(old.sum()),
+                           'history_rows': len(history), 'history_mb': float(frame_memory_mb(history))}
+    return rekap_df, history
+
+# ================================
+# FUNGSI MEMUAT SEMUA DATA
+# ================================
+def load_all_data(spreadsheet_key, force_full=False, spreadsheet=None):
+    """Menyinkronkan data dari Google Sheets (atau sumber lokal, lihat `open_spreadsheet`) dan mengembalikan
+    (rekap_df, database_df, fetch_report). `spreadsheet` (opsional) adalah objek berantarmuka gspread.Spreadsheet
+    yang sudah dibuka; `spreadsheet_key` tetap dipakai sebagai kunci state sinkronisasi dan snapshot.
+
+    Dengan RETENTION_WEEKS > 0, rekap_df hanya berisi baris harian dalam jendela retensi dan riwayat mingguan
+    yang diringkas ada di `fetch_report['history']` (lihat `apply_retention`); tanpa retensi nilainya None.
+
+    Hasilnya tidak di-cache per sesi: pemanggil menerbitkannya ke dataset bersama (`publish_dataset`).
+    Tidak menulis ke UI (bisa berjalan di thread latar belakang); peringatan dan error dicatat di
+    `fetch_report['warnings']` / `fetch_report['error']`.
+    """
+    started = time.perf_counter()
+    sync_store = _get_sync_store()
+    if spreadsheet is None:
+        try:
+            spreadsheet = open_spreadsheet(spreadsheet_key)
+        except Exception as e:
+            fetch_report = new_fetch_report()
+            fetch_report['error'] = f"GAGAL KONEKSI/OPEN SPREADSHEET: {e}"
+            return None, None, fetch_report
+    try:
+        with sync_store['lock']:
+            state = sync_store['spreadsheets'].setdefault(spreadsheet_key, {'sheets': {}, 'kamus': None, 'history': None})
+            rekap_df, database_df, fetch_report = sync_rekap_data(spreadsheet, state, force_full=force_full)
+            fetch_report['history'] = None
+            if RETENTION_WEEKS > 0 and not rekap_df.empty:
+                with timed(fetch_report['stages'], 'retention', len(rekap_df)):
+                    rekap_df, fetch_report['history'] = apply_retention(state, rekap_df, spreadsheet_key, fetch_report)
+    except Exception as e:
+        # Spreadsheet sudah terbuka: kegagalan di sini berasal dari sinkronisasi/normalisasi, bukan koneksi
+        fetch_report = new_fetch_report()
+        fetch_report['error'] = f"GAGAL SINKRONISASI DATA ({type(e).__name__}): {e}"
+        return None, None, fetch_report
+
+    warnings = fetch_report['warnings']
+    for title, err in fetch_report['failed'].items():
+        warnings.append(f"Gagal mengambil sheet '{title}' setelah {FETCH_MAX_RETRIES} kali percobaan ulang: {err}")
+    if rekap_df.empty:
+        fetch_report['error'] = "Tidak ada data REKAP yang berhasil dimuat."
+        return None, None, fetch_report
+    if "DATABASE" in fetch_report['missing']:
+        warnings.append("Sheet 'DATABASE' tidak ditemukan.")
+    if "kamus_brand" in fetch_report['missing']:
+        warnings.append("Worksheet 'kamus_brand' tidak ditemukan. Menggunakan kolom 'Brand' standar sebagai 'Brand_Utama'.")
+
+    stages, rows = fetch_report['stages'], len(rekap_df)
+    memory_before = frame_memory_mb(rekap_df)
+    with timed(stages, 'compact', rows):
+        rekap_df = compact_rekap(rekap_df.sort_values('Tanggal', ignore_index=True))
+    fetch_report['memory'] = {'before_mb': memory_before, 'after_mb': frame_memory_mb(rekap_df)}
+    with timed(stages, 'version_hash', rows):
+        fetch_report['data_version'] = compute_data_version(rekap_df, database_df, fetch_report['history'])
+    fetch_report['total_duration'] = time.perf_counter() - started
+    with timed(stages, 'snapshot.save', rows):
+        save_snapshot(spreadsheet_key, rekap_df, database_df, fetch_report)
+    if resolve_query_backend() is not None:
+        with timed(stages, 'query_store.save', rows):
+            try:
+                save_query_store(spreadsheet_key, rekap_df, fetch_report['data_version'])
+            except Exception as e:
+                warnings.append(f"Gagal menulis database query ({resolve_query_backend()}): {e}")
+    return rekap_df, database_df, fetch_report
+
+# ================================
+# SNAPSHOT DISK (COLD START CEPAT)
+# ================================
+def compute_data_version(rekap_df, database_df, history_df=None):
+    """Versi data = hash isi rekap_df + database_df (+ riwayat ringkas jika ada); sama persis jika datanya tidak berubah."""
+    h = hashlib.sha1()
+    for frame in (rekap_df, database_df) if history_df is None else (rekap_df, database_df, history_df):
+        h.update('|'.join(map(str, frame.columns)).encode('utf-8'))
+        if not frame.empty:
+            h.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return h.hexdigest()[:12]
+
+def _snapshot_dir(spreadsheet_key):
+    return os.path.join(SNAPSHOT_DIR, hashlib.sha1(spreadsheet_key.encode('utf-8')).hexdigest()[:12])
+
+def save_snapshot(spreadsheet_key, rekap_df, database_df, fetch_report):
+    """Menyimpan dataset ternormalisasi ke Feather (tanpa kompresi, agar bisa di-memory-map).
+
+    File ditulis ke subfolder per versi lalu `meta.json` diganti secara atomik, sehingga pembaca
+    tidak pernah melihat snapshot setengah jadi. Versi lama dihapus setelahnya.
+    """
+    if feather is None: return
+    base_dir = _snapshot_dir(spreadsheet_key)
+    version = fetch_report['data_version']
+    meta_path = os.path.join(base_dir, 'meta.json')
+    try:
+        old_meta = _read_snapshot_meta(base_dir)
+        if old_meta and old_meta.get('version') == version: return
+        version_dir = os.path.join(base_dir, f"v_{version}")
+        os.makedirs(version_dir, exist_ok=True)
+        feather.write_feather(rekap_df.reset_index(drop=True), os.path.join(version_dir, 'rekap.feather'), compression='uncompressed')
+        feather.write_feather(database_df.reset_index(drop=True), os.path.join(version_dir, 'database.feather'), compression='uncompressed')
+        history = fetch_report.get('history')
+        if history is not None:
+            feather.write_feather(history, os.path.join(version_dir, 'history.feather'), compression='uncompressed')
+        meta = {
+            'version': version, 'saved_at': datetime.now().isoformat(timespec='seconds'),
+            'rekap_rows': len(rekap_df), 'database_rows': len(database_df), 'history_rows': None if history is None else len(history),
+            'sheets_seconds': round(fetch_report.get('total_duration', 0.0), 3), 'memory': fetch_report.get('memory'),
+            'sheets_mode': 'penuh' if all(v['Mode'] != 'delta' for v in fetch_report['sync'].values()) else 'delta'
+        }
+        if old_meta and meta['sheets_mode'] == 'delta':
+            meta['full_sheets_seconds'] = old_meta.get('full_sheets_seconds')
+        else:
+            meta['full_sheets_seconds'] = meta['sheets_seconds']
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        for name in os.listdir(base_dir):
+            if name.startswith('v_') and name != f"v_{version}":
+                shutil.rmtree(os.path.join(base_dir, name), ignore_errors=True)
+    except Exception as e:
+        fetch_report.setdefault('warnings', []).append(f"Gagal menyimpan snapshot data ke disk: {e}")
+
+def _read_snapshot_meta(base_dir):
+    try:
+        with open(os.path.join(base_dir, 'meta.json'), encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _read_snapshot_history(version_dir):
+    path = os.path.join(version_dir, 'history.feather')
+    return feather.read_table(path).to_pandas() if os.path.exists(path) else None
+
+def load_snapshot_history(spreadsheet_key):
+    """Riwayat ringkas dari snapshot terakhir (lihat `apply_retention`), atau None."""
+    meta = _read_snapshot_meta(_snapshot_dir(spreadsheet_key))
+    if feather is None or not meta: return None
+    try:
+        return _read_snapshot_history(os.path.join(_snapshot_dir(spreadsheet_key), f"v_{meta['version']}"))
+    except Exception:
+        return None
+
+def load_snapshot(spreadsheet_key):
+    """Memuat snapshot terakhir dari disk (memory-mapped). Mengembalikan (rekap_df, database_df, meta) atau None;
+    riwayat ringkas (jika snapshot ditulis dengan retensi) ada di `meta['history']`."""
+    if feather is None: return None
+    started = time.perf_counter()
+    base_dir = _snapshot_dir(spreadsheet_key)
+    meta = _read_snapshot_meta(base_dir)
+    if not meta: return None
+    version_dir = os.path.join(base_dir, f"v_{meta['version']}")
+    try:
+        rekap_df = feather.read_table(os.path.join(version_dir, 'rekap.feather'), memory_map=True).to_pandas()
+        database_df = feather.read_table(os.path.join(version_dir, 'database.feather'), memory_map=True).to_pandas()
+        meta['history'] = _read_snapshot_history(version_dir)
+    except Exception:
+        return None
+    meta['load_seconds'] = time.perf_counter() - started
+    return rekap_df, database_df, meta
+
+# ================================
+# BACKEND QUERY SQL TERTANAM (DUCKDB / SQLITE)
+# ================================
+# Opsional (setting 'query_backend'): riwayat REKAP ternormalisasi juga ditulis ke database lokal di folder
+# snapshot, satu file per versi data, dan view yang memindai riwayat (pivot omzet, hitungan status, brand
+# kompetitor, Cek Brand Toko) dikirim sebagai query SQL dengan filter 'Tanggal' / 'Toko'.
+# Baris ditulis terurut 'Tanggal' (urutan dataset): DuckDB melewati row group di luar rentang lewat zone map,
+# SQLite memakai indeks ('Tanggal') dan ('Toko', 'Tanggal'). rowid mengikuti urutan baris dataset.
+QUERY_STORE_TABLE = 'rekap'
+SQLITE_CHUNK_ROWS = 50_000
+_SQL_DIALECT = {
+    'duckdb': {'day': 'CAST("Tanggal" AS DATE)', 'week': 'CAST(date_trunc(\'week\', "Tanggal") AS DATE)'},
+    'sqlite': {'day': 'date("Tanggal")', 'week': 'date("Tanggal", \'weekday 0\', \'-6 days\')'},  # Senin awal minggu
+}
+
+def resolve_query_backend(name=None):
+    """Backend query aktif: 'duckdb' atau 'sqlite', atau None untuk 'pandas'. 'duckdb' jatuh ke 'sqlite' jika tidak terpasang."""
+    name = str(name or QUERY_BACKEND).strip().lower()
+    if name == 'duckdb' and duckdb is None: name = 'sqlite'
+    return name if name in _SQL_DIALECT else None
+
+def _query_store_path(spreadsheet_key, data_version, backend):
+    return os.path.join(_snapshot_dir(spreadsheet_key), f"query_{data_version}.{backend}")
+
+def save_query_store(spreadsheet_key, rekap_df, data_version, backend=None):
+    """Menulis rekap_df ke database query untuk versi data ini (lewat file sementara yang di-rename), lalu
+    menghapus file versi lain. Tidak melakukan apa pun jika file versi ini sudah ada. Mengembalikan path-nya."""
+    backend = resolve_query_backend(backend)
+    if backend is None: return None
+    path = _query_store_path(spreadsheet_key, data_version, backend)
+    if os.path.exists(path): return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    frame = rekap_df.reset_index(drop=True)
+    if backend == 'duckdb':
+        # Kategori ditulis sebagai VARCHAR (bukan ENUM) agar perbandingan dengan nilai di luar kamus tidak error
+        columns = ', '.join(f'CAST("{c}" AS VARCHAR) AS "{c}"' if isinstance(frame[c].dtype, pd.CategoricalDtype) else f'"{c}"'
+                            for c in frame.columns)
+        with contextlib.closing(duckdb.connect(tmp_path)) as con:
+            con.register('frame', frame)
+            con.execute(f'CREATE TABLE {QUERY_STORE_TABLE} AS SELECT {columns} FROM frame')
+    else:
+        with contextlib.closing(sqlite3.connect(tmp_path)) as con:
+            frame.to_sql(QUERY_STORE_TABLE, con, index=False, chunksize=SQLITE_CHUNK_ROWS)
+            con.execute(f'CREATE INDEX idx_{QUERY_STORE_TABLE}_tanggal ON {QUERY_STORE_TABLE} ("Tanggal")')
+            con.execute(f'CREATE INDEX idx_{QUERY_STORE_TABLE}_toko_tanggal ON {QUERY_STORE_TABLE} ("Toko", "Tanggal")')
+            con.commit()
+    os.replace(tmp_path, path)
+    for old_path in glob.glob(os.path.join(os.path.dirname(path), f"query_*.{backend}")):
+        if old_path != path:
+            with contextlib.suppress(OSError): os.remove(old_path)
+    open_query_store.clear()
+    return path
+
+@st.cache_resource(max_entries=2)
+def open_query_store(spreadsheet_key, data_version, backend=None):
+    """Handle baca database query untuk versi data ini, atau None (backend 'pandas' atau file belum ditulis).
+
+    DuckDB memakai satu koneksi read-only per versi (cursor per query); SQLite membuka koneksi read-only per query.
+    """
+    backend = resolve_query_backend(backend)
+    if backend is None: return None
+    path = _query_store_path(spreadsheet_key, data_version, backend)
+    if not os.path.exists(path): return None
+    store = {'backend': backend, 'path': path, 'version': data_version, 'dialect': _SQL_DIALECT[backend]}
+    if backend == 'duckdb': store['conn'] = duckdb.connect(path, read_only=True)
+    return store
+
+def run_query(store, sql, params=()):
+    """Menjalankan satu query SELECT pada database query dan mengembalikan DataFrame."""
+    if store['backend'] == 'duckdb':
+        with contextlib.closing(store['conn'].cursor()) as cursor:
+            return cursor.execute(sql, list(params)).df()
+    with contextlib.closing(sqlite3.connect(f"file:{store['path']}?mode=ro", uri=True)) as con:
+        return pd.read_sql_query(sql, con, params=list(params))
+
+def _sql_timestamp(value):
+    """Parameter waktu dalam format yang sama dengan kolom 'Tanggal' SQLite (teks) dan bisa di-cast oleh DuckDB."""
+    return pd.Timestamp(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def _sql_day_range(start_date, end_date):
+    """Batas [awal hari start_date, awal hari setelah end_date) untuk filter 'Tanggal' yang tetap memakai indeks."""
+    return _sql_timestamp(pd.Timestamp(start_date).normalize()), _sql_timestamp(pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1))
+
+def query_stock_status_trends(store, start_date, end_date):
+    """Versi SQL `stock_status_trends` untuk rentang tanggal (batas sama dengan `get_range_views`)."""
+    counts = run_query(store, f'''
+        SELECT {store['dialect']['week']} AS "Minggu", "Toko", "Status", COUNT(*) AS "Jumlah" FROM {QUERY_STORE_TABLE}
+        WHERE "Tanggal" >= ? AND "Tanggal" <= ? AND "Status" IS NOT NULL
+        GROUP BY 1, 2, 3 ORDER BY 1, 2, 3''', (_sql_timestamp(start_date), _sql_timestamp(end_date)))
+    counts['Minggu'] = pd.to_datetime(counts['Minggu']).dt.date
+    return counts.set_index(['Minggu', 'Toko', 'Status'])['Jumlah'].unstack(fill_value=0).reset_index()
+
+def query_omzet_by_date(store, start_date, end_date):
+    """Versi SQL `omzet_by_date`: agregasi dihitung di database, pandas hanya mem-pivot hasilnya (toko x tanggal)."""
+    daily = run_query(store, f'''
+        SELECT "Toko", "Tanggal", SUM("Omzet") AS "Omzet" FROM {QUERY_STORE_TABLE}
+        WHERE "Tanggal" >= ? AND "Tanggal" <= ? GROUP BY 1, 2''', (_sql_timestamp(start_date), _sql_timestamp(end_date)))
+    daily['Tanggal'] = pd.to_datetime(daily['Tanggal'])
+    return omzet_by_date(daily)
+
+def query_competitor_brand_summary(store, my_store_name):
+    """Versi SQL `competitor_brand_summary` atas snapshot terakhir tiap (Toko, produk) kompetitor.
+    Seri 'Tanggal' dipecah dengan rowid (baris pertama menang, seperti idxmax)."""
+    summary = run_query(store, f'''
+        WITH latest AS (
+            SELECT "Toko", "Brand", "Omzet", "Terjual per Bulan",
+                   ROW_NUMBER() OVER (PARTITION BY "Toko", "Nama Produk" ORDER BY "Tanggal" DESC, rowid) AS urutan
+            FROM {QUERY_STORE_TABLE} WHERE "Toko" <> ?)
+        SELECT "Toko", "Brand", SUM("Omzet") AS "Total_Omzet", SUM("Terjual per Bulan") AS "Total_Unit_Terjual"
+        FROM latest WHERE urutan = 1 AND "Brand" IS NOT NULL GROUP BY 1, 2 ORDER BY 1, 2''', (my_store_name,))
+    return summary.sort_values(['Toko', 'Total_Omzet'], ascending=[True, False], kind='stable').reset_index(drop=True)
+
+def query_stores(store):
+    return run_query(store, f'SELECT DISTINCT "Toko" FROM {QUERY_STORE_TABLE} ORDER BY 1')['Toko'].tolist()
+
+def query_brand_day(store, brand, date):
+    """Versi SQL `brand_day_summary` plus baris detailnya: (ringkasan per toko, baris produk brand pada tanggal itu)."""
+    params = (*_sql_day_range(date, date), brand)
+    rows = run_query(store, f'''
+        SELECT * FROM {QUERY_STORE_TABLE} WHERE "Tanggal" >= ? AND "Tanggal" < ? AND "Brand_Utama" = ? ORDER BY rowid''', params)
+    measures = run_query(store, f'''
+        SELECT "Toko", SUM("Omzet") AS "Omzet", SUM("Terjual per Bulan") AS "Terjual",
+               SUM(CASE WHEN "Status" = 'Tersedia' THEN 1 ELSE 0 END) AS "Ready",
+               SUM(CASE WHEN "Status" = 'Habis' THEN 1 ELSE 0 END) AS "Habis"
+        FROM {QUERY_STORE_TABLE} WHERE "Tanggal" >= ? AND "Tanggal" < ? AND "Brand_Utama" = ? GROUP BY 1''', params)
+    rows['Tanggal'] = pd.to_datetime(rows['Tanggal'])
+    return _brand_summary_frame(measures.set_index('Toko'), query_stores(store)), rows
+
+def query_brand_share_trend(store, brand, start_date, end_date):
+    """Versi SQL `brand_share_trend` (pangsa omzet brand per toko per minggu)."""
+    weekly = run_query(store, f'''
+        SELECT {store['dialect']['week']} AS "Minggu", "Toko",
+               SUM(CASE WHEN "Brand_Utama" = ? THEN "Omzet" ELSE 0 END) AS "Brand",
+               SUM(CASE WHEN "Brand_Utama" = ? THEN 1 ELSE 0 END) AS "Baris Brand",
+               SUM("Omzet") AS "Total"
+        FROM {QUERY_STORE_TABLE} WHERE "Tanggal" >= ? AND "Tanggal" < ? GROUP BY 1, 2 ORDER BY 1, 2''',
+        (brand, brand, *_sql_day_range(start_date, end_date)))
+    if weekly['Baris Brand'].sum() == 0: return pd.DataFrame()
+    weekly['Minggu'] = pd.to_datetime(weekly['Minggu']).dt.date
+    weekly = weekly.set_index(['Minggu', 'Toko'])
+    share = weekly['Brand'] / weekly['Total'].where(weekly['Total'] > 0) * 100
+    return share.unstack('Toko').fillna(0.0)
+
+# ================================
+# INDEKS PENCOCOKAN PRODUK (TF-IDF)
+# ================================
+MATCH_TOP_K = 200  # Jumlah kandidat teratas yang disimpan per pencarian
+
+@tracked_cache(st.cache_resource(show_spinner="Membangun indeks produk kompetitor...", max_entries=2))
+def build_competitor_index(data_version, _competitor_df):
+    """Indeks TF-IDF (char 3-5 gram) atas nama produk kompetitor, dibangun sekali per versi data.
+
+    Matriks hasil `TfidfVectorizer` sudah dinormalisasi L2, jadi skor cosine cukup dihitung
+    dengan perkalian sparse (dot product).
+    """
+    frame = _competitor_df[['Nama Produk', 'Toko', 'Harga', 'Brand_Utama']].reset_index(drop=True)
+    vectorizer = TfidfVectorizer(analyzer='char', ngram_range=(3, 5))
+    matrix = vectorizer.fit_transform(frame['Nama Produk'].tolist()).tocsr()
+    brand_rows = frame.groupby('Brand_Utama', observed=True).indices
+    return {'vectorizer': vectorizer, 'matrix': matrix, 'frame': frame, 'brand_rows': brand_rows}
+
+def top_k_scores(scores, k):
+    """Indeks dan skor k nilai tertinggi (urut menurun) memakai argpartition, tanpa sort penuh."""
+    k = min(k, len(scores))
+    if k <= 0: return np.array([], dtype=int), np.array([])
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return top, scores[top]
+
+def tfidf_top_k(index, product_name, top_k=MATCH_TOP_K):
+    """Top-k kompetitor (kolom 'row' = posisi baris di indeks) memakai satu perkalian sparse."""
+    query = index['vectorizer'].transform([product_name])
+    scores = np.asarray((index['matrix'] @ query.T).todense()).ravel()
+    top, top_scores = top_k_scores(scores, top_k)
+    candidates = index['frame'].iloc[top].reset_index(drop=True)
+    candidates['row'] = top
+    candidates['Skor Kemiripan'] = top_scores
+    return candidates
+
+@tracked_cache(st.cache_data(max_entries=256))
+def search_competitor_index(data_version, product_name, _index, top_k=MATCH_TOP_K):
+    """Top-k produk kompetitor termirip untuk satu nama produk; di-cache per (versi data, produk)."""
+    return tfidf_top_k(_index, product_name, top_k)
+
+BULK_MAX_CELLS = 4_000_000  # Batas sel matriks skor dense per potongan (~32 MB float64)
+
+def bulk_match_catalog(my_df, index, top_k=1, block_by_brand=True, progress=None):
+    """Mencocokkan seluruh produk `my_df` ke indeks kompetitor dalam satu proses.
+
+    Kandidat dibatasi (blocking) per `Brand_Utama` bila `block_by_brand=True`. Skor dihitung per
+    potongan baris dengan perkalian sparse (ukuran potongan dibatasi `BULK_MAX_CELLS`), lalu top-k
+    per baris diambil dengan argpartition, sehingga matriks kemiripan penuh tidak pernah dibentuk.
+    `progress` (opsional) dipanggil dengan rasio 0-1. Mengembalikan satu baris per (produk, peringkat);
+    produk tanpa kandidat tetap muncul dengan kolom padanan kosong.
+    """
+    my_frame = my_df.reset_index(drop=True)
+    query_matrix = index['vectorizer'].transform(my_frame['Nama Produk'].tolist()).tocsr()
+    if block_by_brand:
+        groups = [(my_rows, index['brand_rows'].get(brand)) for brand, my_rows in my_frame.groupby('Brand_Utama', observed=True).indices.items()]
+    else:
+        groups = [(np.arange(len(my_frame)), np.arange(index['matrix'].shape[0]))]
+
+    out_my, out_comp, out_score, out_rank = [], [], [], []
+    done, total = 0, max(len(my_frame), 1)
+    for my_rows, comp_rows in groups:
+        if comp_rows is not None and len(comp_rows):
+            candidate_t = index['matrix'][comp_rows].T.tocsr()
+            k = min(top_k, len(comp_rows))
+            rows_per_chunk = max(1, BULK_MAX_CELLS // len(comp_rows))
+            for start in range(0, len(my_rows), rows_per_chunk):
+                chunk_rows = my_rows[start:start + rows_per_chunk]
+                scores = (query_matrix[chunk_rows] @ candidate_t).toarray()
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1, kind='stable')
+                top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+                out_my.append(np.repeat(chunk_rows, k))
+                out_comp.append(comp_rows[top.ravel()])
+                out_score.append(top_scores.ravel())
+                out_rank.append(np.tile(np.arange(1, k + 1), len(chunk_rows)))
+                done += len(chunk_rows)
+                if progress: progress(done / total)
+        else:
+            done += len(my_rows)
+            if progress: progress(done / total)
+
+    concat = lambda parts, dtype: np.concatenate(parts) if parts else np.array([], dtype=dtype)
+    matches = pd.DataFrame({
+        'my_idx': concat(out_my, int), 'comp_idx': concat(out_comp, int),
+        'Skor Kemiripan': concat(out_score, float), 'Peringkat': concat(out_rank, int)
+    })
+    mine = my_frame[['Nama Produk', 'Brand_Utama', 'Harga']].copy()
+    mine.insert(1, 'SKU', my_frame['SKU'] if 'SKU' in my_frame.columns else 'N/A')
+    mine = mine.rename(columns={'Nama Produk': 'Produk Anda', 'Harga': 'Harga Anda'})
+    mine['my_idx'] = np.arange(len(mine))
+    competitors = index['frame'][['Nama Produk', 'Toko', 'Harga']].rename(
+        columns={'Nama Produk': 'Padanan Kompetitor', 'Toko': 'Toko Kompetitor', 'Harga': 'Harga Kompetitor'})
+    result = mine.merge(matches, on='my_idx', how='left').merge(competitors, left_on='comp_idx', right_index=True, how='left')
+    result['Selisih Harga'] = result['Harga Kompetitor'] - result['Harga Anda']
+    result = result.sort_values(['my_idx', 'Peringkat']).reset_index(drop=True)
+    return result[['Produk Anda', 'SKU', 'Brand_Utama', 'Harga Anda', 'Peringkat', 'Padanan Kompetitor',
+                   'Toko Kompetitor', 'Harga Kompetitor', 'Selisih Harga', 'Skor Kemiripan']]
+
+@tracked_cache(st.cache_data(max_entries=4, show_spinner=False))
+def bulk_match_cached(data_version, top_k, block_by_brand, _my_df, _index, _progress=None):
+    return bulk_match_catalog(_my_df, _index, top_k=top_k, block_by_brand=block_by_brand, progress=_progress)
+
+# ================================
+# MESIN PENCOCOKAN SEMANTIK (EMBEDDING)
+# ================================
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_MAX_SHARDS = 32     # Shard cache embedding di disk; lebih dari ini -> dipadatkan menjadi satu shard
+EMBEDDING_STALE_RATIO = 0.25  # Porsi baris cache di luar indeks saat ini yang memicu pemadatan (pruning)
+HYBRID_CANDIDATES = 200   # Kandidat TF-IDF yang di-rerank dengan embedding
+HYBRID_WEIGHT = 0.5       # Bobot skor embedding pada skor gabungan
+MATCH_ENGINES = ("TF-IDF", "Embedding (Semantik)", "Hybrid (TF-IDF + Embedding)")
+UNIT_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(gb|tb|mb|mah|mm|cm|ml|kg|gr|g|inch|in|hz|w|v)\b')
+
+def normalize_product_name(name):
+    """Nama produk yang dinormalisasi untuk embedding: huruf kecil, spasi tunggal, satuan disatukan ('1 TB' -> '1tb')."""
+    name = re.sub(r'\s+', ' ', str(name).lower()).strip()
+    return UNIT_PATTERN.sub(lambda m: m.group(1).replace(',', '.') + m.group(2), name)
+
+def _name_key(normalized_name):
+    return hashlib.blake2b(normalized_name.encode('utf-8'), digest_size=16).hexdigest()
+
+@st.cache_resource(show_spinner="Memuat model embedding (CPU)...")
+def load_embedding_model(model_name=EMBEDDING_MODEL_NAME):
+    return SentenceTransformer(model_name, device='cpu')
+
+def _shard_path(cache_dir, shard_id, kind):
+    return os.path.join(cache_dir, f"{shard_id:06d}.{kind}.npy")
+
+@st.cache_resource
+def _embedding_cache(model_name=EMBEDDING_MODEL_NAME):
+    """Cache embedding per proses, dimuat dari disk: {'rows': key -> (shard, baris), 'shards': [ndarray], 'lock': Lock}.
+
+    Di disk setiap batch embedding baru adalah satu shard (<id>.vectors.npy + <id>.keys.npy, dibaca sebagai memmap),
+    jadi menambah embedding tidak menulis ulang atau memuat vektor lama ke RAM.
+    """
+    cache_dir = os.path.join(EMBEDDING_CACHE_DIR, re.sub(r'[^\w.-]', '_', model_name))
+    cache = {'dir': cache_dir, 'rows': {}, 'shards': [], 'shard_ids': [], 'next_id': 0, 'lock': threading.Lock()}
+    for keys_path in sorted(glob.glob(os.path.join(cache_dir, '[0-9]*.keys.npy'))):
+        shard_id = int(os.path.basename(keys_path).split('.')[0])
+        cache['next_id'] = max(cache['next_id'], shard_id + 1)
+        try:
+            keys = np.load(keys_path, allow_pickle=False)
+            vectors = np.load(_shard_path(cache_dir, shard_id, 'vectors'), mmap_mode='r')
+        except (OSError, ValueError):
+            continue
+        if len(keys) != len(vectors): continue
+        cache['rows'].update({key: (len(cache['shards']), i) for i, key in enumerate(keys.tolist())})
+        cache['shards'].append(vectors)
+        cache['shard_ids'].append(shard_id)
+    return cache
+
+def _write_embedding_shard(cache, keys, vectors):
+    """Menulis satu shard baru; keys.npy ditulis terakhir sehingga shard setengah jadi diabaikan saat dimuat."""
+    os.makedirs(cache['dir'], exist_ok=True)
+    shard_id = cache['next_id']
+    cache['next_id'] += 1
+    for kind, array in (('vectors', vectors), ('keys', np.array(keys))):
+        path = _shard_path(cache['dir'], shard_id, kind)
+        np.save(path + '.tmp.npy', array)
+        os.replace(path + '.tmp.npy', path)
+    return shard_id
+
+def _gather_embeddings(cache, keys):
+    located = np.array([cache['rows'][key] for key in keys], dtype=np.int64).reshape(-1, 2)
+    width = cache['shards'][0].shape[1] if cache['shards'] else 0
+    result = np.empty((len(keys), width), dtype=np.float32)
+    for shard in np.unique(located[:, 0]):
+        mask = located[:, 0] == shard
+        result[mask] = cache['shards'][shard][located[mask, 1]]
+    return result
+
+def _compact_embedding_cache(cache, keep):
+    """Menyatukan semua shard menjadi satu shard berisi kunci `keep` saja; shard lama dihapus setelah shard baru tertulis."""
+    keep = [key for key in keep if key in cache['rows']]
+    vectors = _gather_embeddings(cache, keep)
+    shard_id = _write_embedding_shard(cache, keep, vectors)
+    old_ids = cache['shard_ids']
+    cache['shards'] = [np.load(_shard_path(cache['dir'], shard_id, 'vectors'), mmap_mode='r')]
+    cache['shard_ids'], cache['rows'] = [shard_id], {key: (0, i) for i, key in enumerate(keep)}
+    for old_id in old_ids:
+        if old_id is None: continue
+        for kind in ('keys', 'vectors'):
+            with contextlib.suppress(OSError): os.remove(_shard_path(cache['dir'], old_id, kind))
+
+def embed_names(names, model, model_name=EMBEDDING_MODEL_NAME, warnings=None, prune=False):
+    """Embedding (L2-normalized, float32) untuk setiap nama produk.
+
+    Embedding disimpan di cache disk dengan kunci hash nama yang sudah dinormalisasi, jadi hanya
+    nama baru/berubah yang di-encode (per `EMBEDDING_BATCH_SIZE`) dan ditambahkan sebagai shard baru.
+    Dengan `prune=True`, `names` dianggap seluruh indeks saat ini: jika porsi kunci lain di cache mencapai
+    EMBEDDING_STALE_RATIO, cache dipadatkan hanya berisi `names`. Cache juga dipadatkan bila shard melebihi
+    EMBEDDING_MAX_SHARDS. Tidak menulis ke UI: kegagalan menyimpan cache dicatat di list `warnings` (jika diberikan).
+    """
+    keys = [_name_key(normalize_product_name(n)) for n in names]
+    cache = _embedding_cache(model_name)
+    with cache['lock']:
+        try:
+            missing = {key: normalize_product_name(n) for key, n in zip(keys, names) if key not in cache['rows']}
+            if missing:
+                new_vectors = model.encode(list(missing.values()), batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                           normalize_embeddings=True, show_progress_bar=False).astype(np.float32)
+                # Masuk ke memori dulu: embedding tetap terpakai walau penulisan ke disk gagal
+                cache['rows'].update({key: (len(cache['shards']), i) for i, key in enumerate(missing)})
+                cache['shards'].append(new_vectors)
+                cache['shard_ids'].append(None)
+                cache['shard_ids'][-1] = _write_embedding_shard(cache, list(missing), new_vectors)
+            stale = len(cache['rows']) - len(set(keys)) if prune else 0
+            if len(cache['shards']) > EMBEDDING_MAX_SHARDS or (stale > 0 and stale >= EMBEDDING_STALE_RATIO * len(cache['rows'])):
+                _compact_embedding_cache(cache, dict.fromkeys(keys) if prune else list(cache['rows']))
+        except OSError as e:
+            message = f"Gagal menyimpan cache embedding ke disk: {e}"
+            if warnings is not None and message not in warnings: warnings.append(message)
+        return _gather_embeddings(cache, keys)
+
+@tracked_cache(st.cache_resource(show_spinner="Menghitung embedding produk kompetitor...", max_entries=2))
+def build_embedding_index(data_version, _tfidf_index):
+    """Matriks embedding kompetitor (baris sama dengan `frame` pada indeks TF-IDF), sekali per versi data.
+    'warnings' berisi peringatan cache embedding untuk ditampilkan pemanggil."""
+    model, warnings = load_embedding_model(), []
+    return {'vectors': embed_names(_tfidf_index['frame']['Nama Produk'].tolist(), model, warnings=warnings, prune=True),
+            'model': model, 'warnings': warnings}
+
+def embedding_top_k(tfidf_index, embedding_index, product_name, engine, top_k=MATCH_TOP_K):
+    """Top-k kompetitor dengan mesin embedding murni atau hybrid (rerank kandidat TF-IDF dengan embedding)."""
+    query = embed_names([product_name], embedding_index['model'], warnings=embedding_index['warnings'])[0]
+    if engine == "Hybrid (TF-IDF + Embedding)":
+        candidates = tfidf_top_k(tfidf_index, product_name, top_k=HYBRID_CANDIDATES)
+        emb_scores = embedding_index['vectors'][candidates['row'].to_numpy()] @ query
+        combined = HYBRID_WEIGHT * emb_scores + (1 - HYBRID_WEIGHT) * candidates['Skor Kemiripan'].to_numpy()
+        top, top_scores = top_k_scores(combined, top_k)
+        result = candidates.iloc[top].reset_index(drop=True)
+    else:
+        top, top_scores = top_k_scores(embedding_index['vectors'] @ query, top_k)
+        result = tfidf_index['frame'].iloc[top].reset_index(drop=True)
+        result['row'] = top
+    result['Skor Kemiripan'] = np.clip(top_scores, 0.0, 1.0)
+    return result
+
+@tracked_cache(st.cache_data(max_entries=256))
+def search_embedding_index(data_version, product_name, engine, _tfidf_index, _embedding_index, top_k=MATCH_TOP_K):
+    """Seperti `search_competitor_index`, untuk mesin 'Embedding (Semantik)' dan 'Hybrid (TF-IDF + Embedding)'."""
+    return embedding_top_k(_tfidf_index, _embedding_index, product_name, engine, top_k)
+
+def _toggle_unit(match):
+    number, space, unit = match.groups()
+    return f"{number}{unit.upper()}" if space else f"{number} {unit.lower()}"
+
+def _perturb_name(name, rng):
+    """Variasi nama produk untuk benchmark: dua kata ditukar dan penulisan satuan diubah ('1TB' <-> '1 tb')."""
+    tokens = name.split()
+    if len(tokens) > 2:
+        i, j = rng.choice(len(tokens), size=2, replace=False)
+        tokens[i], tokens[j] = tokens[j], tokens[i]
+    return re.sub(r'(\d+)(\s*)([A-Za-z]{1,4})\b', _toggle_unit, ' '.join(tokens))
+
+def benchmark_matching_engines(tfidf_index, embedding_index=None, sample_size=200, k=10, seed=42):
+    """Membandingkan latensi dan recall@1 / recall@k setiap mesin pencocokan pada data sendiri.
+
+    Kueri dibuat dari nama produk kompetitor yang diacak (`_perturb_name`); sebuah kueri dianggap
+    benar jika nama produk aslinya kembali di peringkat 1 / top-k.
+    """
+    rng = np.random.default_rng(seed)
+    frame = tfidf_index['frame']
+    sample_rows = rng.choice(len(frame), size=min(sample_size, len(frame)), replace=False)
+    queries = [_perturb_name(frame['Nama Produk'].iat[row], rng) for row in sample_rows]
+    engines = [MATCH_ENGINES[0]] + (list(MATCH_ENGINES[1:]) if embedding_index is not None else [])
+    results = []
+    for engine in engines:
+        hits_1 = hits_k = 0
+        started = time.perf_counter()
+        for row, query in zip(sample_rows, queries):
+            if engine == MATCH_ENGINES[0]:
+                found = tfidf_top_k(tfidf_index, query, top_k=k)['row'].to_numpy()
+            else:
+                found = embedding_top_k(tfidf_index, embedding_index, query, engine, top_k=k)['row'].to_numpy()
+            # Nama yang sama persis di toko lain juga dihitung benar
+            found_names = frame['Nama Produk'].to_numpy()[found]
+            original = frame['Nama Produk'].iat[row]
+            hits_1 += int(len(found_names) > 0 and found_names[0] == original)
+            hits_k += int(original in found_names)
+        elapsed = time.perf_counter() - started
+        results.append({'Mesin': engine, 'Latensi per Kueri (ms)': elapsed / len(queries) * 1000,
+                        'Recall@1': hits_1 / len(queries), f'Recall@{k}': hits_k / len(queries)})
+    return pd.DataFrame(results)
+
+# ================================
+# KALENDER & PERIODE WAKTU
+# ================================
+# Awal periode dihitung dengan aritmetika datetime64 numpy (tanpa fungsi Python per baris). Dimensi kalender (satu
+# baris per hari) dibuat sekali per versi data di get_base_views; kolom periode setiap baris diambil darinya lewat
+# kode hari (selisih hari dari awal kalender), jadi tidak diturunkan ulang di setiap rerun.
+GRANULARITIES = {'D': "Harian", 'W': "Mingguan", 'M': "Bulanan"}
+PERIOD_COLUMNS = {'D': 'Tanggal', 'W': 'Minggu', 'M': 'Bulan'}  # Kolom dimensi kalender per granularitas
+ROLLING_WINDOWS = (7, 28)
+_EPOCH_WEEKDAY = 3  # 1970-01-01 adalah hari Kamis (Senin = 0)
+
+def bucket_start(dates, granularity):
+    """Awal periode tiap nilai datetime (datetime64): hari itu ('D'), Senin minggu itu ('W', minggu Senin-Minggu),
+    atau tanggal 1 bulan itu ('M'). NaT tetap NaT."""
+    values = np.asarray(dates, dtype='datetime64[ns]')
+    days = values.astype('datetime64[D]')
+    if granularity == 'W':
+        days = days - ((days.astype(np.int64) + _EPOCH_WEEKDAY) % 7).astype('timedelta64[D]')
+    elif granularity == 'M':
+        days = days.astype('datetime64[M]').astype('datetime64[D]')
+    elif granularity != 'D':
+        raise ValueError(f"Granularitas tidak dikenal: {granularity!r} (pilih dari {list(GRANULARITIES)})")
+    starts = days.astype('datetime64[ns]')
+    starts[np.isnat(values)] = np.datetime64('NaT')
+    return pd.Series(starts, index=dates.index) if isinstance(dates, pd.Series) else pd.DatetimeIndex(starts)
+
+def week_start(dates):
+    """Tanggal Senin awal minggu (W-SUN) untuk setiap nilai datetime, sebagai objek date."""
+    return on_uniques(bucket_start(dates, 'W'), lambda uniques: pd.to_datetime(uniques).dt.date)
+
+def calendar_dimension(start_date, end_date):
+    """Satu baris per hari dari start_date s.d. end_date: awal periode tiap granularitas dan atribut kalender."""
+    days = pd.date_range(start_date, end_date, freq='D')
+    return pd.DataFrame({
+        'Tanggal': days, 'Minggu': bucket_start(days, 'W'), 'Bulan': bucket_start(days, 'M'),
+        'Hari': days.dayofweek.astype(np.int8), 'Akhir Pekan': days.dayofweek >= 5,
+        'Minggu ISO': days.isocalendar().week.to_numpy(np.int8), 'Tahun': days.year.astype(np.int16),
+    })
+
+def calendar_codes(calendar, dates):
+    """Posisi baris kalender (kode hari) untuk setiap nilai datetime di dalam rentang kalender."""
+    origin = calendar['Tanggal'].iloc[0].to_datetime64().astype('datetime64[D]')
+    return (np.asarray(dates, dtype='datetime64[ns]').astype('datetime64[D]') - origin).astype(np.int32)
+
+def period_of(calendar, dates, granularity):
+    """Awal periode (datetime64) tiap nilai datetime, diambil dari dimensi kalender."""
+    return calendar[PERIOD_COLUMNS[granularity]].to_numpy()[calendar_codes(calendar, dates)]
+
+# ================================
+# VIEW TURUNAN (CACHE PER VERSI DATA)
+# ================================
+# View disimpan dengan st.cache_resource (tanpa salinan per rerun) dan dibatasi max_entries (LRU).
+# Jangan memodifikasi frame hasil fungsi di bawah secara in-place; salin dulu dengan .copy().
+def latest_snapshot(frame, keys):
+    """Baris dengan 'Tanggal' terbaru untuk setiap kombinasi `keys` (mis. snapshot terakhir per toko & produk)."""
+    return frame.loc[frame.groupby(keys, observed=True)['Tanggal'].idxmax()]
+
+def _has_history(history):
+    return history is not None and not history.empty
+
+def _latest_with_history(latest, history):
+    """Snapshot terakhir per (Toko, produk) ditambah produk yang hanya ada di riwayat ringkas (baris terakhirnya)."""
+    older = latest_snapshot(history, ['Toko', 'Nama Produk'])
+    keys = ['Toko', 'Nama Produk']
+    missing = ~pd.MultiIndex.from_frame(older[keys].astype(object)).isin(pd.MultiIndex.from_frame(latest[keys].astype(object)))
+    if not missing.any(): return latest
+    return compact_rekap(pd.concat([latest, older.loc[missing].reindex(columns=latest.columns)], ignore_index=True))
+
+@tracked_cache(st.cache_resource(max_entries=2, show_spinner="Menyiapkan snapshot produk terbaru..."))
+def get_base_views(data_version, _df, my_store_name, _history=None):
+    """View yang hanya bergantung pada versi data: snapshot terakhir per produk, kolom minggu, dimensi kalender
+    ('calendar', lihat `calendar_dimension`), dan batas tanggal.
+
+    `_history` (opsional) adalah riwayat ringkas di luar jendela retensi: ikut menentukan snapshot terakhir dan
+    'min_date'; 'detail_min_date' adalah tanggal pertama yang masih punya baris harian.
+    """
+    detail_min_date, max_date = _df['Tanggal'].min().date(), _df['Tanggal'].max().date()
+    min_date = min(detail_min_date, _history['Tanggal Pertama'].min().date()) if _has_history(_history) else detail_min_date
+    calendar = calendar_dimension(min(min_date, _history['Tanggal'].min().date()) if _has_history(_history) else min_date, max_date)
+    stored = load_precomputed_views(data_version, my_store_name)
+    if 'latest' in stored and len(stored['minggu']) == len(_df):
+        latest, minggu = stored['latest'], stored['minggu']['Minggu'].set_axis(_df.index)
+    else:
+        latest = latest_snapshot(_df, ['Toko', 'Nama Produk'])
+        if _has_history(_history): latest = _latest_with_history(latest, _history)
+        week_dates = calendar['Minggu'].dt.date.to_numpy()
+        minggu = pd.Series(week_dates[calendar_codes(calendar, _df['Tanggal'])], index=_df.index)
+    brands = set(_df['Brand_Utama'].unique())
+    if _has_history(_history): brands.update(_history['Brand_Utama'].unique())
+    return {
+        'latest': latest,
+        'main_latest': latest[latest['Toko'] == my_store_name],
+        'competitor_latest': latest[latest['Toko'] != my_store_name],
+        'minggu': minggu,
+        'calendar': calendar,
+        'min_date': min_date, 'detail_min_date': detail_min_date, 'max_date': max_date,
+        'brands': sorted(brands),
+    }
+
+@tracked_cache(st.cache_resource(max_entries=8, show_spinner="Menyiapkan data rentang tanggal..."))
+def get_range_views(data_version, start_date, end_date, _df, my_store_name, _history=None):
+    """View untuk satu rentang tanggal: data terfilter + kolom 'Minggu', pecahan toko sendiri/kompetitor, dan snapshot mingguan.
+
+    Baris riwayat ringkas (`_history`) yang tanggal terakhirnya ada dalam rentang ikut masuk snapshot mingguan
+    ('latest_weekly' / 'main_weekly'); data harian ('filtered') hanya mencakup jendela retensi.
+    """
+    base = get_base_views(data_version, _df, my_store_name, _history)
+    mask = (_df['Tanggal'] >= pd.to_datetime(start_date)) & (_df['Tanggal'] <= pd.to_datetime(end_date))
+    filtered = _df[mask].copy()
+    filtered['Minggu'] = base['minggu'][mask]
+    stored = load_precomputed_views(data_version, my_store_name)
+    if 'latest_weekly' in stored and (start_date, end_date) == (base['min_date'], base['max_date']):
+        latest_weekly = stored['latest_weekly']  # Rentang penuh (bawaan) sudah dihitung oleh batch
+    else:
+        latest_weekly = latest_snapshot(filtered, ['Minggu', 'Toko', 'Nama Produk'])
+        if _has_history(_history):
+            in_range = (_history['Tanggal'] >= pd.to_datetime(start_date)) & (_history['Tanggal'] <= pd.to_datetime(end_date))
+            if in_range.any():
+                older = _history.loc[in_range].reindex(columns=latest_weekly.columns)
+                latest_weekly = compact_rekap(pd.concat([older, latest_weekly], ignore_index=True))
+    return {
+        'filtered': filtered,
+        'main': filtered[filtered['Toko'] == my_store_name],
+        'competitor': filtered[filtered['Toko'] != my_store_name],
+        'latest_weekly': latest_weekly,
+        'main_weekly': latest_weekly[latest_weekly['Toko'] == my_store_name],
+    }
+
+@tracked_cache(st.cache_resource(max_entries=8, show_spinner="Menyiapkan snapshot per periode..."))
+def get_period_views(data_version, start_date, end_date, granularity, _df, my_store_name, _history=None):
+    """Snapshot terakhir per (Periode, Toko, Nama Produk) dalam rentang tanggal untuk granularitas 'D'/'W'/'M'
+    ('Periode' = awal periode, datetime64), dari satu groupby, plus omzet per (Periode, Toko) dan ringkasan toko sendiri.
+
+    Baris riwayat ringkas masuk ke periode tanggal terakhirnya untuk 'W' dan 'M'; 'D' hanya memakai data harian.
+    """
+    ranged = get_range_views(data_version, start_date, end_date, _df, my_store_name, _history)
+    if granularity == 'W':
+        latest = ranged['latest_weekly'].assign(Periode=lambda frame: pd.to_datetime(frame['Minggu']))
+    else:
+        calendar = get_base_views(data_version, _df, my_store_name, _history)['calendar']
+        rows = ranged['filtered']
+        if granularity == 'M' and _has_history(_history):
+            in_range = (_history['Tanggal'] >= pd.to_datetime(start_date)) & (_history['Tanggal'] <= pd.to_datetime(end_date))
+            if in_range.any():
+                rows = compact_rekap(pd.concat([_history.loc[in_range].reindex(columns=rows.columns), rows], ignore_index=True))
+        latest = latest_snapshot(rows.assign(Periode=period_of(calendar, rows['Tanggal'], granularity)), ['Periode', 'Toko', 'Nama Produk'])
+    return {
+        'latest': latest,
+        'omzet': latest.groupby(['Periode', 'Toko'], observed=True)['Omzet'].sum().reset_index(),
+        'main_summary': store_period_summary(latest[latest['Toko'] == my_store_name], 'Periode'),
+    }
+
+@tracked_cache(st.cache_resource(max_entries=2, show_spinner="Menghitung omzet harian per toko..."))
+def get_daily_omzet(data_version, _df, my_store_name, _history=None):
+    """Total omzet harian per toko di atas dimensi kalender (baris = setiap hari, kolom = toko, NaN jika toko tidak
+    punya data hari itu), plus rata-rata bergulir setiap ROLLING_WINDOWS hari: {'daily': ..., 7: ..., 28: ...}.
+    Hanya dari data harian; hari di dalam riwayat ringkas bernilai NaN.
+
+    Dihitung sekali per versi data dengan np.bincount atas (kode hari, kode toko); rentang tanggal cukup di-slice.
+    """
+    calendar = get_base_views(data_version, _df, my_store_name, _history)['calendar']
+    store_codes, stores = pd.factorize(_df['Toko'], sort=True)
+    cells = calendar_codes(calendar, _df['Tanggal']).astype(np.int64) * len(stores) + store_codes
+    size = len(calendar) * len(stores)
+    omzet = np.bincount(cells, weights=_df['Omzet'].to_numpy(dtype=float), minlength=size)
+    present = np.bincount(cells, minlength=size) > 0
+    daily = pd.DataFrame(np.where(present, omzet, np.nan).reshape(len(calendar), len(stores)),
+                         index=pd.Index(calendar['Tanggal'], name='Tanggal'), columns=pd.Index(list(stores), name='Toko'))
+    return {'daily': daily, **{window: daily.rolling(window, min_periods=1).mean() for window in ROLLING_WINDOWS}}
+
+# ================================
+# DIFF PRODUK ANTAR MINGGU (TAB ANALISIS MINGGUAN)
+# ================================
+WOW_CHANGE_TYPES = ("Produk Baru", "Produk Hilang", "Kembali Tersedia", "Stok Habis", "Perubahan Harga")
+
+@tracked_cache(st.cache_resource(max_entries=32, show_spinner="Membandingkan produk antar minggu..."))
+def week_over_week_diff(data_version, start_date, end_date, week_before, week_after, _latest_weekly):
+    """Perubahan produk semua toko antara dua minggu, lewat satu outer join (Toko, Nama Produk) pada snapshot mingguan.
+
+    Mengembalikan {jenis perubahan: DataFrame} untuk WOW_CHANGE_TYPES, plus 'summary' (jumlah per toko).
+    """
+    cols = ['Toko', 'Nama Produk', 'Brand', 'Stok', 'Harga', 'Status']
+    weeks = _latest_weekly['Minggu']
+    before = _latest_weekly.loc[weeks == week_before, cols]
+    after = _latest_weekly.loc[weeks == week_after, cols]
+    merged = before.merge(after, on=['Toko', 'Nama Produk'], how='outer', suffixes=(' Sebelum', ' Sesudah'), indicator=True)
+    in_both = merged['_merge'] == 'both'
+    status_before, status_after = merged['Status Sebelum'].astype(object), merged['Status Sesudah'].astype(object)
+    price_delta = merged['Harga Sesudah'] - merged['Harga Sebelum']
+
+    def pick(mask, suffix):
+        frame = merged.loc[mask, ['Toko', 'Nama Produk', f'Brand {suffix}', f'Stok {suffix}', f'Harga {suffix}', f'Status {suffix}']]
+        return frame.rename(columns=lambda c: c.replace(f' {suffix}', '')).reset_index(drop=True)
+
+    changes = {
+        "Produk Baru": pick(merged['_merge'] == 'right_only', 'Sesudah'),
+        "Produk Hilang": pick(merged['_merge'] == 'left_only', 'Sebelum'),
+        "Kembali Tersedia": pick(in_both & (status_before == 'Habis') & (status_after == 'Tersedia'), 'Sesudah'),
+        "Stok Habis": pick(in_both & (status_before == 'Tersedia') & (status_after == 'Habis'), 'Sesudah'),
+    }
+    price_mask = in_both & (price_delta != 0)
+    price_changes = merged.loc[price_mask, ['Toko', 'Nama Produk', 'Brand Sesudah', 'Harga Sebelum', 'Harga Sesudah']].rename(columns={'Brand Sesudah': 'Brand'})
+    price_changes['Selisih Harga'] = price_delta[price_mask]
+    price_changes['Selisih (%)'] = price_changes['Selisih Harga'] / price_changes['Harga Sebelum'].where(price_changes['Harga Sebelum'] > 0) * 100
+    changes["Perubahan Harga"] = price_changes.sort_values('Selisih (%)', key=np.abs, ascending=False).reset_index(drop=True)
+
+    stores = sorted(_latest_weekly['Toko'].unique())
+    summary = pd.DataFrame({name: frame['Toko'].value_counts() for name, frame in changes.items()}).reindex(stores).fillna(0).astype(int)
+    changes['summary'] = summary.rename_axis('Toko')
+    return changes
+
+# ================================
+# KUBUS AGREGAT BRAND (CEK BRAND TOKO)
+# ================================
+BRAND_TREND_WEEKS = 12
+
+def _sum_dtype(series):
+    """Kolom untuk dijumlahkan: int (int32 hasil compact_rekap) -> int64, selain itu float64 tanpa pembulatan."""
+    return series.astype(np.int64 if pd.api.types.is_integer_dtype(series.dtype) else np.float64)
+
+@tracked_cache(st.cache_resource(max_entries=2, show_spinner="Menyiapkan kubus agregat brand..."))
+def get_brand_cube(data_version, _df):
+    """Agregat (Tanggal, Brand_Utama, Toko) -> Omzet, Terjual, Ready, Habis dari satu groupby per versi data.
+
+    'rows' memetakan (Tanggal, Brand_Utama) ke posisi baris di `_df` untuk daftar produk detail.
+    """
+    day = _df['Tanggal'].dt.normalize()
+    stored = load_precomputed_views(data_version)
+    if 'brand_cube' in stored:
+        cube = stored['brand_cube'].set_index(['Tanggal', 'Brand_Utama', 'Toko'])
+    else:
+        frame = pd.DataFrame({
+            'Tanggal': day, 'Brand_Utama': _df['Brand_Utama'], 'Toko': _df['Toko'],
+            # Terjual tidak dibulatkan: hasilnya sama dengan SUM di backend SQL (`query_brand_day`)
+            'Omzet': _df['Omzet'].astype(np.int64), 'Terjual': _sum_dtype(_df['Terjual per Bulan']),
+            'Ready': (_df['Status'] == 'Tersedia').astype(np.int64), 'Habis': (_df['Status'] == 'Habis').astype(np.int64),
+        })
+        cube = frame.groupby(['Tanggal', 'Brand_Utama', 'Toko'], observed=True).sum().sort_index()
+    return {
+        'cube': cube,
+        'store_totals': cube.groupby(level=['Tanggal', 'Toko'], observed=True)['Omzet'].sum(),
+        'rows': pd.DataFrame({'Tanggal': day, 'Brand_Utama': _df['Brand_Utama']}).groupby(['Tanggal', 'Brand_Utama'], observed=True).indices,
+        'stores': sorted(_df['Toko'].unique()),
+    }
+
+def brand_day_summary(brand_cube, brand, date):
+    """Ringkasan per toko (semua toko, nol jika brand tidak ada) untuk satu brand pada satu tanggal."""
+    key = (pd.Timestamp(date), brand)
+    cube = brand_cube['cube']
+    measures = cube.loc[key] if key in brand_cube['rows'] else cube.iloc[:0].droplevel([0, 1])
+    return _brand_summary_frame(measures, brand_cube['stores'])
+
+def _brand_summary_frame(measures, stores):
+    return measures.reindex(stores, fill_value=0).rename(columns={
+        'Omzet': 'Total Omzet per Bulan', 'Terjual': 'Total Produk Terjual per Bulan',
+        'Ready': 'Jumlah Produk Ready', 'Habis': 'Jumlah Produk Habis',
+    }).rename_axis('Toko')
+
+def brand_share_trend(brand_cube, brand, start_date, end_date):
+    """Pangsa omzet brand (%) terhadap total omzet tiap toko, per minggu (Senin), dalam rentang tanggal."""
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    cube, totals = brand_cube['cube'], brand_cube['store_totals']
+    dates = cube.index.get_level_values('Tanggal')
+    brand_omzet = cube.loc[(dates >= start) & (dates <= end) & (cube.index.get_level_values('Brand_Utama') == brand), 'Omzet']
+    total_dates = totals.index.get_level_values('Tanggal')
+    store_omzet = totals[(total_dates >= start) & (total_dates <= end)]
+    if brand_omzet.empty: return pd.DataFrame()
+
+    def weekly(series):
+        days = series.index.get_level_values('Tanggal')
+        week = (days - pd.to_timedelta(days.dayofweek, unit='D')).date
+        return series.groupby([week, series.index.get_level_values('Toko')], observed=True).sum()
+
+    brand_weekly, store_weekly = weekly(brand_omzet.droplevel('Brand_Utama')), weekly(store_omzet)
+    share = (brand_weekly.reindex(store_weekly.index, fill_value=0) / store_weekly.where(store_weekly > 0) * 100)
+    return share.rename_axis(['Minggu', 'Toko']).unstack('Toko').fillna(0.0)
+
+# ================================
+# RINGKASAN ANALITIK (DASHBOARD & BATCH)
+# ================================
+def store_period_summary(main_store_df, period):
+    """Omzet & unit terjual satu toko per nilai kolom `period` dari snapshot terakhir tiap (periode, produk), plus
+    'Pertumbuhan Omzet' terhadap periode sebelumnya (rasio)."""
+    latest_period = latest_snapshot(main_store_df, [period, 'Nama Produk'])
+    summary = latest_period.groupby(period).agg(
+        Omzet=('Omzet', 'sum'), Penjualan_Unit=('Terjual per Bulan', 'sum')
+    ).reset_index().sort_values(period)
+    summary['Pertumbuhan Omzet'] = summary['Omzet'].pct_change()
+    return summary
+
+def weekly_store_summary(main_store_df):
+    """Omzet & unit terjual mingguan satu toko dari snapshot terakhir tiap (Minggu, produk), plus pertumbuhan omzet WoW (rasio).
+    Bisa diberi baris harian atau snapshot mingguan toko itu (`main_weekly`); hasilnya sama."""
+    return store_period_summary(main_store_df, 'Minggu').rename(columns={'Pertumbuhan Omzet': 'Pertumbuhan Omzet (WoW)'})
+
+def weekly_omzet_by_store(latest_weekly):
+    """Total omzet per (Minggu, Toko) dari snapshot mingguan."""
+    return latest_weekly.groupby(['Minggu', 'Toko'], observed=True)['Omzet'].sum().reset_index()
+
+def stock_status_trends(df_filtered):
+    """Jumlah baris per (Minggu, Toko) untuk setiap nilai 'Status' (kolom), dari data rentang tanggal."""
+    return df_filtered.groupby(['Minggu', 'Toko', 'Status'], observed=True).size().unstack(fill_value=0).reset_index()
+
+def omzet_by_date(frame):
+    """Pivot total omzet toko (baris) x 'Tanggal' (kolom); 0 jika toko tidak punya data pada tanggal itu."""
+    return frame.pivot_table(index='Toko', columns='Tanggal', values='Omzet', aggfunc='sum', observed=True).fillna(0)
+
+def downsample_series(frame, x, y, by, max_points):
+    """Menurunkan jumlah titik grafik garis di server: setiap seri (kombinasi kolom `by`) yang punya lebih dari
+    `max_points` titik dibagi menjadi max_points // 2 ember berurutan menurut `x`, lalu dari tiap ember diambil titik
+    `y` terkecil dan terbesar (puncak & lembah tetap terlihat). Seri yang lebih pendek dikembalikan utuh; baris
+    dengan `y` kosong dibuang."""
+    ordered = frame.dropna(subset=[y]).sort_values(by + [x], kind='stable').reset_index(drop=True)
+    if ordered.empty: return ordered
+    groups = ordered.groupby(by, observed=True, sort=False)
+    position, size = groups.cumcount().to_numpy(), groups[y].transform('size').to_numpy()
+    if size.max() <= max_points: return ordered
+    bucket = np.where(size > max_points, position * max(max_points // 2, 1) // size, position)
+    buckets = ordered.groupby([ordered[col] for col in by] + [pd.Series(bucket, name='_ember')], observed=True, sort=False)[y]
+    keep = np.union1d(buckets.idxmin().to_numpy(), buckets.idxmax().to_numpy())
+    return ordered.iloc[keep].reset_index(drop=True)
+
+def competitor_brand_summary(competitor_latest):
+    """Omzet & unit terjual per (Toko, Brand) dari snapshot terakhir kompetitor, diurutkan omzet menurun per toko."""
+    summary = competitor_latest.groupby(['Toko', 'Brand'], observed=True).agg(
+        Total_Omzet=('Omzet', 'sum'),
+        Total_Unit_Terjual=('Terjual per Bulan', 'sum')
+    ).reset_index()
+    return summary.sort_values(['Toko', 'Total_Omzet'], ascending=[True, False], kind='stable').reset_index(drop=True)
+
+# ================================
+# INDEKS HPP (SKU TERNORMALISASI + PENCOCOKAN FUZZY)
+# ================================
+# SKU produk sendiri dicocokkan ke sheet DATABASE bertahap: SKU persis, SKU ternormalisasi (huruf besar, tanpa
+# spasi/tanda baca), lalu fuzzy (rasio Levenshtein) hanya untuk SKU yang masih belum cocok. Kandidat fuzzy dibatasi
+# ke SKU DATABASE dengan prefiks atau akhiran ternormalisasi yang sama (akhiran menangkap SKU yang diberi awalan toko),
+# dipersempit ke Brand_Utama yang sama. Pencocokan satu-ke-satu: SKU DATABASE yang sudah dipakai (persis maupun fuzzy)
+# tidak dicalonkan lagi. Kandidat yang hanya berbeda di angka akhir (varian produk, LGT9001 vs LGT9000) diberi penalti.
+# Usulan fuzzy hanya ikut menghitung margin jika diminta (`hpp_comparison(use_fuzzy=True)`). Indeks & hasil pencocokan
+# di-cache per versi data (`get_hpp_matches`); ambang skor hanya memfilter ulang hasil itu.
+HPP_MATCH_EXACT, HPP_MATCH_NORMALIZED, HPP_MATCH_FUZZY = "SKU", "SKU Ternormalisasi", "Fuzzy"
+HPP_FUZZY_MIN_SCORE = 0.85  # Skor minimum usulan fuzzy yang dipakai untuk menghitung margin
+HPP_FUZZY_FLOOR = 0.6       # Usulan di bawah skor ini dibuang
+HPP_BLOCK_LEN = 3           # Panjang prefiks/akhiran SKU ternormalisasi untuk blok kandidat
+HPP_NAME_CANDIDATES = 5     # Kandidat SKU terbaik per produk yang ikut dibandingkan nama produknya
+HPP_VARIANT_PENALTY = 0.5   # Pengali skor untuk kandidat yang hanya berbeda di angka akhir SKU (varian lain)
+HPP_NAME_COLUMNS = ('NAMA', 'NAMA PRODUK', 'Nama Produk', 'NAMA BARANG')
+_SKU_NOISE = re.compile(r'[^0-9A-Z]')
+_SKU_TAIL = re.compile(r'^(.*?)0*(\d+)$')
+
+def normalize_sku(values):
+    """SKU huruf besar tanpa spasi & tanda baca ('sku-0001 ' -> 'SKU0001'); kosong -> NaN."""
+    return on_uniques(values, lambda uniques: uniques.astype(str).str.upper().str.replace(_SKU_NOISE, '', regex=True).replace('', np.nan))
+
+def _normalize_hpp_name(values):
+    return on_uniques(values, lambda uniques: uniques.astype(str).str.upper().str.findall(_BRAND_WORD).str.join(' '))
+
+def _split_sku_tail(values):
+    """(stem, angka akhir tanpa nol di depan) per SKU ternormalisasi ('LGT9001' -> ('LGT', '9001')); tanpa angka akhir -> NaN."""
+    parts = pd.Series(np.asarray(values, dtype=object)).str.extract(_SKU_TAIL)
+    return parts[0].to_numpy(object), parts[1].to_numpy(object)
+
+def _block_codes(keys):
+    """({kunci: kode}, kode per baris) untuk kunci blok kandidat; NaN -> -1."""
+    codes, uniques = pd.factorize(pd.Series(np.asarray(keys, dtype=object)))
+    return dict(zip(uniques, range(len(uniques)))), codes.astype(np.int32)
+
+def build_hpp_index(database_df, brands=()):
+    """Indeks HPP dari sheet DATABASE: satu baris per SKU (baris pertama yang punya HPP), dengan SKU ternormalisasi,
+    nama ternormalisasi (jika ada kolom nama), dan Brand_Utama hasil pemindaian nama terhadap `brands`.
+
+    HPP memakai 'HPP (LATEST)', atau 'HPP (AVERAGE)' jika kosong.
+    """
+    hpp = pd.Series(np.nan, index=database_df.index)
+    for col in ('HPP (LATEST)', 'HPP (AVERAGE)'):
+        if col in database_df.columns: hpp = hpp.fillna(pd.to_numeric(database_df[col], errors='coerce'))
+    name_col = next((col for col in HPP_NAME_COLUMNS if col in database_df.columns), None)
+    table = pd.DataFrame({'SKU': database_df['SKU'].astype(str).str.strip(), 'HPP': hpp,
+                          'Nama': database_df[name_col].astype(str) if name_col else np.nan})
+    table = table[(table['SKU'] != '') & table['HPP'].notna()].drop_duplicates(subset=['SKU'], keep='first').reset_index(drop=True)
+    table['SKU Norm'] = normalize_sku(table['SKU'])
+    if name_col:
+        table['Nama Norm'] = _normalize_hpp_name(table['Nama'])
+        brands = [brand for brand in brands if isinstance(brand, str) and brand]
+        resolver = BrandResolver({brand: brand for brand in brands}) if brands else None
+        table['Brand_Utama'] = on_uniques(table['Nama'], resolver.scan_names) if resolver else np.nan
+    else:
+        table['Nama Norm'] = table['Brand_Utama'] = np.nan
+    # SKU ternormalisasi yang bentrok: baris pertama yang menang, sama seperti SKU persis
+    first_norm = ~table['SKU Norm'].duplicated() & table['SKU Norm'].notna()
+    return {
+        'table': table,
+        'by_sku': dict(zip(table['SKU'], table.index)),
+        'by_norm': dict(zip(table.loc[first_norm, 'SKU Norm'], table.index[first_norm])),
+        'lengths': table['SKU Norm'].str.len().fillna(0).to_numpy(np.int64),
+        'prefixes': _block_codes(table['SKU Norm'].str[:HPP_BLOCK_LEN]),
+        'suffixes': _block_codes(table['SKU Norm'].str[-HPP_BLOCK_LEN:]),
+        'tails': _split_sku_tail(table['SKU Norm']),
+        'brand_blocks': dict(table.groupby('Brand_Utama', sort=False).indices)
+                        if table['Brand_Utama'].notna().any() else {},
+        'has_names': name_col is not None,
+    }
+
+def _fuzzy_sku_matches(queries, index, taken):
+    """Pencocokan fuzzy untuk SKU unik yang belum cocok. `queries` = DataFrame ['SKU Norm', 'Brand_Utama', 'Nama Norm'];
+    `taken` = bool per baris indeks yang sudah dipakai pencocokan persis. Mengembalikan (posisi, skor) per query
+    (posisi -1 jika tidak ada kandidat di atas HPP_FUZZY_FLOOR).
+
+    Skor = rasio Levenshtein SKU ternormalisasi; jika DATABASE punya kolom nama, rata-rata dengan rasio nama produk
+    untuk HPP_NAME_CANDIDATES kandidat SKU terbaik. Kandidat dengan stem sama tetapi angka akhir berbeda dikali
+    HPP_VARIANT_PENALTY. Query dikelompokkan per (prefiks, akhiran, brand) sehingga blok kandidat hanya dibentuk sekali
+    per kelompok; tanpa prefiks/akhiran yang sama, seluruh blok brand yang dicalonkan.
+
+    Pasangan (query, kandidat) lalu dipilih dari skor tertinggi: setiap baris DATABASE dipakai paling banyak sekali,
+    sehingga hasilnya tidak bergantung pada urutan query.
+    """
+    positions, scores = np.full(len(queries), -1, dtype=np.int64), np.zeros(len(queries))
+    table, (prefixes, prefix_codes), (suffixes, suffix_codes) = index['table'], index['prefixes'], index['suffixes']
+    skus, names, lengths = table['SKU Norm'].to_numpy(object), table['Nama Norm'].to_numpy(object), index['lengths']
+    stems, tails = index['tails']
+    everything = np.arange(len(table))
+    groups = queries.assign(prefix=queries['SKU Norm'].str[:HPP_BLOCK_LEN], suffix=queries['SKU Norm'].str[-HPP_BLOCK_LEN:])
+    groups['stem'], groups['tail'] = _split_sku_tail(groups['SKU Norm'])
+    pairs = []  # (skor, query, posisi DATABASE)
+    for (prefix, suffix, brand), group in groups.reset_index(drop=True).groupby(['prefix', 'suffix', 'Brand_Utama'], dropna=False, sort=False):
+        brand_block = index['brand_blocks'].get(brand) if isinstance(brand, str) else None
+        pool = everything if brand_block is None else brand_block
+        candidates = pool[(prefix_codes[pool] == prefixes.get(prefix, -2)) | (suffix_codes[pool] == suffixes.get(suffix, -2))]
+        if not len(candidates) and brand_block is not None: candidates = brand_block
+        candidates = candidates[~taken[candidates]]
+        if not len(candidates): continue
+        for row, sku, name, stem, tail in zip(group.index, group['SKU Norm'], group['Nama Norm'], group['stem'], group['tail']):
+            # Rasio Levenshtein <= 2*min(len)/(jumlah len): kandidat yang panjangnya terlalu jauh tidak mungkin lolos
+            reachable = candidates[2 * np.minimum(lengths[candidates], len(sku)) >= HPP_FUZZY_FLOOR * (lengths[candidates] + len(sku))]
+            if not len(reachable): continue
+            penalty = np.ones(len(reachable))
+            if isinstance(tail, str):
+                penalty[(stems[reachable] == stem) & (tails[reachable] != tail) & pd.notna(tails[reachable])] = HPP_VARIANT_PENALTY
+            sku_scores = np.fromiter(map(Levenshtein.ratio, itertools.repeat(sku, len(reachable)), skus[reachable]), float, len(reachable))
+            top = np.argsort(-sku_scores * penalty, kind='stable')[:HPP_NAME_CANDIDATES]
+            top_scores = sku_scores[top]
+            if index['has_names'] and isinstance(name, str):
+                top_scores = (top_scores + np.array([Levenshtein.ratio(name, names[pos]) for pos in reachable[top]])) / 2
+            top_scores = top_scores * penalty[top]
+            keep = top_scores >= HPP_FUZZY_FLOOR
+            pairs.extend(zip(top_scores[keep], itertools.repeat(row), reachable[top][keep]))
+    taken = taken.copy()
+    for score, row, pos in sorted(pairs, key=lambda pair: (-pair[0], pair[1], pair[2])):
+        if positions[row] >= 0 or taken[pos]: continue
+        positions[row], scores[row], taken[pos] = pos, round(float(score), 4), True
+    return positions, scores
+
+def reconcile_hpp(main_latest, index):
+    """Pencocokan HPP per produk (indeks sama dengan `main_latest`): 'SKU HPP' (SKU di DATABASE), 'HPP',
+    'Pencocokan HPP' (HPP_MATCH_EXACT / HPP_MATCH_NORMALIZED / HPP_MATCH_FUZZY, NaN jika tidak ada), 'Skor HPP'
+    (1.0 untuk pencocokan persis)."""
+    sku = main_latest['SKU'] if 'SKU' in main_latest.columns else pd.Series(np.nan, index=main_latest.index)
+    norm = normalize_sku(sku)
+    exact = on_uniques(sku, lambda uniques: uniques.astype(str).str.strip().map(index['by_sku']))
+    normalized = norm.map(index['by_norm'])
+    position = exact.astype(float).fillna(normalized.astype(float))
+    method = pd.Series(np.where(exact.notna(), HPP_MATCH_EXACT, np.where(normalized.notna(), HPP_MATCH_NORMALIZED, None)), index=main_latest.index, dtype=object)
+    score = position.notna().astype(float).where(position.notna())
+    unmatched = position.isna() & norm.notna()
+    if Levenshtein is not None and unmatched.any() and len(index['table']):
+        taken = np.zeros(len(index['table']), dtype=bool)
+        taken[position.dropna().to_numpy(np.int64)] = True
+        queries = pd.DataFrame({'SKU Norm': norm[unmatched], 'Brand_Utama': main_latest.loc[unmatched, 'Brand_Utama'].astype(object),
+                                'Nama Norm': _normalize_hpp_name(main_latest.loc[unmatched, 'Nama Produk'])})
+        queries = queries.drop_duplicates(subset=['SKU Norm'])
+        fuzzy_pos, fuzzy_score = _fuzzy_sku_matches(queries, index, taken)
+        found = fuzzy_pos >= 0
+        by_norm = dict(zip(queries['SKU Norm'].to_numpy()[found], zip(fuzzy_pos[found], fuzzy_score[found])))
+        fuzzy = norm[unmatched].map(by_norm).dropna()
+        position.loc[fuzzy.index] = [pos for pos, _ in fuzzy]
+        score.loc[fuzzy.index] = [value for _, value in fuzzy]
+        method.loc[fuzzy.index] = HPP_MATCH_FUZZY
+    table, matched = index['table'], position.notna()
+    rows = position[matched].to_numpy(np.int64)
+    result = pd.DataFrame({'SKU HPP': np.nan, 'Nama HPP': np.nan, 'HPP': np.nan}, index=main_latest.index).astype({'SKU HPP': object, 'Nama HPP': object})
+    result.loc[matched, 'SKU HPP'] = table['SKU'].to_numpy(object)[rows]
+    result.loc[matched, 'Nama HPP'] = table['Nama'].to_numpy(object)[rows]
+    result.loc[matched, 'HPP'] = table['HPP'].to_numpy(float)[rows]
+    result['Pencocokan HPP'], result['Skor HPP'] = method, score
+    return result
+
+@tracked_cache(st.cache_resource(max_entries=2, show_spinner="Mencocokkan SKU dengan DATABASE HPP..."))
+def get_hpp_matches(data_version, _main_latest, _database_df):
+    """Indeks HPP (`build_hpp_index`) dan pencocokan SKU produk sendiri (`reconcile_hpp`), sekali per versi data."""
+    index = build_hpp_index(_database_df, _main_latest['Brand_Utama'].unique())
+    return {'index': index, 'matches': reconcile_hpp(_main_latest, index)}
+
+def hpp_comparison(main_latest, database_df, min_score=HPP_FUZZY_MIN_SCORE, matches=None, use_fuzzy=False):
+    """Membandingkan harga jual produk sendiri dengan HPP (sheet DATABASE, dicocokkan lewat SKU, lihat `reconcile_hpp`).
+
+    Usulan fuzzy hanya berupa usulan: HPP-nya tidak dipakai untuk rugi/untung kecuali `use_fuzzy=True`, dan itu pun
+    hanya yang skornya >= `min_score`. `matches` = hasil `reconcile_hpp` yang sudah dihitung (mis. dari
+    `get_hpp_matches`); tanpa itu indeks dibangun ulang. Mengembalikan {'rugi', 'untung', 'tidak_ditemukan', 'usulan'};
+    'usulan' berisi semua pencocokan fuzzy (dengan HPP usulannya), diurutkan skor menurun.
+    """
+    if matches is None: matches = reconcile_hpp(main_latest, build_hpp_index(database_df, main_latest['Brand_Utama'].unique()))
+    merged_df = pd.concat([main_latest.drop(columns=[col for col in matches.columns if col in main_latest.columns]), matches], axis=1)
+    merged_df = merged_df.reset_index(drop=True)
+    fuzzy = merged_df[merged_df['Pencocokan HPP'] == HPP_MATCH_FUZZY]
+    accepted = merged_df['Pencocokan HPP'].isin([HPP_MATCH_EXACT, HPP_MATCH_NORMALIZED])
+    if use_fuzzy: accepted |= (merged_df['Pencocokan HPP'] == HPP_MATCH_FUZZY) & (merged_df['Skor HPP'] >= min_score)
+    merged_df['HPP'] = merged_df['HPP'].where(accepted)
+    merged_df['Selisih'] = merged_df['Harga'] - merged_df['HPP']
+    return {
+        'rugi': merged_df[merged_df['Selisih'] < 0],
+        'untung': merged_df[merged_df['Selisih'] >= 0],
+        'tidak_ditemukan': merged_df[merged_df['HPP'].isnull()],
+        'usulan': fuzzy.sort_values('Skor HPP', ascending=False, kind='stable'),
+    }
+
+# ================================
+# VIEW PRA-HITUNG (PIPELINE BATCH)
+# ================================
+# `run_batch` (lihat batch.py) menghitung semua view untuk satu versi data dan menyimpannya sebagai Feather di
+# <PRECOMPUTED_DIR>/<versi>/. Dashboard memakai view ini langsung bila versi datanya sama (mis. snapshot yang
+# ditulis batch yang sama), dan menghitung sendiri bila belum ada.
+PRECOMPUTED_KEEP_VERSIONS = 3
+PRECOMPUTED_MATCH_PARAMS = (1, True)  # (top_k, block_by_brand) pencocokan katalog yang dihitung batch
+
+def _precomputed_dir():
+    return PRECOMPUTED_DIR or os.path.join(SNAPSHOT_DIR, 'views')
+
+@st.cache_resource(max_entries=2)
+def load_precomputed_views(data_version, my_store_name=None):
+    """View pra-hitung untuk versi data ini ({nama: DataFrame}), atau {} jika belum ada / dibuat untuk toko lain."""
+    if feather is None: return {}
+    version_dir = os.path.join(_precomputed_dir(), data_version)
+    try:
+        with open(os.path.join(version_dir, 'manifest.json'), encoding='utf-8') as f: manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if my_store_name is not None and manifest.get('my_store_name') != my_store_name: return {}
+    try:
+        return {name: feather.read_table(os.path.join(version_dir, f"{name}.feather"), memory_map=True).to_pandas()
+                for name in manifest['views']}
+    except Exception:
+        return {}
+
+def compute_precomputed_views(data_version, rekap_df, database_df, my_store_name, stages=None, match=True, history=None):
+    """Semua view analitik untuk rentang tanggal penuh: snapshot terakhir, ringkasan mingguan, tabel brand kompetitor,
+    kubus brand, daftar HPP, dan (opsional) pencocokan seluruh katalog. `history` = riwayat ringkas (lihat `apply_retention`)."""
+    views = {}
+    with timed(stages, 'batch.base_views', len(rekap_df)):
+        base = get_base_views(data_version, rekap_df, my_store_name, history)
+        views['latest'] = base['latest']
+        views['minggu'] = pd.DataFrame({'Minggu': base['minggu'].to_numpy()})
+    with timed(stages, 'batch.weekly', len(rekap_df)):
+        ranged = get_range_views(data_version, base['min_date'], base['max_date'], rekap_df, my_store_name, history)
+        views['latest_weekly'] = ranged['latest_weekly']
+        views['weekly_summary'] = weekly_store_summary(ranged['main_weekly'])
+        views['weekly_omzet'] = weekly_omzet_by_store(ranged['latest_weekly'])
+    with timed(stages, 'batch.competitor_brands', len(base['competitor_latest'])):
+        views['competitor_brands'] = competitor_brand_summary(base['competitor_latest'])
+    with timed(stages, 'batch.brand_cube', len(rekap_df)):
+        views['brand_cube'] = get_brand_cube(data_version, rekap_df)['cube'].reset_index()
+    if not database_df.empty and 'SKU' in database_df.columns:
+        with timed(stages, 'batch.hpp', len(base['main_latest'])):
+            matches = get_hpp_matches(data_version, base['main_latest'], database_df)['matches']
+            for name, frame in hpp_comparison(base['main_latest'], database_df, matches=matches).items(): views[f"hpp_{name}"] = frame
+    if match and not base['competitor_latest'].empty and not base['main_latest'].empty:
+        with timed(stages, 'batch.match', len(base['main_latest'])):
+            index = build_competitor_index(data_version, base['competitor_latest'])
+            top_k, block_by_brand = PRECOMPUTED_MATCH_PARAMS
+            views['bulk_match'] = bulk_match_catalog(base['main_latest'], index, top_k=top_k, block_by_brand=block_by_brand)
+    return views
+
+def save_precomputed_views(data_version, my_store_name, views, **meta):
+    """Menulis view ke <PRECOMPUTED_DIR>/<versi>/ lewat folder sementara yang di-rename (pembaca tidak melihat hasil setengah jadi).
+    Hanya `PRECOMPUTED_KEEP_VERSIONS` versi terbaru yang disimpan."""
+    if feather is None: raise RuntimeError("pyarrow belum terpasang; view pra-hitung tidak bisa disimpan.")
+    base_dir = _precomputed_dir()
+    version_dir = os.path.join(base_dir, data_version)
+    tmp_dir = f"{version_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, frame in views.items():
+        feather.write_feather(frame, os.path.join(tmp_dir, f"{name}.feather"), compression='uncompressed')
+    manifest = {'version': data_version, 'my_store_name': my_store_name, 'code_version': CODE_VERSION,
+                'created_at': datetime.now().isoformat(timespec='seconds'), 'views': {name: len(frame) for name, frame in views.items()}, **meta}
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f: json.dump(manifest, f, default=str)
+    shutil.rmtree(version_dir, ignore_errors=True)
+    os.replace(tmp_dir, version_dir)
+    versions = sorted((entry for entry in os.scandir(base_dir) if entry.is_dir() and '.tmp' not in entry.name),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[PRECOMPUTED_KEEP_VERSIONS:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    load_precomputed_views.clear()
+    return manifest
+
+def run_batch(source, my_store_name, force_full=False, match=True, write_back=False):
+    """Pipeline lengkap tanpa UI: sinkronisasi data (+ snapshot disk), hitung semua view, simpan ke disk, catat waktu.
+    Dengan `write_back=True`, view di WRITEBACK_VIEWS juga ditulis ke worksheet output sumber (lihat `write_views`).
+
+    Mengembalikan fetch_report; `fetch_report['error']` terisi jika gagal, `fetch_report['manifest']` jika berhasil,
+    dan `fetch_report['writeback']` berisi laporan tulis balik.
+    """
+    started = time.perf_counter()
+    rekap_df, database_df, fetch_report = load_all_data(source, force_full=force_full)
+    if rekap_df is not None:
+        stages, version = fetch_report['stages'], fetch_report['data_version']
+        views = compute_precomputed_views(version, rekap_df, database_df, my_store_name, stages, match=match,
+                                          history=fetch_report['history'])
+        with timed(stages, 'batch.save', sum(len(frame) for frame in views.values())):
+            fetch_report['manifest'] = save_precomputed_views(version, my_store_name, views, rows=len(rekap_df))
+        if write_back:
+            frames = {title: views[name] for name, title in WRITEBACK_VIEWS.items() if name in views}
+            fetch_report['writeback'] = write_views(open_spreadsheet(source), source, frames)
+    log_timings('batch', fetch_report['stages'], data_version=fetch_report.get('data_version'), force_full=force_full,
+                seconds=round(time.perf_counter() - started, 4), rows=0 if rekap_df is None else len(rekap_df),
+                failed=list(fetch_report['failed']), error=fetch_report['error'])
+    return fetch_report
+
+# ================================
+# EKSPOR BERKAS UNDUHAN (CSV / CSV.GZ / PARQUET)
+# ================================
+# Berkas unduhan dibuat hanya saat diminta, per potongan EXPORT_CHUNK_ROWS baris langsung ke file sementara di disk,
+# lalu disimpan di <SNAPSHOT_DIR>/exports/<versi data>/. Kunci cache = (versi data, nama ekspor yang memuat parameter
+# view seperti rentang tanggal, format), jadi DataFrame tidak perlu di-hash dan tidak pernah dibangun utuh sebagai teks.
+EXPORT_FORMATS = {  # format -> (label, ekstensi, MIME)
+    'csv': ("CSV", '.csv', 'text/csv'),
+    'csv.gz': ("CSV terkompresi (gzip)", '.csv.gz', 'application/gzip'),
+    'parquet': ("Parquet", '.parquet', 'application/vnd.apache.parquet'),
+}
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_KEEP_VERSIONS = 2
+
+def write_export(frame, fmt, fileobj, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Menulis DataFrame ke file biner yang sudah terbuka, per potongan `chunk_rows` baris."""
+    chunks = range(0, max(len(frame), 1), chunk_rows)
+    if fmt == 'parquet':
+        if pq is None: raise RuntimeError("pyarrow belum terpasang; ekspor Parquet tidak tersedia.")
+        schema = pa.Schema.from_pandas(frame, preserve_index=False)
+        with pq.ParquetWriter(fileobj, schema, compression='zstd') as writer:
+            for start in chunks:
+                writer.write_table(pa.Table.from_pandas(frame.iloc[start:start + chunk_rows], schema=schema, preserve_index=False))
+        return
+    stream = gzip.GzipFile(fileobj=fileobj, mode='wb', mtime=0) if fmt == 'csv.gz' else fileobj
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    for start in chunks:
+        frame.iloc[start:start + chunk_rows].to_csv(text, header=start == 0, index=False)
+    text.flush()
+    text.detach()
+    if stream is not fileobj: stream.close()
+
+def export_path(data_version, name, fmt, build):
+    """Path berkas ekspor `name` dalam format `fmt` untuk versi data ini. `build()` (-> DataFrame) hanya dipanggil jika
+    berkasnya belum ada; `name` harus memuat semua parameter view (rentang tanggal, filter) agar kuncinya unik."""
+    base_dir = os.path.join(SNAPSHOT_DIR, 'exports')
+    version_dir = os.path.join(base_dir, data_version)
+    path = os.path.join(version_dir, re.sub(r'[^\w.-]', '_', name) + EXPORT_FORMATS[fmt][1])
+    exists = os.path.exists(path)
+    count_cache('export_path', 'hit' if exists else 'miss')  # Tampil di tabel cache panel admin seperti cache st.*
+    if exists: return path
+    os.makedirs(version_dir, exist_ok=True)
+    stages = {}
+    with timed(stages, 'export.build'):
+        frame = build()
+    tmp_path = f"{path}.tmp{os.getpid()}_{threading.get_ident()}"
+    try:
+        with timed(stages, f"export.{fmt}", len(frame)), open(tmp_path, 'wb') as f:
+            write_export(frame, fmt, f)
+        os.replace(tmp_path, path)  # Tombol yang sama bisa diklik di beberapa sesi sekaligus
+    finally:
+        with contextlib.suppress(OSError): os.remove(tmp_path)
+    versions = sorted((entry for entry in os.scandir(base_dir) if entry.is_dir()), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[EXPORT_KEEP_VERSIONS:]:
+        if entry.name != data_version: shutil.rmtree(entry.path, ignore_errors=True)
+    log_timings('export', stages, data_version=data_version, name=name, format=fmt, rows=len(frame), bytes=os.path.getsize(path))
+    return path
+
+# ================================
+# TULIS BALIK HASIL KE GOOGLE SHEETS (DIFF + BATCH)
+# ================================
+# View hasil hitungan ditulis ke worksheet output khusus. Setiap sel di-hash; hash tulisan terakhir disimpan per
+# sheet (<snapshot>/writeback/*.npy), sehingga penulisan berikutnya hanya mengirim sel yang berubah. Sel berubah
+# dikelompokkan menjadi blok persegi (baris berurutan dengan rentang kolom yang sama), dipotong agar tiap
+# panggilan values_batch_update membawa paling banyak WRITEBACK_MAX_CELLS_PER_CALL sel, dan dikirim dengan backoff
+# yang sama seperti pengambilan data. Tanpa state lokal (atau `force=True`) isi sheet dibaca sekali sebagai acuan.
+WRITEBACK_VIEWS = {  # nama view (lihat compute_precomputed_views) -> judul worksheet output
+    'weekly_summary': "OUTPUT - Ringkasan Mingguan",
+    'weekly_omzet': "OUTPUT - Omzet Mingguan per Toko",
+    'competitor_brands': "OUTPUT - Brand Kompetitor",
+    'hpp_rugi': "OUTPUT - HPP Rugi",
+    'hpp_tidak_ditemukan': "OUTPUT - HPP Tidak Ditemukan",
+    'bulk_match': "OUTPUT - Pencocokan Katalog",
+}
+WRITEBACK_MAX_CELLS_PER_CALL = 40_000
+WRITEBACK_MAX_RANGES_PER_CALL = 500
+_EMPTY_CELL_HASH = pd.util.hash_array(np.array([''], dtype=object))[0]
+
+def new_writeback_report():
+    return {'api_calls': 0, 'retried': {}, 'failed': {}, 'sheets': {}, 'stages': {}, 'duration': 0.0}
+
+def _cell_value(value):
+    """Nilai sel untuk valueInputOption RAW: angka tetap angka (bulat -> int), tanggal -> teks ISO, kosong -> ''."""
+    if value is None or value is pd.NA or value is pd.NaT: return ''
+    if isinstance(value, (bool, np.bool_)): return bool(value)
+    if isinstance(value, (int, np.integer)): return int(value)
+    if isinstance(value, (float, np.floating)):
+        if not np.isfinite(value): return ''
+        return int(value) if float(value).is_integer() else float(value)
+    if isinstance(value, pd.Timestamp) or isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d') if value == pd.Timestamp(value).normalize() else value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date): return value.isoformat()
+    return str(value)
+
+def frame_to_cells(frame):
+    """Matriks objek (header + baris) berisi nilai sel siap kirim untuk sebuah DataFrame."""
+    cells = np.empty((len(frame) + 1, max(len(frame.columns), 1)), dtype=object)
+    cells[:] = ''
+    for j, col in enumerate(frame.columns):
+        cells[0, j] = str(col)
+        series = frame[col]
+        # Hanya int numpy; dtype ekstensi (Int64 nullable: kind juga 'i') lewat _cell_value agar pd.NA -> '', bukan NaN
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iu':
+            cells[1:, j] = series.to_numpy().tolist()
+        else:
+            cells[1:, j] = [_cell_value(value) for value in series.astype(object).tolist()]
+    return cells
+
+def rows_to_cells(rows):
+    cells = np.empty((len(rows), max((len(row) for row in rows), default=0)), dtype=object)
+    cells[:] = ''
+    for i, row in enumerate(rows): cells[i, :len(row)] = row
+    return cells
+
+def cell_hashes(cells):
+    """Hash uint64 per sel dari representasi teksnya (angka 5 dan teks '5' dianggap sama, seperti nilai yang dibaca ulang)."""
+    if cells.size == 0: return np.zeros(cells.shape, dtype=np.uint64)
+    return pd.util.hash_array(pd.Series(cells.ravel()).astype(str).to_numpy(dtype=object)).reshape(cells.shape)
+
+def _fit_hashes(hashes, shape):
+    fitted = np.full(shape, _EMPTY_CELL_HASH, dtype=np.uint64)
+    rows, cols = min(shape[0], hashes.shape[0]), min(shape[1], hashes.shape[1])
+    fitted[:rows, :cols] = hashes[:rows, :cols]
+    return fitted
+
+def diff_blocks(old_hashes, new_hashes):
+    """Blok (baris_awal, baris_akhir, kolom_awal, kolom_akhir), inklusif dan 0-based, yang mencakup semua sel berubah.
+    Per baris diambil rentang kolom dari sel berubah pertama sampai terakhir; baris berurutan dengan rentang yang
+    sama digabung menjadi satu blok."""
+    changed = _fit_hashes(old_hashes, new_hashes.shape) != new_hashes
+    rows = np.flatnonzero(changed.any(axis=1))
+    if not len(rows): return []
+    first = changed[rows].argmax(axis=1)
+    last = changed.shape[1] - 1 - changed[rows, ::-1].argmax(axis=1)
+    starts = np.ones(len(rows), dtype=bool)
+    starts[1:] = (np.diff(rows) != 1) | (first[1:] != first[:-1]) | (last[1:] != last[:-1])
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.append(start_idx[1:], len(rows)) - 1
+    return [(int(rows[s]), int(rows[e]), int(first[s]), int(last[s])) for s, e in zip(start_idx, end_idx)]
+
+def pack_write_calls(blocks, max_cells=WRITEBACK_MAX_CELLS_PER_CALL, max_ranges=WRITEBACK_MAX_RANGES_PER_CALL):
+    """Membagi blok menjadi potongan <= max_cells sel, lalu mengelompokkannya per panggilan API (list of list blok)."""
+    calls, current, current_cells = [], [], 0
+    for row_start, row_end, col_start, col_end in blocks:
+        width = col_end - col_start + 1
+        step = max(1, max_cells // width)
+        for start in range(row_start, row_end + 1, step):
+            piece = (start, min(row_end, start + step - 1), col_start, col_end)
+            cells = (piece[1] - piece[0] + 1) * width
+            if current and (current_cells + cells > max_cells or len(current) >= max_ranges):
+                calls.append(current)
+                current, current_cells = [], 0
+            current.append(piece)
+            current_cells += cells
+    if current: calls.append(current)
+    return calls
+
+def _writeback_state_path(spreadsheet_key, title):
+    safe = re.sub(r'[^\w.-]', '_', title)
+    return os.path.join(_snapshot_dir(spreadsheet_key), 'writeback', f"{safe}_{hashlib.sha1(title.encode('utf-8')).hexdigest()[:8]}.npy")
+
+def _load_writeback_state(spreadsheet_key, title):
+    try:
+        return np.load(_writeback_state_path(spreadsheet_key, title), allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+
+def _save_writeback_state(spreadsheet_key, title, hashes):
+    path = _writeback_state_path(spreadsheet_key, title)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, hashes)
+    os.replace(tmp_path, path)
+
+def _write_view(spreadsheet, spreadsheet_key, title, frame, worksheet, force, report):
+    stages = report['stages']
+    with timed(stages, 'writeback.diff', len(frame)):
+        cells = frame_to_cells(frame)
+        new_hashes = cell_hashes(cells)
+        old_hashes = None if force else _load_writeback_state(spreadsheet_key, title)
+    rows, cols = cells.shape
+    if worksheet is None:
+        worksheet = _with_backoff(lambda: spreadsheet.add_worksheet(title, rows=rows, cols=cols), [title], report)
+        old_hashes, mode = np.zeros((0, 0), dtype=np.uint64), 'sheet baru'
+    elif old_hashes is None:
+        response = _with_backoff(lambda: spreadsheet.values_get(_a1_sheet(title), params={'valueRenderOption': 'UNFORMATTED_VALUE'}), [title], report)
+        old_hashes, mode = cell_hashes(rows_to_cells(response.get('values', []))), 'baca acuan'
+    else:
+        mode = 'diff'
+    if (worksheet.row_count, worksheet.col_count) != (rows, cols):
+        _with_backoff(lambda: worksheet.resize(rows=rows, cols=cols), [title], report)  # Sel di luar tabel ikut terhapus
+
+    with timed(stages, 'writeback.diff'):
+        blocks = diff_blocks(old_hashes, new_hashes)
+        calls = pack_write_calls(blocks)
+    sent = sum((b[1] - b[0] + 1) * (b[3] - b[2] + 1) for b in blocks)
+    with timed(stages, 'writeback.send', sent):
+        for call in calls:
+            body = {'valueInputOption': 'RAW', 'data': [
+                {'range': f"{_a1_sheet(title)}!{gspread.utils.rowcol_to_a1(r0 + 1, c0 + 1)}:{gspread.utils.rowcol_to_a1(r1 + 1, c1 + 1)}",
+                 'values': cells[r0:r1 + 1, c0:c1 + 1].tolist()} for r0, r1, c0, c1 in call]}
+            _with_backoff(lambda: spreadsheet.values_batch_update(body), [title], report)
+    _save_writeback_state(spreadsheet_key, title, new_hashes)
+    changed = int((_fit_hashes(old_hashes, new_hashes.shape) != new_hashes).sum())
+    return {'Mode': mode, 'Baris': rows, 'Kolom': cols, 'Sel Berubah': changed, 'Sel Dikirim': sent,
+            'Range': len(blocks), 'Panggilan Tulis': len(calls)}
+
+def write_views(spreadsheet, spreadsheet_key, frames, force=False, report=None):
+    """Menulis {judul worksheet: DataFrame} ke spreadsheet (objek berantarmuka gspread.Spreadsheet), hanya sel yang
+    berubah sejak penulisan terakhir. `spreadsheet_key` menjadi kunci state hash lokal; `force=True` mengabaikan
+    state itu dan membandingkan dengan isi sheet saat ini.
+
+    Mengembalikan laporan: 'sheets' (per sheet: mode, ukuran, sel berubah/dikirim, panggilan, detik), 'failed',
+    'api_calls', 'retried', dan 'stages'. Sheet yang gagal ditulis kehilangan state hash-nya (acuan dibaca ulang berikutnya).
+    """
+    report = report if report is not None else new_writeback_report()
+    started = time.perf_counter()
+    try:
+        existing = {ws.title: ws for ws in _with_backoff(spreadsheet.worksheets, ["(daftar sheet)"], report)}
+    except Exception as e:
+        report['failed'] = {title: f"{type(e).__name__}: {e}" for title in frames}
+        existing, frames = {}, {}
+    for title, frame in frames.items():
+        sheet_started, calls_before = time.perf_counter(), report['api_calls']
+        try:
+            entry = _write_view(spreadsheet, spreadsheet_key, title, frame, existing.get(title), force, report)
+        except Exception as e:
+            report['failed'][title] = f"{type(e).__name__}: {e}"
+            with contextlib.suppress(OSError): os.remove(_writeback_state_path(spreadsheet_key, title))
+            continue
+        entry.update({'Panggilan API': report['api_calls'] - calls_before, 'Detik': time.perf_counter() - sheet_started})
+        report['sheets'][title] = entry
+    report['duration'] = time.perf_counter() - started
+    log_timings('writeback', report['stages'], seconds=round(report['duration'], 4), api_calls=report['api_calls'],
+                sheets=report['sheets'], failed=report['failed'])
+    return report
@@ -5,134 +5,158 @@
 # ===================================================================================
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
 import plotly.express as px
-import re
-import gspread
-from datetime import datetime
-from gspread_dataframe import set_with_dataframe
+import os
+import time
+import threading
+from datetime import datetime, timedelta
 import numpy as np
 
-# Import library untuk TF-IDF
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from analytics import (
+    SPREADSHEET_KEY, MY_STORE_NAME, TIMING_LOG_PATH, CODE_VERSION, MATCH_ENGINES, WOW_CHANGE_TYPES, BRAND_TREND_WEEKS,
+    PRECOMPUTED_MATCH_PARAMS, SentenceTransformer, setting, timed, count_cache, log_timings, _metrics_store,
+    load_all_data, load_snapshot, compact_rekap, frame_memory_mb, build_competitor_index,
+    search_competitor_index, bulk_match_cached, build_embedding_index, search_embedding_index, benchmark_matching_engines,
+    get_base_views, get_range_views, week_over_week_diff, get_brand_cube, brand_day_summary, brand_share_trend,
+    weekly_store_summary, weekly_omzet_by_store, competitor_brand_summary, hpp_comparison, load_precomputed_views,
+    stock_status_trends, omzet_by_date, resolve_query_backend, open_query_store, query_stock_status_trends, query_omzet_by_date,
+    query_competitor_brand_summary, query_brand_day, query_brand_share_trend, WRITEBACK_VIEWS, open_spreadsheet, write_views,
+    EXPORT_FORMATS, export_path, Levenshtein, HPP_FUZZY_MIN_SCORE, get_hpp_matches, GRANULARITIES, PERIOD_COLUMNS, ROLLING_WINDOWS,
+    get_period_views, get_daily_omzet, downsample_series,
+)
 
 # ================================
 # KONFIGURASI HALAMAN & KONSTANTA
 # ================================
 st.set_page_config(layout="wide", page_title="Dashboard Analisis v7.0")
+if not SPREADSHEET_KEY or not MY_STORE_NAME:
+    st.error("Konfigurasi 'spreadsheet_key' dan 'my_store_name' wajib diisi di secrets.toml (atau DASHBOARD_SPREADSHEET_KEY / DASHBOARD_MY_STORE_NAME).")
+    st.stop()
 
-SPREADSHEET_KEY = st.secrets["spreadsheet_key"]
-MY_STORE_NAME = st.secrets["my_store_name"]
+REFRESH_INTERVAL_MINUTES = float(setting("refresh_interval_minutes", 30))  # 0 = hanya manual
+ADMIN_PANEL_ENABLED = str(setting("admin_panel", True)).lower() not in ("0", "false", "no")
 
 # ================================
-# FUNGSI KONEKSI GOOGLE SHEETS
+# DATASET BERSAMA PER PROSES
 # ================================
-@st.cache_resource(show_spinner="Menghubungkan ke Google Sheets...")
-def connect_to_gsheets():
-    creds_dict = {
-        "type": st.secrets["gcp_type"], "project_id": st.secrets["gcp_project_id"],
-        "private_key_id": st.secrets["gcp_private_key_id"], "private_key": st.secrets["gcp_private_key_raw"].replace('\\n', '\n'),
-        "client_email": st.secrets["gcp_client_email"], "client_id": st.secrets["gcp_client_id"],
-        "auth_uri": st.secrets["gcp_auth_uri"], "token_uri": st.secrets["gcp_token_uri"],
-        "auth_provider_x509_cert_url": st.secrets["gcp_auth_provider_x509_cert_url"],
-        "client_x509_cert_url": st.secrets["gcp_client_x509_cert_url"]
-    }
-    gc = gspread.service_account_from_dict(creds_dict)
-    return gc
-
-def _load_all_rekap_data(spreadsheet):
-    """Fungsi helper untuk membaca dan menggabungkan semua sheet REKAP."""
-    sheet_objs = [s for s in spreadsheet.worksheets() if "REKAP" in s.title.upper()]
-    rekap_list_df = []
-    for s in sheet_objs:
-        try:
-            all_values = s.get_all_values()
-            if not all_values or len(all_values) < 2: continue
-            header, data = all_values[0], all_values[1:]
-            df_sheet = pd.DataFrame(data, columns=header)
-            if '' in df_sheet.columns: df_sheet = df_sheet.drop(columns=[''])
-            store_name_match = re.match(r"^(.*?) - REKAP", s.title, re.IGNORECASE)
-            toko_name = store_name_match.group(1).strip() if store_name_match else "Toko Tak Dikenal"
-            df_sheet['Toko'] = toko_name
-            if 'Status' not in df_sheet.columns:
-                df_sheet['Status'] = 'Tersedia' if "READY" in s.title.upper() else 'Habis'
-            rekap_list_df.append(df_sheet)
-        except Exception as e:
-            st.warning(f"Gagal memproses sheet rekap '{s.title}': {e}")
-            continue
-    if not rekap_list_df:
-        return pd.DataFrame()
-    return pd.concat(rekap_list_df, ignore_index=True)
+SESSION_ACTIVE_SECONDS = 30 * 60  # Sesi dianggap aktif jika rerun terakhir dalam 30 menit
+
+@st.cache_resource
+def _dataset_store():
+    """Dataset aktif per proses ({spreadsheet_key: dataset}), dipakai bersama secara read-only oleh semua sesi."""
+    return {'lock': threading.Lock(), 'datasets': {}, 'sessions': {}}
+
+def get_dataset(spreadsheet_key):
+    return _dataset_store()['datasets'].get(spreadsheet_key)
+
+def publish_dataset(spreadsheet_key, rekap_df, database_df, data_version, source, fetch_report=None, snapshot_meta=None):
+    """Mengganti dataset aktif untuk semua sesi. Sesi hanya memegang referensi ke dataset ini, bukan salinan."""
+    store = _dataset_store()
+    rekap_df = compact_rekap(rekap_df)
+    # Riwayat ringkas (retensi) ikut dataset; meta snapshot tidak ikut memegangnya setelah versi berganti
+    history = (snapshot_meta or {}).pop('history', None) if source == 'snapshot' else (fetch_report or {}).get('history')
+    memory = (fetch_report or {}).get('memory') or (snapshot_meta or {}).get('memory') or {}
+    with store['lock']:
+        previous = store['datasets'].get(spreadsheet_key) or {}
+        dataset = {
+            'version': data_version, 'rekap': rekap_df, 'database': database_df, 'history': history, 'source': source,
+            'report': fetch_report, 'snapshot_meta': snapshot_meta or previous.get('snapshot_meta'),
+            'loaded_at': datetime.now(),
+            'fetched_at': datetime.fromisoformat(snapshot_meta['saved_at']) if source == 'snapshot' else datetime.now(),
+            'memory_mb': frame_memory_mb(rekap_df) + frame_memory_mb(database_df) + (frame_memory_mb(history) if history is not None else 0),
+            'raw_memory_mb': memory.get('before_mb'),
+        }
+        store['datasets'][spreadsheet_key] = dataset
+    return dataset
+
+def register_session(spreadsheet_key):
+    """Mencatat sesi yang sedang memakai dataset; mengembalikan jumlah sesi aktif."""
+    ctx = get_script_run_ctx()
+    store, now = _dataset_store(), time.time()
+    with store['lock']:
+        sessions = store['sessions'].setdefault(spreadsheet_key, {})
+        if ctx is not None: sessions[ctx.session_id] = now
+        for session_id in [sid for sid, seen in sessions.items() if now - seen > SESSION_ACTIVE_SECONDS]:
+            del sessions[session_id]
+        return len(sessions)
 
 # ================================
-# FUNGSI MEMUAT SEMUA DATA
+# PENYEGARAN DATA DI LATAR BELAKANG (STALE-WHILE-REVALIDATE)
 # ================================
-@st.cache_data(show_spinner="Mengambil data terbaru dari Google Sheets...")
-def load_all_data(spreadsheet_key):
-    gc = connect_to_gsheets()
+# Satu thread per proses menarik data dari Google Sheets sesuai jadwal (atau saat diminta), menyiapkan
+# view turunan, lalu menukar dataset bersama secara atomik. Pengguna tetap memakai versi lama selama
+# penarikan berjalan dan tidak pernah menunggu Google Sheets. Flag `state` dibaca/ditulis dari thread sesi dan thread
+# penyegar, jadi selalu di bawah state['lock'].
+REFRESH_POLL_SECONDS = 3  # Interval cek status di UI selama penyegaran berjalan
+
+@st.cache_resource
+def _refresher(spreadsheet_key):
+    state = {'wake': threading.Event(), 'lock': threading.Lock(), 'force_full': False, 'running': False, 'runs': 0,
+             'started_at': None, 'finished_at': None, 'duration': None, 'error': None}
+    threading.Thread(target=_refresh_loop, args=(spreadsheet_key, state), name="dataset-refresher", daemon=True).start()
+    return state
+
+def _refresh_loop(spreadsheet_key, state):
+    interval = REFRESH_INTERVAL_MINUTES * 60 if REFRESH_INTERVAL_MINUTES > 0 else None
+    while True:
+        state['wake'].wait(timeout=interval)
+        with state['lock']:
+            # Permintaan yang masuk setelah titik ini memasang wake lagi dan dijalankan pada putaran berikutnya
+            state['wake'].clear()
+            force_full, state['force_full'] = state['force_full'], False
+            state['running'], state['started_at'] = True, datetime.now()
+        _run_refresh(spreadsheet_key, state, force_full)
+
+def _run_refresh(spreadsheet_key, state, force_full):
+    started = time.perf_counter()
     try:
-        spreadsheet = gc.open_by_key(spreadsheet_key)
-    except Exception as e:
-        st.error(f"GAGAL KONEKSI/OPEN SPREADSHEET: {e}")
-        return None, None
-
-    database_df = pd.DataFrame()
-    rekap_df = _load_all_rekap_data(spreadsheet)
-    if rekap_df.empty:
-        st.error("Tidak ada data REKAP yang berhasil dimuat.")
-        return None, None
-        
-    try:
-        db_worksheet = spreadsheet.worksheet("DATABASE")
-        all_values = db_worksheet.get_all_values()
-        if all_values and len(all_values) >= 2:
-            header, data = all_values[0], all_values[1:]
-            database_df = pd.DataFrame(data, columns=header)
-            if '' in database_df.columns: database_df = database_df.drop(columns=[''])
-    except gspread.exceptions.WorksheetNotFound:
-        st.warning("Sheet 'DATABASE' tidak ditemukan.")
+        rekap_df, database_df, fetch_report = load_all_data(spreadsheet_key, force_full=force_full)
+        if rekap_df is None or database_df is None:
+            state['error'] = fetch_report['error']
+        else:
+            # View turunan disiapkan sebelum penukaran, sehingga rerun pertama di versi baru langsung cache hit
+            version = fetch_report['data_version']
+            with timed(fetch_report['stages'], 'views.warm', len(rekap_df)):
+                get_base_views(version, rekap_df, MY_STORE_NAME, fetch_report['history'])
+                if resolve_query_backend() is None: get_brand_cube(version, rekap_df)
+            publish_dataset(spreadsheet_key, rekap_df, database_df, version, 'sheets', fetch_report)
+            state['error'] = None
+        if fetch_report is not None:
+            log_timings('refresh', fetch_report['stages'], data_version=fetch_report.get('data_version'), force_full=force_full,
+                        seconds=round(time.perf_counter() - started, 4), rows=0 if rekap_df is None else len(rekap_df),
+                        memory=fetch_report.get('memory'), failed=list(fetch_report['failed']), error=fetch_report['error'],
+                        sheets=fetch_report['sheet_fetch'])
     except Exception as e:
-        st.warning(f"Gagal membaca sheet 'DATABASE': {e}")
-
-    rekap_df.columns = [str(c).strip().upper() for c in rekap_df.columns]
-    final_rename = {
-        'NAMA': 'Nama Produk', 'TERJUAL/BLN': 'Terjual per Bulan', 'TANGGAL': 'Tanggal', 'HARGA': 'Harga', 
-        'BRAND': 'Brand', 'STOK': 'Stok', 'TOKO': 'Toko', 'STATUS': 'Status'
-    }
-    rekap_df.rename(columns=final_rename, inplace=True)
-
-    if 'Nama Produk' in rekap_df.columns: rekap_df['Nama Produk'] = rekap_df['Nama Produk'].astype(str).str.strip()
-    if 'Tanggal' in rekap_df.columns: rekap_df['Tanggal'] = pd.to_datetime(rekap_df['Tanggal'], errors='coerce', dayfirst=True)
-    if 'Harga' in rekap_df.columns: rekap_df['Harga'] = pd.to_numeric(rekap_df['Harga'].astype(str).str.replace(r'[^\d]', '', regex=True), errors='coerce')
-    if 'Terjual per Bulan' in rekap_df.columns: rekap_df['Terjual per Bulan'] = pd.to_numeric(rekap_df['Terjual per Bulan'], errors='coerce').fillna(0)
-
-    rekap_df.dropna(subset=['Tanggal', 'Nama Produk', 'Harga', 'Toko'], inplace=True)
-    if 'Brand' not in rekap_df.columns or rekap_df['Brand'].isnull().all():
-        rekap_df['Brand'] = rekap_df['Nama Produk'].str.split(n=1).str[0].str.upper()
-    rekap_df['Omzet'] = (rekap_df['Harga'].fillna(0) * rekap_df.get('Terjual per Bulan', 0).fillna(0)).astype(int)
-    
-    # --- MODIFIKASI: Menambahkan pemetaan 'kamus_brand' dari Kode 2 ---
-    try:
-        kamus_ws = spreadsheet.worksheet("kamus_brand")
-        kamus_df = pd.DataFrame(kamus_ws.get_all_records())
-        kamus_brand = {row['Alias'].upper(): row['Brand_Utama'].upper() for _, row in kamus_df.iterrows()}
-        rekap_df['Brand_Utama'] = rekap_df['Brand'].str.upper().map(kamus_brand).fillna(rekap_df['Brand'].str.upper())
-    except gspread.exceptions.WorksheetNotFound:
-        st.warning("Worksheet 'kamus_brand' tidak ditemukan. Menggunakan kolom 'Brand' standar sebagai 'Brand_Utama'.")
-        rekap_df['Brand_Utama'] = rekap_df['Brand'].str.upper()
-    # --- AKHIR MODIFIKASI ---
-    
-    return rekap_df.sort_values('Tanggal'), database_df
+        state['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        with state['lock']:
+            state['duration'] = time.perf_counter() - started
+            state['finished_at'], state['running'] = datetime.now(), False
+            state['runs'] += 1
+
+def request_refresh(spreadsheet_key, force_full=False):
+    """Meminta penyegaran segera (tidak memblokir). Permintaan yang datang saat penyegaran berjalan digabung."""
+    state = _refresher(spreadsheet_key)
+    with state['lock']:
+        state['force_full'] = state['force_full'] or force_full
+        state['wake'].set()
+    return state
+
+def refresh_pending(state):
+    with state['lock']:
+        return state['running'] or state['wake'].is_set()
 
 # ================================
 # FUNGSI-FUNGSI PEMBANTU (UTILITY)
 # ================================
 def format_wow_growth(pct_change):
-    if pd.isna(pct_change) or pct_change == float('inf'): return "N/A"
-    elif pct_change > 0.001: return f"▲ {pct_change:.1%}"
-    elif pct_change < -0.001: return f"▼ {pct_change:.1%}"
-    else: return f"▬ 0.0%"
+    """Pertumbuhan (rasio, Series) sebagai teks '▲ 12.5%' / '▼ -3.0%' / '▬ 0.0%' / 'N/A', tanpa loop per baris."""
+    valid = pct_change.notna() & np.isfinite(pct_change.astype(float))
+    arrow = np.select([pct_change > 0.001, pct_change < -0.001], ["▲ ", "▼ "], default="▬ ")
+    text = pd.Series(arrow, index=pct_change.index) + (pct_change.astype(float) * 100).round(1).astype(str) + "%"
+    return text.where(valid, "N/A").mask(valid & (arrow == "▬ "), "▬ 0.0%")
 
 def style_wow_growth(val):
     color = 'black';
@@ -141,39 +165,84 @@ def style_wow_growth(val):
         elif '▼' in val: color = 'red'
     return f'color: {color}'
 
-@st.cache_data
-def convert_df_for_download(df):
-    return df.to_csv(index=False).encode('utf-8')
-
-def format_rupiah(val):
-    if pd.isna(val) or not isinstance(val, (int, float, np.number)): return "N/A"
-    return f"Rp {int(val):,}"
+def download_export(label, name, build, container=st, **kwargs):
+    """Tombol unduh dalam format pilihan sidebar. Berkas baru dibuat saat tombol diklik (`build()` -> DataFrame) dan
+    di-cache di disk per (versi data, `name`), jadi `name` harus memuat parameter view seperti rentang tanggal."""
+    fmt, version = export_format, data_version  # Diikat sekarang: callback berjalan di thread lain setelah rerun berikutnya
+    _, extension, mime = EXPORT_FORMATS[fmt]
+    def data():
+        with open(export_path(version, name, fmt, build), 'rb') as f: return f.read()
+    container.download_button(label, data=data, file_name=f"{name}{extension}", mime=mime, **kwargs)
+
+# Tabel: angka tetap numerik (bisa diurutkan di st.dataframe); format Rupiah diterapkan browser lewat column_config.
+RUPIAH_FORMAT = "Rp %,d"
+PIVOT_PAGE_COLUMNS = 31             # Kolom tanggal per halaman pivot lebar
+CHART_MAX_POINTS_PER_SERIES = 400   # Garis yang lebih panjang diturunkan di server (downsample_series)
+CHART_WEBGL_POINTS = 2_000          # Total titik di atas ini dirender dengan WebGL
+CHART_MARKER_POINTS = 60            # Penanda titik hanya untuk garis pendek
+
+def rupiah_config(*columns, **labels):
+    """column_config Rupiah untuk kolom numerik; `labels` mengganti judul kolom (nama kolom -> judul)."""
+    return {col: st.column_config.NumberColumn(labels.get(col), format=RUPIAH_FORMAT) for col in columns}
+
+def plot_lines(frame, x, y, color, line_dash=None, **kwargs):
+    """Grafik garis per `color` (dan `line_dash`) dengan muatan halaman terbatas: setiap garis paling banyak
+    CHART_MAX_POINTS_PER_SERIES titik, WebGL untuk grafik besar, dan penanda titik hanya untuk garis pendek."""
+    series = [color] + ([line_dash] if line_dash else [])
+    plotted = downsample_series(frame, x, y, series, CHART_MAX_POINTS_PER_SERIES)
+    longest = plotted.groupby(series, observed=True).size().max() if len(plotted) else 0
+    fig = px.line(plotted, x=x, y=y, color=color, line_dash=line_dash, markers=longest <= CHART_MARKER_POINTS,
+                  render_mode='webgl' if len(plotted) > CHART_WEBGL_POINTS else 'auto', **kwargs)
+    st.plotly_chart(fig, use_container_width=True)
+    if len(plotted) < frame[y].notna().sum():
+        st.caption(f"Grafik menampilkan {len(plotted):,} dari {frame[y].notna().sum():,} titik (nilai terkecil & terbesar per rentang dipertahankan).")
+
+def format_age(delta):
+    minutes = int(delta.total_seconds() // 60)
+    if minutes < 1: return "baru saja"
+    if minutes < 60: return f"{minutes} menit lalu"
+    if minutes < 24 * 60: return f"{minutes // 60} jam {minutes % 60} menit lalu"
+    return f"{minutes // (24 * 60)} hari lalu"
 
 # ================================
 # APLIKASI UTAMA (MAIN APP)
 # ================================
 st.title("📊 Dashboard Analisis Penjualan & Bisnis")
-
-gc = connect_to_gsheets()
-
-if 'data_loaded' not in st.session_state:
-    st.session_state.data_loaded = False
-if not st.session_state.data_loaded:
-    _, col_center, _ = st.columns([2, 3, 2])
-    with col_center:
-        if st.button("Tarik Data & Mulai Analisis 🚀", type="primary"):
-            df, db_df = load_all_data(SPREADSHEET_KEY)
-            if df is not None and not df.empty and db_df is not None:
-                st.session_state.df, st.session_state.db_df = df, db_df
-                st.session_state.data_loaded = True
-                st.rerun()
-            else:
-                st.error("Gagal memuat data. Periksa akses Google Sheets dan pastikan sheet 'DATABASE' ada.")
-    st.info("👆 Klik tombol untuk menarik semua data yang diperlukan untuk analisis.")
+run_stages, run_started = {}, time.perf_counter()
+
+@st.fragment(run_every=REFRESH_POLL_SECONDS)
+def wait_for_first_dataset(spreadsheet_key):
+    """Layar tunggu saat belum ada data sama sekali; membuka dashboard otomatis setelah penarikan pertama selesai."""
+    if get_dataset(spreadsheet_key) is not None: st.rerun()
+    refresher = _refresher(spreadsheet_key)
+    if refresh_pending(refresher):
+        st.info("⏳ Data sedang ditarik dari Google Sheets di latar belakang. Dashboard akan terbuka otomatis setelah selesai.")
+    else:
+        st.error(f"Gagal memuat data. Periksa akses Google Sheets dan pastikan sheet 'DATABASE' ada. ({refresher['error']})")
+        if st.button("Coba Lagi 🚀", type="primary"): request_refresh(spreadsheet_key)
+
+refresher = _refresher(SPREADSHEET_KEY)  # Memulai thread penyegar (sekali per proses)
+dataset = get_dataset(SPREADSHEET_KEY)
+count_cache('dataset_bersama', 'hit' if dataset is not None else 'miss')
+if dataset is None:
+    # Tampilkan snapshot disk terakhir lebih dulu; revalidasi ke Google Sheets berjalan di latar belakang
+    with timed(run_stages, 'snapshot.load'):
+        snapshot = load_snapshot(SPREADSHEET_KEY)
+    if snapshot is not None:
+        snap_df, snap_db_df, snapshot_meta = snapshot
+        dataset = publish_dataset(SPREADSHEET_KEY, snap_df, snap_db_df, snapshot_meta['version'], 'snapshot', snapshot_meta=snapshot_meta)
+    if refresher['runs'] == 0 and not refresh_pending(refresher): request_refresh(SPREADSHEET_KEY)
+if dataset is None:
+    wait_for_first_dataset(SPREADSHEET_KEY)
     st.stop()
 
-df = st.session_state.df
-db_df = st.session_state.db_df if 'db_df' in st.session_state else pd.DataFrame()
+# Dataset dipakai bersama semua sesi (read-only); jangan diubah in-place
+df = dataset['rekap']
+db_df = dataset['database']
+history_df = dataset['history']  # None jika retensi tidak aktif
+data_version = dataset['version']
+query_store = open_query_store(SPREADSHEET_KEY, data_version)  # None = view dihitung dengan pandas
+active_sessions = register_session(SPREADSHEET_KEY)
 
 # ================================
 # SIDEBAR (KONTROL UTAMA)
@@ -181,34 +250,45 @@ db_df = st.session_state.db_df if 'db_df' in st.session_state else pd.DataFrame(
 st.sidebar.header("Mode Tampilan")
 # --- MODIFIKASI: Menambahkan mode "Cek Brand Toko" ---
 app_mode = st.sidebar.radio("Pilih Tampilan:", ("Tab Analisis", "Cari Perbandingan", "HPP Produk", "Cek Brand Toko"))
+export_format = st.sidebar.selectbox("Format unduhan:", list(EXPORT_FORMATS), format_func=lambda fmt: EXPORT_FORMATS[fmt][0], key="export_format")
 st.sidebar.divider()
 
+with timed(run_stages, 'views.base', len(df)):
+    base_views = get_base_views(data_version, df, MY_STORE_NAME, history_df)
+
 if app_mode == "Tab Analisis":
     st.sidebar.header("Kontrol & Filter Analisis")
-    min_date, max_date = df['Tanggal'].min().date(), df['Tanggal'].max().date()
+    min_date, max_date = base_views['min_date'], base_views['max_date']
     selected_date_range = st.sidebar.date_input("Rentang Tanggal:", [min_date, max_date], min_value=min_date, max_value=max_date)
     if len(selected_date_range) != 2: st.sidebar.warning("Pilih 2 tanggal."); st.stop()
     start_date, end_date = selected_date_range
+    granularity = st.sidebar.radio("Granularitas Waktu:", list(GRANULARITIES), index=1, format_func=GRANULARITIES.get,
+                                   horizontal=True, key="granularity",
+                                   help="Periode untuk ringkasan kinerja toko dan grafik omzet di tab Kinerja Penjualan.")
+    with timed(run_stages, 'views.range', len(df)):
+        range_views = get_range_views(data_version, start_date, end_date, df, MY_STORE_NAME, history_df)
     
     st.sidebar.divider()
-    df_filtered_export = df[(df['Tanggal'].dt.date >= start_date) & (df['Tanggal'].dt.date <= end_date)]
     st.sidebar.header("Ekspor & Info")
-    st.sidebar.info(f"Baris data dalam rentang: **{len(df_filtered_export)}**")
-    csv_data = convert_df_for_download(df_filtered_export)
-    st.sidebar.download_button("📥 Unduh CSV (Filter)", data=csv_data, file_name=f'analisis_{start_date}_{end_date}.csv', mime='text/csv')
+    st.sidebar.info(f"Baris data dalam rentang: **{len(range_views['filtered'])}**")
+    download_export("📥 Unduh Data (Filter)", f"analisis_{start_date}_{end_date}",
+                    lambda: range_views['filtered'].drop(columns=['Minggu']), container=st.sidebar)
 
 elif app_mode == "Cari Perbandingan":
     st.sidebar.header("Kontrol Pencarian")
     st.sidebar.info("Skor akurasi 0.0 - 1.0. Semakin tinggi, semakin ketat pencocokan produk.")
     accuracy_cutoff = st.sidebar.slider("Tingkat Akurasi Pencocokan", 0.0, 1.0, 0.5, 0.05)
+    available_engines = MATCH_ENGINES if SentenceTransformer is not None else MATCH_ENGINES[:1]
+    match_engine = st.sidebar.radio("Mesin Pencocokan:", available_engines, key="match_engine",
+                                    help="Embedding memakai model SBERT lokal (CPU) dan lebih tahan terhadap urutan kata/penulisan satuan yang berbeda.")
+    if SentenceTransformer is None:
+        st.sidebar.caption("Mesin embedding tidak tersedia: paket `sentence-transformers` belum terpasang.")
 
 # --- BARU: Menambahkan kontrol sidebar untuk mode "Cek Brand Toko" ---
 elif app_mode == "Cek Brand Toko":
     st.sidebar.header("Kontrol Cek Brand")
-    df_for_filters = st.session_state.df 
-    
     # Kontrol Pilih Brand (menggunakan 'Brand_Utama' yang sudah kita muat)
-    unique_brands = sorted(df_for_filters['Brand_Utama'].unique())
+    unique_brands = base_views['brands']
     default_brand_index = unique_brands.index("ACER") if "ACER" in unique_brands else 0
     st.sidebar.selectbox(
         "Pilih Brand:", 
@@ -218,8 +298,8 @@ elif app_mode == "Cek Brand Toko":
     )
     
     # Kontrol Pilih Tanggal (menggunakan 'Tanggal' dari Kode 1)
-    min_date_cek = df_for_filters['Tanggal'].min().date()
-    max_date_cek = df_for_filters['Tanggal'].max().date()
+    min_date_cek = base_views['detail_min_date']
+    max_date_cek = base_views['max_date']
     st.sidebar.date_input(
         "Pilih TANGGAL:", 
         value=max_date_cek, 
@@ -234,30 +314,346 @@ elif app_mode == "Cek Brand Toko":
 
 else: # Mode HPP Produk
     st.sidebar.info("Tampilan ini menganalisis harga jual produk Anda dibandingkan dengan Harga Pokok Penjualan (HPP) dari sheet 'DATABASE'.")
+    hpp_use_fuzzy = st.sidebar.checkbox("Pakai Usulan Fuzzy untuk Margin", value=False, key="hpp_use_fuzzy",
+                                        help="SKU yang tidak sama persis (beda awalan, salah ketik) hanya diusulkan. Centang untuk ikut "
+                                             "menghitung rugi/untung dengan HPP usulan yang skornya di atas ambang.")
+    hpp_min_score = st.sidebar.slider("Skor Minimum Pencocokan SKU (Fuzzy)", 0.6, 1.0, HPP_FUZZY_MIN_SCORE, 0.01, key="hpp_min_score",
+                                      disabled=not hpp_use_fuzzy,
+                                      help="Usulan dengan skor di bawah ambang ini tidak dipakai untuk menghitung margin.")
+    if Levenshtein is None:
+        st.sidebar.caption("Pencocokan fuzzy tidak tersedia: paket `python-levenshtein` belum terpasang. Hanya SKU persis/ternormalisasi yang dicocokkan.")
+
+st.sidebar.divider()
+st.sidebar.header("Sinkronisasi Data")
+col_sync, col_full = st.sidebar.columns(2)
+sync_clicked = col_sync.button("🔄 Perbarui", help="Hanya mengambil baris baru yang ditambahkan sejak sinkronisasi terakhir.", use_container_width=True)
+full_clicked = col_full.button("♻️ Bangun Ulang", help="Mengambil ulang semua sheet dari awal (gunakan jika sheet diedit/ditulis ulang).", use_container_width=True)
+if sync_clicked or full_clicked: request_refresh(SPREADSHEET_KEY, force_full=full_clicked)
+
+@st.fragment(run_every=REFRESH_POLL_SECONDS if refresh_pending(refresher) else None)
+def render_refresh_status(spreadsheet_key, shown_version):
+    """Status data & penyegaran; memantau sendiri selama penyegaran latar belakang berjalan."""
+    state, current = _refresher(spreadsheet_key), get_dataset(spreadsheet_key)
+    st.caption(f"Umur data: **{format_age(datetime.now() - current['fetched_at'])}** ({current['fetched_at']:%d %b %Y %H:%M})")
+    if state['duration'] is not None:
+        st.caption(f"Penyegaran terakhir: {state['duration']:.1f} detik, selesai {state['finished_at']:%H:%M:%S}")
+    if REFRESH_INTERVAL_MINUTES > 0:
+        st.caption(f"Penyegaran otomatis setiap {REFRESH_INTERVAL_MINUTES:g} menit.")
+    if refresh_pending(state):
+        st.info("⏳ Penyegaran berjalan di latar belakang. Data saat ini tetap bisa dipakai.")
+    elif state['error']:
+        st.error(f"Penyegaran terakhir gagal; data sebelumnya tetap digunakan. {state['error']}")
+    if current['version'] != shown_version:
+        st.success("Versi data baru sudah tersedia dan dipakai pada interaksi berikutnya.")
+        if st.button("Tampilkan Sekarang", use_container_width=True): st.rerun()
+    failed = (current['report'] or {}).get('failed') or {}
+    if failed: st.warning(f"Sheet gagal diambil: {', '.join(failed)}")
+
+with st.sidebar:
+    render_refresh_status(SPREADSHEET_KEY, data_version)
+
+fetch_report = dataset['report']
+snapshot_meta = dataset['snapshot_meta']
+with st.sidebar.expander("ℹ️ Info Pengambilan Data"):
+    source_label = "snapshot disk" if dataset['source'] == 'snapshot' else "Google Sheets"
+    st.caption(f"Versi data: `{data_version}` (sumber: {source_label})")
+    if history_df is not None:
+        retention = (fetch_report or {}).get('retention') or {}
+        st.caption(f"Retensi: baris harian sejak {base_views['detail_min_date']:%d %b %Y}; "
+                   f"data lebih lama diringkas per minggu ({len(history_df):,} baris, sejak {base_views['min_date']:%d %b %Y})."
+                   + (f" {retention['compacted_rows']:,} baris diringkas pada penyegaran terakhir." if retention.get('compacted_rows') else ""))
+    if query_store: st.caption(f"Backend query: **{query_store['backend']}** (`{os.path.basename(query_store['path'])}`)")
+    elif resolve_query_backend(): st.caption(f"Backend query {resolve_query_backend()} belum siap untuk versi ini; memakai pandas.")
+    st.markdown("**Memori dataset (dipakai bersama):**")
+    memory_rows = [{'Keterangan': 'Setelah kompaksi (sekali per proses)', 'MB': dataset['memory_mb']}]
+    if dataset['raw_memory_mb']:
+        memory_rows.append({'Keterangan': 'Sebelum kompaksi', 'MB': dataset['raw_memory_mb']})
+        memory_rows.append({'Keterangan': f'Tanpa berbagi ({active_sessions} sesi aktif × salinan)', 'MB': dataset['raw_memory_mb'] * active_sessions})
+    st.dataframe(pd.DataFrame(memory_rows), hide_index=True, column_config={"MB": st.column_config.NumberColumn(format="%.1f")})
+    if snapshot_meta:
+        st.markdown("**Waktu muat saat startup:**")
+        startup_timing = pd.DataFrame([
+            {'Sumber': 'Snapshot disk', 'Detik': snapshot_meta['load_seconds']},
+            {'Sumber': 'Google Sheets (tarik penuh terakhir)', 'Detik': snapshot_meta.get('full_sheets_seconds')},
+        ])
+        if fetch_report and 'total_duration' in fetch_report:
+            startup_timing.loc[len(startup_timing)] = ['Google Sheets (revalidasi latar belakang)', fetch_report['total_duration']]
+        st.dataframe(startup_timing, hide_index=True, column_config={"Detik": st.column_config.NumberColumn(format="%.2f")})
+    if fetch_report:
+        st.caption(f"{fetch_report['api_calls']} panggilan API dalam {fetch_report['duration']:.1f} detik.")
+        if fetch_report['sync']:
+            sync_table = pd.DataFrame.from_dict(fetch_report['sync'], orient='index').rename_axis('Sheet').reset_index()
+            st.dataframe(sync_table, hide_index=True)
+        if fetch_report['retried']:
+            st.markdown("**Sheet yang dicoba ulang (kuota/server):**")
+            st.dataframe(pd.DataFrame(list(fetch_report['retried'].items()), columns=['Sheet', 'Percobaan Ulang']), hide_index=True)
+        if fetch_report['failed']:
+            st.markdown("**Sheet yang gagal diambil:**")
+            st.dataframe(pd.DataFrame(list(fetch_report['failed'].items()), columns=['Sheet', 'Error']), hide_index=True)
+        if fetch_report.get('dropped'):
+            st.markdown("**Baris dibuang saat normalisasi (Tanggal/Nama/Harga/Toko tidak valid):**")
+            dropped_table = pd.DataFrame.from_dict(fetch_report['dropped'], orient='index').rename_axis('Sheet').reset_index()
+            dropped_table['Contoh Baris'] = dropped_table['Contoh Baris'].map(lambda rows: ', '.join(map(str, rows)))
+            st.dataframe(dropped_table.fillna(0), hide_index=True)
+        for warning in fetch_report['warnings']: st.warning(warning)
+
+show_admin_panel = ADMIN_PANEL_ENABLED and st.sidebar.toggle("🛠️ Panel Instrumentasi", key="admin_panel")
+admin_container = st.sidebar.container()
 
 # ================================
 # PERSIAPAN DATA UMUM
 # ================================
-df_filtered = df.copy()
-# Filter tanggal hanya berlaku untuk mode Tab Analisis
+# Data snapshot terakhir per produk, digunakan di beberapa mode
+latest_entries_overall = base_views['latest']
+main_store_latest_overall = base_views['main_latest']
+competitor_latest_overall = base_views['competitor_latest']
+
+# Data terfilter & mingguan, hanya digunakan untuk Tab Analisis
 if app_mode == "Tab Analisis":
-    start_date_dt, end_date_dt = pd.to_datetime(start_date), pd.to_datetime(end_date)
-    df_filtered = df[(df['Tanggal'] >= start_date_dt) & (df['Tanggal'] <= end_date_dt)].copy()
+    df_filtered = range_views['filtered']
+    latest_entries_weekly = range_views['latest_weekly']
+    if df_filtered.empty and latest_entries_weekly.empty:
+        st.error("Tidak ada data di rentang tanggal yang dipilih."); st.stop()
+    competitor_df = range_views['competitor']
+
+def hpp_views(min_score, use_fuzzy=False):
+    """Tabel HPP (rugi / untung / tidak ditemukan / usulan fuzzy) dari indeks HPP yang di-cache per versi data.
+    View pra-hitung memakai bawaan (usulan fuzzy tidak dihitung ke margin)."""
+    stored = load_precomputed_views(data_version, MY_STORE_NAME)
+    if 'hpp_usulan' in stored and not use_fuzzy:
+        return {name: stored[f"hpp_{name}"] for name in ('rugi', 'untung', 'tidak_ditemukan', 'usulan')}
+    with timed(run_stages, 'hpp.match', len(main_store_latest_overall)):
+        matches = get_hpp_matches(data_version, main_store_latest_overall, db_df)['matches']
+    return hpp_comparison(main_store_latest_overall, db_df, min_score, matches=matches, use_fuzzy=use_fuzzy)
 
-if df_filtered.empty and app_mode == "Tab Analisis": 
-    st.error("Tidak ada data di rentang tanggal yang dipilih."); st.stop()
+# ================================
+# TULIS BALIK HASIL KE GOOGLE SHEETS
+# ================================
+WRITEBACK_LABELS = {
+    'weekly_summary': "Ringkasan mingguan toko sendiri", 'weekly_omzet': "Omzet mingguan per toko",
+    'competitor_brands': "Brand kompetitor", 'hpp_rugi': "HPP: produk rugi", 'hpp_tidak_ditemukan': "HPP: SKU tidak ditemukan",
+    'bulk_match': "Pencocokan seluruh katalog (TF-IDF)",
+}
+
+def build_writeback_frames(names):
+    """{judul worksheet: DataFrame} untuk view terpilih (rentang tanggal penuh); memakai view pra-hitung bila ada."""
+    stored, frames = load_precomputed_views(data_version, MY_STORE_NAME), {}
+    for name in names:
+        frame = stored.get(name)
+        if frame is None and name in ('weekly_summary', 'weekly_omzet'):
+            full_range = get_range_views(data_version, base_views['min_date'], base_views['max_date'], df, MY_STORE_NAME, history_df)
+            frame = weekly_store_summary(full_range['main_weekly']) if name == 'weekly_summary' else weekly_omzet_by_store(full_range['latest_weekly'])
+        elif frame is None and name == 'competitor_brands':
+            frame = competitor_brand_summary(competitor_latest_overall)
+        elif frame is None and name.startswith('hpp_'):
+            if db_df.empty or 'SKU' not in db_df.columns: continue
+            frame = hpp_views(HPP_FUZZY_MIN_SCORE)[name[len('hpp_'):]]
+        elif frame is None and name == 'bulk_match':
+            if competitor_latest_overall.empty or main_store_latest_overall.empty: continue
+            competitor_index = build_competitor_index(data_version, competitor_latest_overall)
+            frame = bulk_match_cached(data_version, *PRECOMPUTED_MATCH_PARAMS, main_store_latest_overall, competitor_index)
+        frames[WRITEBACK_VIEWS[name]] = frame
+    return frames
+
+with st.sidebar.expander("📤 Tulis Hasil ke Google Sheets"):
+    st.caption("Menulis view terpilih ke worksheet 'OUTPUT - ...'. Hanya sel yang berubah sejak penulisan terakhir yang dikirim.")
+    writeback_names = st.multiselect("View:", list(WRITEBACK_VIEWS), default=['weekly_summary', 'hpp_rugi'],
+                                     format_func=WRITEBACK_LABELS.get, key="writeback_views")
+    writeback_force = st.checkbox("Bandingkan dengan isi sheet saat ini", key="writeback_force",
+                                  help="Abaikan catatan penulisan terakhir dan baca ulang sheet (gunakan jika sheet output diedit manual).")
+    if st.button("Tulis ke Sheets", disabled=not writeback_names, use_container_width=True):
+        with st.spinner("Menulis ke Google Sheets..."):
+            frames = build_writeback_frames(writeback_names)
+            st.session_state.writeback_report = write_views(open_spreadsheet(SPREADSHEET_KEY), SPREADSHEET_KEY, frames, force=writeback_force)
+    writeback_report = st.session_state.get('writeback_report')
+    if writeback_report:
+        st.caption(f"{writeback_report['api_calls']} panggilan API dalam {writeback_report['duration']:.1f} detik.")
+        if writeback_report['sheets']:
+            st.dataframe(pd.DataFrame.from_dict(writeback_report['sheets'], orient='index').rename_axis('Sheet').reset_index(),
+                         hide_index=True, column_config={"Detik": st.column_config.NumberColumn(format="%.2f")})
+        for title, error in writeback_report['failed'].items(): st.error(f"{title}: {error}")
 
-# Data snapshot terakhir per produk, digunakan di beberapa mode
-latest_entries_overall = df.loc[df.groupby(['Toko', 'Nama Produk'])['Tanggal'].idxmax()]
-main_store_latest_overall = latest_entries_overall[latest_entries_overall['Toko'] == MY_STORE_NAME]
-competitor_latest_overall = latest_entries_overall[latest_entries_overall['Toko'] != MY_STORE_NAME]
+# ================================
+# FRAGMEN TAB ANALISIS
+# ================================
+# Setiap tab adalah st.fragment: interaksi widget di dalamnya hanya menjalankan ulang tab tersebut.
+# Tab dan expander berat memakai on_change="rerun" sehingga isinya hanya dihitung saat sedang dibuka.
+def render_retention_note(start_date):
+    """Catatan bila rentang dimulai sebelum jendela retensi (di sana hanya ada ringkasan mingguan)."""
+    if history_df is not None and start_date < base_views['detail_min_date']:
+        st.caption(f"Data harian hanya tersedia mulai {base_views['detail_min_date']:%d %b %Y}; sebelum itu hanya ringkasan mingguan.")
+
+GROWTH_LABELS = {'D': "DoD", 'W': "WoW", 'M': "MoM"}
+
+def period_views(granularity):
+    """Snapshot per periode untuk rentang tanggal aktif (di-cache per granularitas)."""
+    with timed(run_stages, f'views.period.{granularity}', len(df)):
+        return get_period_views(data_version, start_date, end_date, granularity, df, MY_STORE_NAME, history_df)
+
+def period_label(periods, granularity):
+    """Label tampilan awal periode: tanggal (harian/mingguan) atau bulan-tahun (bulanan)."""
+    return periods.dt.strftime('%b %Y' if granularity == 'M' else '%d %b %Y')
+
+@st.fragment
+def render_tab_toko_saya(main_store_latest_overall, granularity):
+    st.header(f"Analisis Kinerja Toko: {MY_STORE_NAME}")
+    section_counter = 1
+    st.subheader(f"{section_counter}. Analisis Kategori Terlaris (Berdasarkan Omzet)")
+    section_counter += 1
+    if 'KATEGORI' in main_store_latest_overall.columns:
+        main_store_cat = main_store_latest_overall.copy()
+        main_store_cat['KATEGORI'] = main_store_cat['KATEGORI'].astype(object).replace('', 'Lainnya').fillna('Lainnya')
+        category_sales = main_store_cat.groupby('KATEGORI')['Omzet'].sum().reset_index()
+        if not category_sales.empty:
+            cat_sales_sorted = category_sales.sort_values('Omzet', ascending=False).head(10)
+            fig_cat = px.bar(cat_sales_sorted, x='KATEGORI', y='Omzet', title='Top 10 Kategori Berdasarkan Omzet', text_auto='.2s')
+            st.plotly_chart(fig_cat, use_container_width=True)
+            st.markdown("##### Rincian Data Omzet per Kategori")
+            st.dataframe(cat_sales_sorted, use_container_width=True, hide_index=True, column_config=rupiah_config('Omzet'))
+            st.markdown("---")
+            st.subheader("Lihat Produk Terlaris per Kategori")
+            category_list = category_sales.sort_values('Omzet', ascending=False)['KATEGORI'].tolist()
+            selected_category = st.selectbox("Pilih Kategori untuk melihat produk terlaris:", options=category_list)
+            if selected_category:
+                products_in_category = main_store_cat[main_store_cat['KATEGORI'] == selected_category].copy()
+                top_products_in_category = products_in_category.sort_values('Terjual per Bulan', ascending=False)
+                if top_products_in_category.empty:
+                    st.info(f"Tidak ada produk terlaris untuk kategori '{selected_category}'.")
+                else:
+                    columns_to_display = ['Nama Produk', 'SKU', 'Harga', 'Terjual per Bulan', 'Omzet']
+                    if 'SKU' not in top_products_in_category.columns: top_products_in_category['SKU'] = 'N/A'
+                    st.dataframe(top_products_in_category[columns_to_display], use_container_width=True, hide_index=True,
+                                 column_config=rupiah_config('Harga', 'Omzet'))
+        else:
+            st.info("Tidak ada data omzet per kategori untuk ditampilkan.")
+    else:
+        st.warning("Kolom 'KATEGORI' tidak ditemukan pada data toko Anda. Analisis ini dilewati.")
+    st.subheader(f"{section_counter}. Produk Terlaris")
+    section_counter += 1
+    top_products = main_store_latest_overall.sort_values('Terjual per Bulan', ascending=False).head(15).copy()
+    if 'SKU' not in top_products.columns: top_products['SKU'] = 'N/A'
+    st.dataframe(top_products[['Nama Produk', 'SKU', 'Harga', 'Omzet', 'Terjual per Bulan']], use_container_width=True, hide_index=True,
+                 column_config=rupiah_config('Harga', 'Omzet'))
+    st.subheader(f"{section_counter}. Distribusi Omzet Brand")
+    section_counter += 1
+    brand_omzet_main = main_store_latest_overall.groupby('Brand', observed=True)['Omzet'].sum().reset_index()
+    if not brand_omzet_main.empty:
+        fig_brand_pie = px.pie(brand_omzet_main.sort_values('Omzet', ascending=False).head(7), 
+                               names='Brand', values='Omzet', title='Distribusi Omzet Top 7 Brand (Snapshot Terakhir)')
+        fig_brand_pie.update_traces(textposition='outside', texttemplate='%{label}<br><b>Rp %{value:,.0f}</b><br>(%{percent})', insidetextfont=dict(color='white'))
+        fig_brand_pie.update_layout(showlegend=False)
+        st.plotly_chart(fig_brand_pie, use_container_width=True)
+    else:
+        st.info("Tidak ada data omzet brand.")
+    growth_col = f"Pertumbuhan Omzet ({GROWTH_LABELS[granularity]})"
+    st.subheader(f"{section_counter}. Ringkasan Kinerja {GRANULARITIES[granularity]} ({GROWTH_LABELS[granularity]} Growth)")
+    section_counter += 1
+    if granularity == 'D': render_retention_note(start_date)
+    period_summary = period_views(granularity)['main_summary'].copy()
+    period_summary['Periode'] = period_label(period_summary['Periode'], granularity)
+    period_summary[growth_col] = format_wow_growth(period_summary['Pertumbuhan Omzet'])
+    st.dataframe(
+        period_summary.rename(columns={'Periode': PERIOD_COLUMNS[granularity]})[[PERIOD_COLUMNS[granularity], 'Omzet', 'Penjualan_Unit', growth_col]].style.map(
+            style_wow_growth, subset=[growth_col]
+        ), use_container_width=True, hide_index=True, column_config=rupiah_config('Omzet')
+    )
 
-# Data mingguan, hanya digunakan untuk Tab Analisis
-if app_mode == "Tab Analisis":
-    df_filtered['Minggu'] = df_filtered['Tanggal'].dt.to_period('W-SUN').apply(lambda p: p.start_time).dt.date
-    main_store_df = df_filtered[df_filtered['Toko'] == MY_STORE_NAME]
-    competitor_df = df_filtered[df_filtered['Toko'] != MY_STORE_NAME]
-    latest_entries_weekly = df_filtered.loc[df_filtered.groupby(['Minggu', 'Toko', 'Nama Produk'])['Tanggal'].idxmax()]
+@st.fragment
+def render_tab_brand_kompetitor(data_version, competitor_df, competitor_latest_overall, query_store):
+    st.header("Analisis Brand di Toko Kompetitor")
+    if competitor_df.empty:
+        st.warning("Tidak ada data kompetitor pada rentang tanggal ini.")
+    else:
+        brand_tables = load_precomputed_views(data_version, MY_STORE_NAME).get('competitor_brands')
+        if brand_tables is None:
+            brand_tables = query_competitor_brand_summary(query_store, MY_STORE_NAME) if query_store else competitor_brand_summary(competitor_latest_overall)
+        competitor_list = sorted(competitor_df['Toko'].unique())
+        for competitor_store in competitor_list:
+            competitor_expander = st.expander(f"Analisis untuk Kompetitor: **{competitor_store}**", key=f"competitor_expander_{competitor_store}", on_change="rerun")
+            with competitor_expander:
+                if not competitor_expander.open: continue
+                brand_analysis = brand_tables[brand_tables['Toko'] == competitor_store].drop(columns=['Toko'])
+                if not brand_analysis.empty:
+                    st.dataframe(brand_analysis.head(10), use_container_width=True, hide_index=True, column_config=rupiah_config('Total_Omzet'))
+                    fig_pie_comp = px.pie(brand_analysis.head(7), names='Brand', values='Total_Omzet', title=f'Distribusi Omzet Top 7 Brand di {competitor_store} (Snapshot Terakhir)')
+                    st.plotly_chart(fig_pie_comp, use_container_width=True)
+                else:
+                    st.info("Tidak ada data brand untuk toko ini.")
+
+@st.fragment
+def render_tab_status_stok(df_filtered, query_store, start_date, end_date):
+    st.header("Tren Status Stok Mingguan per Toko")
+    render_retention_note(start_date)
+    if df_filtered.empty: st.info("Tidak ada data harian di rentang ini."); return
+    stock_trends = query_stock_status_trends(query_store, start_date, end_date) if query_store else stock_status_trends(df_filtered)
+    if 'Tersedia' not in stock_trends.columns: stock_trends['Tersedia'] = 0
+    if 'Habis' not in stock_trends.columns: stock_trends['Habis'] = 0
+    stock_trends_melted = stock_trends.melt(id_vars=['Minggu', 'Toko'], value_vars=['Tersedia', 'Habis'], var_name='Tipe Stok', value_name='Jumlah Produk')
+    plot_lines(stock_trends_melted, 'Minggu', 'Jumlah Produk', 'Toko', line_dash='Tipe Stok', title='Jumlah Produk Tersedia vs. Habis per Minggu')
+    st.dataframe(stock_trends.set_index('Minggu'), use_container_width=True)
+
+@st.fragment
+def render_tab_kinerja_penjualan(granularity, df_filtered, query_store, start_date, end_date):
+    st.header("Analisis Kinerja Penjualan (Semua Toko)")
+    if granularity == 'D': render_retention_note(start_date)
+    period_omzet = period_views(granularity)['omzet'].rename(columns={'Periode': PERIOD_COLUMNS[granularity]})
+    plot_lines(period_omzet, PERIOD_COLUMNS[granularity], 'Omzet', 'Toko',
+               title=f'Perbandingan Omzet {GRANULARITIES[granularity]} Antar Toko (Berdasarkan Snapshot Terakhir)')
+    st.markdown("##### Omzet Bergulir (Rata-rata Harian)")
+    rolling_window = st.radio("Jendela:", ROLLING_WINDOWS, format_func=lambda days: f"{days} hari", horizontal=True, key="rolling_window")
+    with timed(run_stages, 'views.rolling', len(df)):
+        rolling_omzet = get_daily_omzet(data_version, df, MY_STORE_NAME, history_df)[rolling_window]
+    rolling_omzet = rolling_omzet.loc[pd.Timestamp(max(start_date, base_views['detail_min_date'])):pd.Timestamp(end_date)]
+    if rolling_omzet.empty:
+        st.info("Tidak ada data harian di rentang ini.")
+    else:
+        plot_lines(rolling_omzet.reset_index().melt(id_vars='Tanggal', var_name='Toko', value_name='Omzet'), 'Tanggal', 'Omzet', 'Toko',
+                   title=f'Rata-rata Omzet {rolling_window} Hari Terakhir per Toko')
+    # Pivot seluruh tanggal hanya dibangun saat tabel dibuka
+    pivot_expander = st.expander("Tabel Rincian Omzet per Tanggal", key="omzet_pivot_expander", on_change="rerun")
+    with pivot_expander:
+        if pivot_expander.open:
+            render_retention_note(start_date)
+            if df_filtered.empty: st.info("Tidak ada data harian di rentang ini."); return
+            omzet_pivot = query_omzet_by_date(query_store, start_date, end_date) if query_store else omzet_by_date(df_filtered)
+            # Hanya satu jendela PIVOT_PAGE_COLUMNS tanggal yang dikirim ke browser; halaman pertama = tanggal terbaru
+            page_ends = list(range(len(omzet_pivot.columns), 0, -PIVOT_PAGE_COLUMNS))
+            page_labels = [f"{omzet_pivot.columns[max(end - PIVOT_PAGE_COLUMNS, 0)]:%d %b %Y} – {omzet_pivot.columns[end - 1]:%d %b %Y}" for end in page_ends]
+            page = st.selectbox("Rentang tanggal:", range(len(page_ends)), format_func=page_labels.__getitem__, key="omzet_pivot_page") if len(page_ends) > 1 else 0
+            window = omzet_pivot.iloc[:, max(page_ends[page] - PIVOT_PAGE_COLUMNS, 0):page_ends[page]]
+            window.columns = [col.strftime('%d %b %Y') for col in window.columns]
+            st.dataframe(window.reset_index(), use_container_width=True, hide_index=True, column_config=rupiah_config(*window.columns))
+
+@st.fragment
+def render_tab_analisis_mingguan(data_version, start_date, end_date, df_filtered, latest_entries_weekly):
+    st.header("Analisis Perubahan Produk Mingguan")
+    weeks = sorted(latest_entries_weekly['Minggu'].unique())
+    if len(weeks) < 2:
+        st.info("Butuh setidaknya 2 minggu data untuk melakukan perbandingan produk.")
+    else:
+        col1, col2 = st.columns(2)
+        week_before = col1.selectbox("Pilih Minggu Pembanding:", weeks, index=0)
+        week_after = col2.selectbox("Pilih Minggu Penentu:", weeks, index=len(weeks)-1)
+        if week_before >= week_after:
+            st.error("Minggu Penentu harus setelah Minggu Pembanding.")
+        else:
+            # Dibandingkan per snapshot terakhir tiap minggu; hasil di-cache per pasangan minggu
+            wow = week_over_week_diff(data_version, start_date, end_date, week_before, week_after, latest_entries_weekly)
+            st.markdown("#### Ringkasan Perubahan per Toko")
+            st.dataframe(wow['summary'], use_container_width=True)
+
+            selected_store = st.selectbox("Lihat Detail Toko:", wow['summary'].index.tolist(), key="wow_store")
+            change_tabs = st.tabs([f"{name} ({wow['summary'].at[selected_store, name]})" for name in WOW_CHANGE_TYPES])
+            for change_tab, name in zip(change_tabs, WOW_CHANGE_TYPES):
+                with change_tab:
+                    store_changes = wow[name][wow[name]['Toko'] == selected_store].drop(columns=['Toko'])
+                    if store_changes.empty:
+                        st.write("Tidak ada perubahan yang terdeteksi.")
+                    else:
+                        st.dataframe(store_changes, use_container_width=True, hide_index=True, column_config={
+                            **rupiah_config("Harga", "Harga Sebelum", "Harga Sesudah", "Selisih Harga"),
+                            "Selisih (%)": st.column_config.NumberColumn(format="%.1f%%"),
+                        })
 
 # =========================================================================================
 # ================================ TAMPILAN KONTEN UTAMA ================================
@@ -265,268 +661,182 @@ if app_mode == "Tab Analisis":
 
 if app_mode == "Tab Analisis":
     st.header("📈 Tampilan Analisis Penjualan & Kompetitor")
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["⭐ Analisis Toko Saya", "🏆 Analisis Brand Kompetitor", "📦 Status Stok Produk", "📈 Kinerja Penjualan", "📊 Analisis Mingguan"])
-    
+    analysis_tabs = st.tabs(["⭐ Analisis Toko Saya", "🏆 Analisis Brand Kompetitor", "📦 Status Stok Produk", "📈 Kinerja Penjualan", "📊 Analisis Mingguan"], key="analysis_tab", on_change="rerun")
+    tab1, tab2, tab3, tab4, tab5 = analysis_tabs
     with tab1:
-        # ... (Logika Tab 1 tidak berubah) ...
-        st.header(f"Analisis Kinerja Toko: {MY_STORE_NAME}")
-        section_counter = 1
-        st.subheader(f"{section_counter}. Analisis Kategori Terlaris (Berdasarkan Omzet)")
-        section_counter += 1
-        if 'KATEGORI' in main_store_latest_overall.columns:
-            main_store_cat = main_store_latest_overall.copy()
-            main_store_cat['KATEGORI'] = main_store_cat['KATEGORI'].replace('', 'Lainnya').fillna('Lainnya')
-            category_sales = main_store_cat.groupby('KATEGORI')['Omzet'].sum().reset_index()
-            if not category_sales.empty:
-                cat_sales_sorted = category_sales.sort_values('Omzet', ascending=False).head(10)
-                fig_cat = px.bar(cat_sales_sorted, x='KATEGORI', y='Omzet', title='Top 10 Kategori Berdasarkan Omzet', text_auto='.2s')
-                st.plotly_chart(fig_cat, use_container_width=True)
-                st.markdown("##### Rincian Data Omzet per Kategori")
-                table_cat_sales = cat_sales_sorted.copy()
-                table_cat_sales['Omzet'] = table_cat_sales['Omzet'].apply(lambda x: f"Rp {int(x):,.0f}")
-                st.dataframe(table_cat_sales, use_container_width=True, hide_index=True)
-                st.markdown("---")
-                st.subheader("Lihat Produk Terlaris per Kategori")
-                category_list = category_sales.sort_values('Omzet', ascending=False)['KATEGORI'].tolist()
-                selected_category = st.selectbox("Pilih Kategori untuk melihat produk terlaris:", options=category_list)
-                if selected_category:
-                    products_in_category = main_store_cat[main_store_cat['KATEGORI'] == selected_category].copy()
-                    top_products_in_category = products_in_category.sort_values('Terjual per Bulan', ascending=False)
-                    if top_products_in_category.empty:
-                        st.info(f"Tidak ada produk terlaris untuk kategori '{selected_category}'.")
-                    else:
-                        columns_to_display = ['Nama Produk', 'SKU', 'Harga', 'Terjual per Bulan', 'Omzet']
-                        if 'SKU' not in top_products_in_category.columns: top_products_in_category['SKU'] = 'N/A'
-                        display_table = top_products_in_category[columns_to_display].copy()
-                        display_table['Harga'] = display_table['Harga'].apply(lambda x: f"Rp {int(x):,.0f}")
-                        display_table['Omzet'] = display_table['Omzet'].apply(lambda x: f"Rp {int(x):,.0f}")
-                        st.dataframe(display_table, use_container_width=True, hide_index=True)
-            else:
-                st.info("Tidak ada data omzet per kategori untuk ditampilkan.")
-        else:
-            st.warning("Kolom 'KATEGORI' tidak ditemukan pada data toko Anda. Analisis ini dilewati.")
-        st.subheader(f"{section_counter}. Produk Terlaris")
-        section_counter += 1
-        top_products = main_store_latest_overall.sort_values('Terjual per Bulan', ascending=False).head(15).copy()
-        top_products['Harga_rp'] = top_products['Harga'].apply(lambda x: f"Rp {int(x):,.0f}")
-        top_products['Omzet_rp'] = top_products['Omzet'].apply(lambda x: f"Rp {int(x):,.0f}")
-        display_cols_top = ['Nama Produk', 'SKU', 'Harga_rp', 'Omzet_rp', 'Terjual per Bulan']
-        if 'SKU' not in top_products.columns: top_products['SKU'] = 'N/A'
-        display_df_top = top_products[display_cols_top].rename(columns={'Harga_rp': 'Harga', 'Omzet_rp': 'Omzet'})
-        st.dataframe(display_df_top, use_container_width=True, hide_index=True)
-        st.subheader(f"{section_counter}. Distribusi Omzet Brand")
-        section_counter += 1
-        brand_omzet_main = main_store_latest_overall.groupby('Brand')['Omzet'].sum().reset_index()
-        if not brand_omzet_main.empty:
-            fig_brand_pie = px.pie(brand_omzet_main.sort_values('Omzet', ascending=False).head(7), 
-                                   names='Brand', values='Omzet', title='Distribusi Omzet Top 7 Brand (Snapshot Terakhir)')
-            fig_brand_pie.update_traces(textposition='outside', texttemplate='%{label}<br><b>Rp %{value:,.0f}</b><br>(%{percent})', insidetextfont=dict(color='white'))
-            fig_brand_pie.update_layout(showlegend=False)
-            st.plotly_chart(fig_brand_pie, use_container_width=True)
-        else:
-            st.info("Tidak ada data omzet brand.")
-        st.subheader(f"{section_counter}. Ringkasan Kinerja Mingguan (WoW Growth)")
-        section_counter += 1
-        main_store_latest_weekly = main_store_df.loc[main_store_df.groupby(['Minggu', 'Nama Produk'])['Tanggal'].idxmax()]
-        weekly_summary_tab1 = main_store_latest_weekly.groupby('Minggu').agg(
-            Omzet=('Omzet', 'sum'), Penjualan_Unit=('Terjual per Bulan', 'sum')
-        ).reset_index().sort_values('Minggu')
-        weekly_summary_tab1['Pertumbuhan Omzet (WoW)'] = weekly_summary_tab1['Omzet'].pct_change().apply(format_wow_growth)
-        weekly_summary_tab1['Omzet'] = weekly_summary_tab1['Omzet'].apply(lambda x: f"Rp {x:,.0f}")
-        st.dataframe(
-            weekly_summary_tab1[['Minggu', 'Omzet', 'Penjualan_Unit', 'Pertumbuhan Omzet (WoW)']].style.applymap(
-                style_wow_growth, subset=['Pertumbuhan Omzet (WoW)']
-            ), use_container_width=True, hide_index=True
-        )
-
+        if tab1.open:
+            with timed(run_stages, 'render.toko_saya'): render_tab_toko_saya(main_store_latest_overall, granularity)
     with tab2:
-        # ... (Logika Tab 2 tidak berubah) ...
-        st.header("Analisis Brand di Toko Kompetitor")
-        if competitor_df.empty:
-            st.warning("Tidak ada data kompetitor pada rentang tanggal ini.")
-        else:
-            competitor_list = sorted(competitor_df['Toko'].unique())
-            for competitor_store in competitor_list:
-                with st.expander(f"Analisis untuk Kompetitor: **{competitor_store}**"):
-                    single_competitor_df = competitor_latest_overall[competitor_latest_overall['Toko'] == competitor_store]
-                    brand_analysis = single_competitor_df.groupby('Brand').agg(
-                        Total_Omzet=('Omzet', 'sum'), 
-                        Total_Unit_Terjual=('Terjual per Bulan', 'sum')
-                    ).reset_index().sort_values("Total_Omzet", ascending=False)
-                    if not brand_analysis.empty:
-                        display_brand_analysis = brand_analysis.head(10).copy()
-                        display_brand_analysis['Total_Omzet'] = display_brand_analysis['Total_Omzet'].apply(lambda x: f"Rp {int(x):,.0f}")
-                        st.dataframe(display_brand_analysis, use_container_width=True, hide_index=True)
-                        fig_pie_comp = px.pie(brand_analysis.head(7), names='Brand', values='Total_Omzet', title=f'Distribusi Omzet Top 7 Brand di {competitor_store} (Snapshot Terakhir)')
-                        st.plotly_chart(fig_pie_comp, use_container_width=True)
-                    else:
-                        st.info("Tidak ada data brand untuk toko ini.")
-
+        if tab2.open:
+            with timed(run_stages, 'render.brand_kompetitor'): render_tab_brand_kompetitor(data_version, competitor_df, competitor_latest_overall, query_store)
     with tab3:
-        # ... (Logika Tab 3 tidak berubah) ...
-        st.header("Tren Status Stok Mingguan per Toko")
-        stock_trends = df_filtered.groupby(['Minggu', 'Toko', 'Status']).size().unstack(fill_value=0).reset_index()
-        if 'Tersedia' not in stock_trends.columns: stock_trends['Tersedia'] = 0
-        if 'Habis' not in stock_trends.columns: stock_trends['Habis'] = 0
-        stock_trends_melted = stock_trends.melt(id_vars=['Minggu', 'Toko'], value_vars=['Tersedia', 'Habis'], var_name='Tipe Stok', value_name='Jumlah Produk')
-        fig_stock_trends = px.line(stock_trends_melted, x='Minggu', y='Jumlah Produk', color='Toko', line_dash='Tipe Stok', markers=True, title='Jumlah Produk Tersedia vs. Habis per Minggu')
-        st.plotly_chart(fig_stock_trends, use_container_width=True)
-        st.dataframe(stock_trends.set_index('Minggu'), use_container_width=True)
-
+        if tab3.open:
+            with timed(run_stages, 'render.status_stok'): render_tab_status_stok(df_filtered, query_store, start_date, end_date)
     with tab4:
-        # ... (Logika Tab 4 tidak berubah) ...
-        st.header("Analisis Kinerja Penjualan (Semua Toko)")
-        all_stores_latest_per_week = latest_entries_weekly.groupby(['Minggu', 'Toko'])['Omzet'].sum().reset_index()
-        fig_weekly_omzet = px.line(all_stores_latest_per_week, x='Minggu', y='Omzet', color='Toko', markers=True, title='Perbandingan Omzet Mingguan Antar Toko (Berdasarkan Snapshot Terakhir)')
-        st.plotly_chart(fig_weekly_omzet, use_container_width=True)
-        st.subheader("Tabel Rincian Omzet per Tanggal")
-        if not df_filtered.empty:
-            omzet_pivot = df_filtered.pivot_table(index='Toko', columns='Tanggal', values='Omzet', aggfunc='sum').fillna(0)
-            omzet_pivot.columns = [col.strftime('%d %b %Y') for col in omzet_pivot.columns]
-            for col in omzet_pivot.columns:
-                omzet_pivot[col] = omzet_pivot[col].apply(lambda x: f"Rp {int(x):,}" if x > 0 else "-")
-            omzet_pivot.reset_index(inplace=True)
-            st.info("Anda bisa scroll tabel ini ke samping untuk melihat tanggal lainnya.")
-            st.dataframe(omzet_pivot, use_container_width=True, hide_index=True)
-        else:
-            st.warning("Tidak ada data untuk ditampilkan dalam tabel.")
-
+        if tab4.open:
+            with timed(run_stages, 'render.kinerja_penjualan'): render_tab_kinerja_penjualan(granularity, df_filtered, query_store, start_date, end_date)
     with tab5:
-        # ... (Logika Tab 5 tidak berubah) ...
-        st.header("Analisis Produk Baru Mingguan")
-        weeks = sorted(df_filtered['Minggu'].unique())
-        if len(weeks) < 2:
-            st.info("Butuh setidaknya 2 minggu data untuk melakukan perbandingan produk baru.")
-        else:
-            col1, col2 = st.columns(2)
-            week_before = col1.selectbox("Pilih Minggu Pembanding:", weeks, index=0)
-            week_after = col2.selectbox("Pilih Minggu Penentu:", weeks, index=len(weeks)-1)
-            if week_before >= week_after:
-                st.error("Minggu Penentu harus setelah Minggu Pembanding.")
-            else:
-                all_stores = sorted(df_filtered['Toko'].unique())
-                for store in all_stores:
-                    with st.expander(f"Lihat Produk Baru di Toko: **{store}**"):
-                        products_before = set(df_filtered[(df_filtered['Toko'] == store) & (df_filtered['Minggu'] == week_before) & (df_filtered['Status'] == 'Tersedia')]['Nama Produk'])
-                        products_after = set(df_filtered[(df_filtered['Toko'] == store) & (df_filtered['Minggu'] == week_after) & (df_filtered['Status'] == 'Tersedia')]['Nama Produk'])
-                        new_products = products_after - products_before
-                        if not new_products:
-                            st.write("Tidak ada produk baru yang terdeteksi.")
-                        else:
-                            st.write(f"Ditemukan **{len(new_products)}** produk baru:")
-                            new_products_df = df_filtered[df_filtered['Nama Produk'].isin(new_products) & (df_filtered['Toko'] == store) & (df_filtered['Minggu'] == week_after)].copy()
-                            new_products_df['Harga_fmt'] = new_products_df['Harga'].apply(lambda x: f"Rp {int(x):,.0f}")
-                            st.dataframe(new_products_df[['Nama Produk', 'Harga_fmt', 'Stok', 'Brand']].rename(columns={'Harga_fmt':'Harga'}), use_container_width=True, hide_index=True)
+        if tab5.open:
+            with timed(run_stages, 'render.analisis_mingguan'): render_tab_analisis_mingguan(data_version, start_date, end_date, df_filtered, latest_entries_weekly)
 
 elif app_mode == "Cari Perbandingan":
     # ... (Logika "Cari Perbandingan" tidak berubah) ...
     st.header(f"⚖️ Cari Perbandingan Produk '{MY_STORE_NAME}' (Live)")
-    st.info("Pilih produk dari toko Anda untuk dicari kemiripannya di toko kompetitor secara langsung menggunakan TF-IDF.")
-    products_to_show_df = main_store_latest_overall.copy()
-    brand_list = sorted(products_to_show_df['Brand'].unique())
-    selected_brand = st.selectbox("Filter berdasarkan Brand:", ["Semua Brand"] + brand_list, key="brand_select_compare")
-    if selected_brand != "Semua Brand":
-        products_to_show_df = products_to_show_df[products_to_show_df['Brand'] == selected_brand]
-    product_list = sorted(products_to_show_df['Nama Produk'].unique())
-    selected_product = st.selectbox("Pilih produk dari toko Anda untuk dicari:", product_list, key="product_select_compare")
-    if selected_product and st.button(f"Cari Padanan untuk '{selected_product}'", type="primary"):
-        my_product_info = main_store_latest_overall[main_store_latest_overall['Nama Produk'] == selected_product].iloc[0]
-        with st.spinner("Menganalisis kemiripan dengan produk kompetitor..."):
-            my_product_list = [selected_product]
-            competitor_product_list = competitor_latest_overall['Nama Produk'].tolist()
-            vectorizer = TfidfVectorizer(analyzer='char', ngram_range=(3, 5))
-            competitor_matrix = vectorizer.fit_transform(competitor_product_list)
-            my_product_matrix = vectorizer.transform(my_product_list)
-            cosine_sim = cosine_similarity(my_product_matrix, competitor_matrix)
-            sim_scores = cosine_sim[0]
-            matching_indices = np.where(sim_scores >= accuracy_cutoff)[0]
+    search_mode = st.radio("Mode Pencarian:", ["Satu Produk", "Seluruh Katalog (Bulk)"], horizontal=True, key="compare_search_mode")
+    with timed(run_stages, 'match.index', len(competitor_latest_overall)):
+        competitor_index = build_competitor_index(data_version, competitor_latest_overall) if not competitor_latest_overall.empty else None
+    if competitor_index is None:
+        st.warning("Belum ada data produk kompetitor untuk dibandingkan.")
+    elif search_mode == "Satu Produk":
+        st.info("Pilih produk dari toko Anda untuk dicari kemiripannya di toko kompetitor secara langsung menggunakan TF-IDF.")
+        products_to_show_df = main_store_latest_overall.copy()
+        brand_list = sorted(products_to_show_df['Brand'].unique())
+        selected_brand = st.selectbox("Filter berdasarkan Brand:", ["Semua Brand"] + brand_list, key="brand_select_compare")
+        if selected_brand != "Semua Brand":
+            products_to_show_df = products_to_show_df[products_to_show_df['Brand'] == selected_brand]
+        product_list = sorted(products_to_show_df['Nama Produk'].unique())
+        selected_product = st.selectbox("Pilih produk dari toko Anda untuk dicari:", product_list, key="product_select_compare")
+        if selected_product and st.button(f"Cari Padanan untuk '{selected_product}'", type="primary"):
+            st.session_state.compare_product = selected_product
+        compare_product = st.session_state.get('compare_product')
+        if compare_product in product_list:
+            my_product_info = main_store_latest_overall[main_store_latest_overall['Nama Produk'] == compare_product].iloc[0]
+            with st.spinner("Menganalisis kemiripan dengan produk kompetitor..."), timed(run_stages, 'match.search'):
+                if match_engine == "TF-IDF":
+                    candidates = search_competitor_index(data_version, compare_product, competitor_index)
+                else:
+                    embedding_index = build_embedding_index(data_version, competitor_index)
+                    candidates = search_embedding_index(data_version, compare_product, match_engine, competitor_index, embedding_index)
+                    for warning in embedding_index['warnings']: st.warning(warning)
+            # Slider akurasi hanya memfilter ulang skor yang sudah di-cache
+            matches = candidates[candidates['Skor Kemiripan'] >= accuracy_cutoff]
             my_price = int(my_product_info['Harga'])
-            comparison_data = [{
-                'Nama Produk Tercantum': my_product_info['Nama Produk'],
-                'Toko': f"{MY_STORE_NAME} (Anda)",
-                'Harga_num': my_price,
-                'Selisih Harga': "Rp 0 (Basis)",
-                'Skor Kemiripan': 1.0
-            }]
-            for comp_idx in matching_indices:
-                score = sim_scores[comp_idx]
-                competitor_product_row = competitor_latest_overall.iloc[comp_idx]
-                comp_price = int(competitor_product_row['Harga'])
-                price_diff = comp_price - my_price
-                diff_text = " (Sama)"
-                if price_diff > 0: diff_text = " (Lebih Mahal)"
-                elif price_diff < 0: diff_text = " (Lebih Murah)"
-                comparison_data.append({
-                    'Nama Produk Tercantum': competitor_product_row['Nama Produk'],
-                    'Toko': competitor_product_row['Toko'],
-                    'Harga_num': comp_price,
-                    'Selisih Harga': f"Rp {price_diff:,}{diff_text}",
-                    'Skor Kemiripan': score
+            price_diff = matches['Harga'].astype(int) - my_price
+            diff_text = np.select([price_diff > 0, price_diff < 0], ["Lebih Mahal", "Lebih Murah"], default="Sama")
+            comparison_df = pd.concat([
+                pd.DataFrame([{
+                    'Nama Produk Tercantum': my_product_info['Nama Produk'],
+                    'Toko': f"{MY_STORE_NAME} (Anda)",
+                    'Harga_num': my_price,
+                    'Selisih Harga': 0,
+                    'Posisi Harga': "Basis",
+                    'Skor Kemiripan': 1.0
+                }]),
+                pd.DataFrame({
+                    'Nama Produk Tercantum': matches['Nama Produk'],
+                    'Toko': matches['Toko'],
+                    'Harga_num': matches['Harga'].astype(int),
+                    'Selisih Harga': price_diff,
+                    'Posisi Harga': diff_text,
+                    'Skor Kemiripan': matches['Skor Kemiripan']
                 })
-        st.divider()
-        st.subheader("Hasil Perbandingan Harga")
-        if len(comparison_data) > 1:
-            comparison_df = pd.DataFrame(comparison_data)
-            comparison_df = comparison_df.sort_values(by='Harga_num', ascending=True).reset_index(drop=True)
-            comparison_df['Harga'] = comparison_df['Harga_num'].apply(lambda x: f"Rp {x:,}")
-            ordered_cols = ['Nama Produk Tercantum', 'Toko', 'Harga', 'Selisih Harga', 'Skor Kemiripan']
-            st.dataframe(comparison_df[ordered_cols], use_container_width=True, hide_index=True, 
-                         column_config={"Skor Kemiripan": st.column_config.ProgressColumn("Skor", format="%.2f", min_value=0.0, max_value=1.0)})
-        else:
-            st.warning(f"Tidak ditemukan produk yang cocok di toko kompetitor dengan tingkat akurasi di atas {accuracy_cutoff}.")
+            ], ignore_index=True)
+            st.divider()
+            st.subheader(f"Hasil Perbandingan Harga: {compare_product}")
+            if len(comparison_df) > 1:
+                comparison_df = comparison_df.sort_values(by='Harga_num', ascending=True).reset_index(drop=True)
+                ordered_cols = ['Nama Produk Tercantum', 'Toko', 'Harga_num', 'Selisih Harga', 'Posisi Harga', 'Skor Kemiripan']
+                st.dataframe(comparison_df[ordered_cols], use_container_width=True, hide_index=True, 
+                             column_config={"Skor Kemiripan": st.column_config.ProgressColumn("Skor", format="%.2f", min_value=0.0, max_value=1.0),
+                                            **rupiah_config('Harga_num', 'Selisih Harga', Harga_num="Harga")})
+            else:
+                st.warning(f"Tidak ditemukan produk yang cocok di toko kompetitor dengan tingkat akurasi di atas {accuracy_cutoff}.")
+        with st.expander("🧪 Benchmark Mesin Pencocokan (latensi & recall pada data sendiri)"):
+            st.caption("Kueri dibuat dari nama produk kompetitor yang diacak (urutan kata ditukar, penulisan satuan diubah). "
+                       "Recall = proporsi kueri yang menemukan kembali produk aslinya.")
+            if st.button("Jalankan Benchmark", key="run_match_benchmark"):
+                embedding_index = build_embedding_index(data_version, competitor_index) if SentenceTransformer is not None else None
+                with st.spinner("Menjalankan benchmark..."):
+                    st.session_state.match_benchmark = (data_version, benchmark_matching_engines(competitor_index, embedding_index))
+                if embedding_index is not None:
+                    for warning in embedding_index['warnings']: st.warning(warning)
+            benchmark = st.session_state.get('match_benchmark')
+            if benchmark and benchmark[0] == data_version:
+                st.dataframe(benchmark[1], use_container_width=True, hide_index=True,
+                             column_config={"Latensi per Kueri (ms)": st.column_config.NumberColumn(format="%.1f")})
+    else:
+        st.caption("Mode bulk selalu memakai mesin TF-IDF.")
+        st.info(f"Mencocokkan seluruh {len(main_store_latest_overall):,} produk '{MY_STORE_NAME}' dengan {len(competitor_latest_overall):,} produk kompetitor sekaligus.")
+        col_k, col_block = st.columns(2)
+        bulk_top_k = col_k.number_input("Jumlah kandidat per produk (top-k):", min_value=1, max_value=5, value=1, step=1)
+        block_by_brand = col_block.checkbox("Batasi kandidat ke Brand_Utama yang sama", value=True,
+                                            help="Mempersempit ruang pencarian; produk yang brand-nya tidak dijual kompetitor tidak akan mendapat padanan.")
+        if st.button("Cocokkan Seluruh Katalog", type="primary"):
+            st.session_state.bulk_match_params = (int(bulk_top_k), block_by_brand)
+        bulk_params = st.session_state.get('bulk_match_params')
+        if bulk_params:
+            progress_bar = st.progress(0.0, text="Mencocokkan katalog...")
+            with timed(run_stages, 'match.bulk', len(main_store_latest_overall)):
+                bulk_df = load_precomputed_views(data_version, MY_STORE_NAME).get('bulk_match') if bulk_params == PRECOMPUTED_MATCH_PARAMS else None
+                if bulk_df is None:
+                    bulk_df = bulk_match_cached(data_version, *bulk_params, main_store_latest_overall, competitor_index,
+                                                lambda ratio: progress_bar.progress(ratio, text=f"Mencocokkan katalog... {ratio:.0%}"))
+            progress_bar.empty()
+            # Slider akurasi hanya memfilter hasil yang sudah di-cache
+            bulk_view = bulk_df[bulk_df['Skor Kemiripan'] >= accuracy_cutoff]
+            unmatched = bulk_df['Produk Anda'].nunique() - bulk_view['Produk Anda'].nunique()
+            st.divider()
+            st.subheader("Hasil Pencocokan Katalog")
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Produk Tercocokkan", f"{bulk_view['Produk Anda'].nunique():,}")
+            m2.metric("Tanpa Padanan ≥ Akurasi", f"{unmatched:,}")
+            m3.metric("Lebih Murah di Kompetitor", f"{(bulk_view.loc[bulk_view['Peringkat'] == 1, 'Selisih Harga'] < 0).sum():,}")
+            st.dataframe(bulk_view, use_container_width=True, hide_index=True,
+                         column_config={"Skor Kemiripan": st.column_config.ProgressColumn("Skor", format="%.2f", min_value=0.0, max_value=1.0),
+                                        **rupiah_config('Harga Anda', 'Harga Kompetitor', 'Selisih Harga')})
+            download_export("📥 Unduh Hasil Pencocokan", f"pencocokan_katalog_k{bulk_params[0]}_{'brand' if bulk_params[1] else 'semua'}_{accuracy_cutoff:.2f}",
+                            lambda: bulk_view)
 
 
 elif app_mode == "HPP Produk":
-    # ... (Logika "HPP Produk" tidak berubah) ...
     st.header("💰 Tampilan Analisis Harga Pokok Penjualan (HPP)")
     if db_df.empty or 'SKU' not in db_df.columns:
         st.error("Sheet 'DATABASE' tidak ditemukan atau tidak memiliki kolom 'SKU'. Analisis HPP tidak dapat dilanjutkan.")
         st.stop()
-    if 'HPP (LATEST)' not in db_df.columns: db_df['HPP (LATEST)'] = np.nan
-    if 'HPP (AVERAGE)' not in db_df.columns: db_df['HPP (AVERAGE)'] = np.nan
-    db_df['HPP_LATEST_NUM'] = pd.to_numeric(db_df['HPP (LATEST)'], errors='coerce')
-    db_df['HPP_AVERAGE_NUM'] = pd.to_numeric(db_df['HPP (AVERAGE)'], errors='coerce')
-    db_df['HPP'] = db_df['HPP_LATEST_NUM'].fillna(db_df['HPP_AVERAGE_NUM'])
-    hpp_data = db_df[['SKU', 'HPP']].copy()
-    hpp_data.dropna(subset=['SKU', 'HPP'], inplace=True)
-    hpp_data = hpp_data[hpp_data['SKU'] != '']
-    hpp_data.drop_duplicates(subset=['SKU'], keep='first', inplace=True)
-    latest_db_klik = main_store_latest_overall.copy()
-    merged_df = pd.merge(latest_db_klik, hpp_data, on='SKU', how='left')
-    merged_df['Selisih'] = merged_df['Harga'] - merged_df['HPP']
-    df_rugi = merged_df[merged_df['Selisih'] < 0].copy()
-    df_untung = merged_df[(merged_df['Selisih'] >= 0)].copy()
-    df_tidak_ditemukan = merged_df[merged_df['HPP'].isnull()].copy()
+    hpp = hpp_views(hpp_min_score, hpp_use_fuzzy)
+    hpp_suffix = f"fuzzy_{hpp_min_score:.2f}" if hpp_use_fuzzy else "persis"
+    df_rugi, df_untung, df_tidak_ditemukan, df_usulan = hpp['rugi'], hpp['untung'], hpp['tidak_ditemukan'], hpp['usulan']
+    hpp_score_column = st.column_config.ProgressColumn("Skor", format="%.2f", min_value=0.0, max_value=1.0)
     st.subheader("🔴 Produk Lebih Murah dari HPP")
     if df_rugi.empty:
         st.success("👍 Mantap! Tidak ada produk yang dijual di bawah HPP.")
     else:
-        display_rugi = df_rugi[['Nama Produk', 'SKU', 'Harga', 'HPP', 'Selisih', 'Terjual per Bulan', 'Omzet']].copy()
-        display_rugi.rename(columns={'Terjual per Bulan': 'Terjual/Bln'}, inplace=True)
-        for col in ['Harga', 'HPP', 'Selisih', 'Omzet']:
-            display_rugi[col] = display_rugi[col].apply(format_rupiah)
-        st.dataframe(display_rugi, use_container_width=True, hide_index=True)
+        display_rugi = df_rugi[['Nama Produk', 'SKU', 'Harga', 'HPP', 'Selisih', 'Terjual per Bulan', 'Omzet', 'Pencocokan HPP']]
+        st.dataframe(display_rugi.rename(columns={'Terjual per Bulan': 'Terjual/Bln'}), use_container_width=True, hide_index=True,
+                     column_config=rupiah_config('Harga', 'HPP', 'Selisih', 'Omzet'))
+        download_export("📥 Unduh Produk di Bawah HPP", f"hpp_rugi_{hpp_suffix}", lambda: df_rugi, key="export_hpp_rugi")
     st.divider()
     st.subheader("🟢 Produk Lebih Mahal dari HPP")
     if df_untung.empty:
         st.warning("Tidak ada produk yang dijual di atas HPP.")
     else:
-        display_untung = df_untung[['Nama Produk', 'SKU', 'Harga', 'HPP', 'Selisih', 'Terjual per Bulan', 'Omzet']].copy()
-        display_untung.rename(columns={'Terjual per Bulan': 'Terjual/Bln'}, inplace=True)
-        for col in ['Harga', 'HPP', 'Selisih', 'Omzet']:
-            display_untung[col] = display_untung[col].apply(format_rupiah)
-        st.dataframe(display_untung, use_container_width=True, hide_index=True)
+        display_untung = df_untung[['Nama Produk', 'SKU', 'Harga', 'HPP', 'Selisih', 'Terjual per Bulan', 'Omzet', 'Pencocokan HPP']]
+        st.dataframe(display_untung.rename(columns={'Terjual per Bulan': 'Terjual/Bln'}), use_container_width=True, hide_index=True,
+                     column_config=rupiah_config('Harga', 'HPP', 'Selisih', 'Omzet'))
+        download_export("📥 Unduh Produk di Atas HPP", f"hpp_untung_{hpp_suffix}", lambda: df_untung, key="export_hpp_untung")
+    st.divider()
+    st.subheader("🔎 Usulan Pencocokan SKU (Fuzzy)")
+    if df_usulan.empty:
+        st.info("Tidak ada SKU yang perlu dicocokkan secara fuzzy.")
+    else:
+        st.caption("SKU yang tidak ditemukan persis di DATABASE beserta SKU DATABASE paling mirip (satu SKU DATABASE per produk). "
+                   + (f"Usulan dengan skor ≥ {hpp_min_score:.2f} dipakai untuk tabel di atas." if hpp_use_fuzzy
+                      else "Usulan tidak dipakai untuk tabel di atas; centang 'Pakai Usulan Fuzzy untuk Margin' di sidebar untuk memakainya."))
+        display_usulan = df_usulan[['Nama Produk', 'SKU', 'SKU HPP', 'Nama HPP', 'HPP', 'Skor HPP']].copy()
+        display_usulan['Dipakai'] = hpp_use_fuzzy & (df_usulan['Skor HPP'] >= hpp_min_score)
+        st.dataframe(display_usulan.rename(columns={'SKU HPP': 'SKU DATABASE', 'Nama HPP': 'Nama DATABASE'}), use_container_width=True,
+                     hide_index=True, column_config={"Skor HPP": hpp_score_column, **rupiah_config('HPP')})
+        download_export("📥 Unduh Usulan Pencocokan SKU", f"hpp_usulan_{hpp_suffix}", lambda: df_usulan, key="export_hpp_usulan")
     st.divider()
     st.subheader("❓ Produk Tidak Terdeteksi HPP-nya")
     if df_tidak_ditemukan.empty:
         st.success("👍 Semua produk yang dijual berhasil dicocokkan dengan data HPP di DATABASE.")
     else:
         st.warning("Mohon untuk mengecek data produk lagi, sepertinya ada data yang tidak akurat atau SKU tidak cocok.")
-        display_tidak_ditemukan = df_tidak_ditemukan[['Nama Produk', 'SKU', 'Harga', 'Terjual per Bulan', 'Omzet']].copy()
-        display_tidak_ditemukan.rename(columns={'Terjual per Bulan': 'Terjual/Bln'}, inplace=True)
-        for col in ['Harga', 'Omzet']:
-            display_tidak_ditemukan[col] = display_tidak_ditemukan[col].apply(format_rupiah)
-        st.dataframe(display_tidak_ditemukan, use_container_width=True, hide_index=True)
+        display_tidak_ditemukan = df_tidak_ditemukan[['Nama Produk', 'SKU', 'Harga', 'Terjual per Bulan', 'Omzet', 'SKU HPP', 'Skor HPP']]
+        st.dataframe(display_tidak_ditemukan.rename(columns={'Terjual per Bulan': 'Terjual/Bln', 'SKU HPP': 'Usulan SKU'}), use_container_width=True,
+                     hide_index=True, column_config={"Skor HPP": hpp_score_column, **rupiah_config('Harga', 'Omzet')})
+        download_export("📥 Unduh Produk Tanpa HPP", f"hpp_tidak_ditemukan_{hpp_suffix}", lambda: df_tidak_ditemukan, key="export_hpp_tidak_ditemukan")
 
 
 # --- BARU: Menambahkan tampilan utama untuk mode "Cek Brand Toko" ---
@@ -542,59 +852,42 @@ elif app_mode == "Cek Brand Toko":
         st.markdown("---")
         st.subheader(f"Hasil Analisis untuk Brand '{selected_brand}' pada TANGGAL {selected_date.strftime('%d %B %Y')}")
 
-        # Logika filter disesuaikan dengan kolom di 'df' (Kode 1)
-        # 'Brand_Utama' dari kamus, 'Tanggal' diubah ke .dt.date untuk perbandingan
-        filtered_df = df[(df['Brand_Utama'] == selected_brand) & (df['Tanggal'].dt.date == selected_date)]
+        # Angka diambil dari database query (filter tanggal & brand di SQL) bila aktif, atau dari kubus agregat
+        # per versi data (lookup indeks, tanpa memindai df)
+        if query_store:
+            brand_cube = None
+            with timed(run_stages, 'brand.sql'):
+                summary_df, filtered_df = query_brand_day(query_store, selected_brand, selected_date)
+        else:
+            with timed(run_stages, 'brand.cube', len(df)):
+                brand_cube = get_brand_cube(data_version, df)
+            filtered_df = df.iloc[brand_cube['rows'].get((pd.Timestamp(selected_date), selected_brand), [])]
 
         if filtered_df.empty:
             st.warning("Tidak ada data ditemukan untuk brand dan TANGGAL yang dipilih.")
         else:
-            # === Ringkasan Performa per Toko (Logika dari Kode 2, disesuaikan) ===
-            summary_list = []
-            # Ambil semua toko dari 'df' (Kode 1)
-            all_stores = sorted(df['Toko'].unique())
-
-            for store in all_stores:
-                store_data = filtered_df[filtered_df['Toko'] == store]
-                
-                if store_data.empty:
-                    total_omzet = 0
-                    total_terjual = 0
-                    ready_count = 0
-                    habis_count = 0
-                else:
-                    # Menggunakan kolom 'Omzet' dan 'Terjual per Bulan' dari 'df' (Kode 1)
-                    total_omzet = store_data['Omzet'].sum()
-                    total_terjual = store_data['Terjual per Bulan'].sum()
-                    ready_count = store_data[store_data['Status'] == 'Tersedia'].shape[0]
-                    habis_count = store_data[store_data['Status'] == 'Habis'].shape[0]
-
-                summary_list.append({
-                    'Toko': store,
-                    'Total Omzet per Bulan': total_omzet,
-                    'Total Produk Terjual per Bulan': total_terjual,
-                    'Jumlah Produk Ready': ready_count,
-                    'Jumlah Produk Habis': habis_count
-                })
-            
-            summary_df = pd.DataFrame(summary_list).set_index('Toko')
+            # === Ringkasan Performa per Toko ===
+            if brand_cube is not None: summary_df = brand_day_summary(brand_cube, selected_brand, selected_date)
             
             # Urutkan DataFrame berdasarkan 'Total Omzet per Bulan'
             summary_df_sorted = summary_df.sort_values(by='Total Omzet per Bulan', ascending=False)
-            
-            # Transpose DataFrame yang SUDAH diurutkan
-            pivoted_summary_df = summary_df_sorted.T
-            
-            st.markdown("#### Ringkasan Performa Brand per Toko")
 
-            # Terapkan pemformatan (logika sama seperti Kode 2)
-            styler = pivoted_summary_df.style.format(
-                "Rp {:,.0f}", subset=(pd.IndexSlice[['Total Omzet per Bulan']], slice(None))
-            ).format(
-                "{:,.0f}", subset=(pd.IndexSlice[['Total Produk Terjual per Bulan', 'Jumlah Produk Ready', 'Jumlah Produk Habis']], slice(None))
-            )
-            
-            st.dataframe(styler, use_container_width=True)
+            st.markdown("#### Ringkasan Performa Brand per Toko")
+            # Satu baris per toko agar format angka bisa lewat column_config (nilai tetap numerik & bisa diurutkan)
+            count_column = st.column_config.NumberColumn(format="%,d")
+            st.dataframe(summary_df_sorted, use_container_width=True, column_config={
+                **rupiah_config('Total Omzet per Bulan'),
+                **dict.fromkeys(['Total Produk Terjual per Bulan', 'Jumlah Produk Ready', 'Jumlah Produk Habis'], count_column),
+            })
+
+            # === Tren Pangsa Brand per Toko ===
+            trend_start = selected_date - timedelta(weeks=BRAND_TREND_WEEKS)
+            if brand_cube is None: share_trend = query_brand_share_trend(query_store, selected_brand, trend_start, selected_date)
+            else: share_trend = brand_share_trend(brand_cube, selected_brand, trend_start, selected_date)
+            if not share_trend.empty:
+                st.markdown(f"#### Tren Pangsa Omzet Brand per Toko ({BRAND_TREND_WEEKS} Minggu Terakhir)")
+                trend_long = share_trend.reset_index().melt(id_vars='Minggu', var_name='Toko', value_name='Pangsa Omzet (%)')
+                plot_lines(trend_long, 'Minggu', 'Pangsa Omzet (%)', 'Toko')
 
             # === Detail Produk per Toko (Logika dari Kode 2, disesuaikan) ===
             with st.expander("Lihat Daftar Produk Lengkap per Toko (Diurutkan berdasarkan Omzet)"):
@@ -612,12 +905,59 @@ elif app_mode == "Cek Brand Toko":
                         # Urutkan berdasarkan 'Omzet'
                         store_data_detail.sort_values(by='Omzet', ascending=False, inplace=True)
                         
-                        # Sesuaikan nama kolom ('Harga' -> 'HARGA (Rp)', 'Omzet' -> 'Omzet (Rp)')
-                        store_data_detail['HARGA (Rp)'] = store_data_detail['Harga'].apply(lambda x: f"{x:,.0f}".replace(',', '.'))
-                        store_data_detail['Omzet (Rp)'] = store_data_detail['Omzet'].apply(lambda x: f"{x:,.0f}".replace(',', '.'))
-                        
-                        # Sesuaikan kolom yang ditampilkan
-                        kolom_tampilan = ['Nama Produk', 'HARGA (Rp)', 'Terjual per Bulan', 'Omzet (Rp)', 'Status']
-                        st.dataframe(store_data_detail[kolom_tampilan], use_container_width=True, hide_index=True)
+                        # Judul kolom 'Harga' -> 'HARGA (Rp)', 'Omzet' -> 'Omzet (Rp)'; nilainya tetap numerik
+                        kolom_tampilan = ['Nama Produk', 'Harga', 'Terjual per Bulan', 'Omzet', 'Status']
+                        st.dataframe(store_data_detail[kolom_tampilan], use_container_width=True, hide_index=True,
+                                     column_config=rupiah_config('Harga', 'Omzet', Harga="HARGA (Rp)", Omzet="Omzet (Rp)"))
+
+            col_detail, col_cube = st.columns(2)
+            download_export("📥 Unduh Produk Brand Ini", f"cek_brand_{selected_brand}_{selected_date}", lambda: filtered_df,
+                            container=col_detail, key="export_brand_detail")
+            stored_cube = load_precomputed_views(data_version, MY_STORE_NAME).get('brand_cube')
+            download_export("📥 Unduh Kubus Brand (Semua Tanggal)", "kubus_brand",
+                            lambda: stored_cube if stored_cube is not None else get_brand_cube(data_version, df)['cube'].reset_index(),
+                            container=col_cube, key="export_brand_cube")
 # --- AKHIR BLOK BARU ---
 
+# ================================
+# LOG WAKTU RUN & PANEL INSTRUMENTASI
+# ================================
+run_record = log_timings('run', run_stages, mode=app_mode, data_version=data_version,
+                         seconds=round(time.perf_counter() - run_started, 4), rows=len(df))
+if show_admin_panel:
+    with admin_container:
+        st.markdown("**Waktu per tahap (run ini):**")
+        st.caption(f"Total {run_record['seconds']:.2f} detik · versi kode `{CODE_VERSION}`")
+        st.dataframe(pd.DataFrame.from_dict(run_stages, orient='index').rename_axis('Tahap').reset_index(), hide_index=True,
+                     column_config={"Detik": st.column_config.NumberColumn(format="%.3f")})
+
+        if fetch_report and fetch_report.get('stages'):
+            st.markdown("**Waktu per tahap (penyegaran terakhir):**")
+            st.dataframe(pd.DataFrame.from_dict(fetch_report['stages'], orient='index').rename_axis('Tahap').reset_index(), hide_index=True,
+                         column_config={"Detik": st.column_config.NumberColumn(format="%.3f")})
+        if fetch_report and fetch_report.get('sheet_fetch'):
+            st.markdown("**Fetch per worksheet (terlambat dulu):**")
+            sheet_fetch = pd.DataFrame(fetch_report['sheet_fetch']).sort_values('Detik', ascending=False)
+            st.dataframe(sheet_fetch, hide_index=True, column_config={"Detik": st.column_config.NumberColumn(format="%.3f")})
+
+        st.markdown("**Memori DataFrame:**")
+        frames = {'rekap (dataset)': df, 'database (dataset)': db_df, 'snapshot terakhir': base_views['latest']}
+        if history_df is not None: frames['riwayat ringkas (dataset)'] = history_df
+        if app_mode == "Tab Analisis": frames['rentang tanggal'] = range_views['filtered']
+        st.dataframe(pd.DataFrame([{'Frame': name, 'Baris': len(frame), 'MB': frame_memory_mb(frame)} for name, frame in frames.items()]),
+                     hide_index=True, column_config={"MB": st.column_config.NumberColumn(format="%.1f")})
+
+        st.markdown("**Cache hit/miss (sejak proses dimulai):**")
+        with _metrics_store()['lock']:
+            cache_stats = pd.DataFrame.from_dict(_metrics_store()['cache'], orient='index').rename_axis('Fungsi').reset_index()
+        cache_stats['Hit Rate'] = cache_stats['hit'] / (cache_stats['hit'] + cache_stats['miss'])
+        st.dataframe(cache_stats, hide_index=True, column_config={"Hit Rate": st.column_config.NumberColumn(format="percent")})
+        if TIMING_LOG_PATH: st.caption(f"Log JSON lines: `{os.path.abspath(TIMING_LOG_PATH)}`")
+
+        if st.button("Benchmark Normalisasi (100 rb baris sintetis)", key="run_normalize_benchmark"):
+            from benchmark import benchmark_normalization  # Kode khusus benchmark, dimuat hanya saat diminta
+            with st.spinner("Menjalankan benchmark normalisasi..."):
+                st.session_state.normalize_benchmark = benchmark_normalization()
+        if 'normalize_benchmark' in st.session_state:
+            st.dataframe(st.session_state.normalize_benchmark, hide_index=True,
+                         column_config={"Detik": st.column_config.NumberColumn(format="%.2f"), "Baris/detik": st.column_config.NumberColumn(format="%d")})
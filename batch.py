@@ -0,0 +1,54 @@
+"""Pipeline analitik headless (tanpa browser), mis. dijalankan malam hari lewat cron.
+
+Menyinkronkan data, menyimpan snapshot disk, lalu menghitung semua view analitik (snapshot terakhir, ringkasan
+mingguan, tabel brand kompetitor, kubus brand, daftar HPP, pencocokan katalog) ke file Feather yang langsung
+dipakai dashboard selama versi datanya sama. Konfigurasi bawaan dibaca dari .streamlit/secrets.toml atau
+variabel lingkungan DASHBOARD_<NAMA>, dan bisa ditimpa lewat argumen:
+
+    python batch.py
+    python batch.py --source data/rekap_csv --my-store "DB KLIK"   # sumber lokal: folder CSV atau file .xlsx
+    python batch.py --write-back   # tulis juga ringkasan/HPP/pencocokan ke worksheet "OUTPUT - ..." (hanya sel berubah)
+"""
+import argparse
+import sys
+
+import analytics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Menjalankan pipeline data & analitik dashboard tanpa Streamlit.")
+    parser.add_argument("--source", default=analytics.SPREADSHEET_KEY,
+                        help="Key Google Sheets, atau path folder CSV (satu file per sheet) / file .xlsx lokal.")
+    parser.add_argument("--my-store", default=analytics.MY_STORE_NAME, help="Nama toko sendiri (kolom Toko).")
+    parser.add_argument("--snapshot-dir", default=analytics.SNAPSHOT_DIR, help="Folder snapshot data yang juga dibaca dashboard.")
+    parser.add_argument("--output-dir", default=analytics.PRECOMPUTED_DIR or None, help="Folder view pra-hitung (bawaan: <snapshot-dir>/views).")
+    parser.add_argument("--full", action="store_true", help="Ambil ulang semua sheet dari awal.")
+    parser.add_argument("--skip-matching", action="store_true", help="Lewati pencocokan seluruh katalog (TF-IDF).")
+    parser.add_argument("--write-back", action="store_true", help="Tulis view hasil ke worksheet output di sumber data.")
+    args = parser.parse_args(argv)
+    if not args.source or not args.my_store:
+        parser.error("--source dan --my-store wajib diisi (atau spreadsheet_key / my_store_name di secrets.toml).")
+
+    analytics.SNAPSHOT_DIR = args.snapshot_dir
+    if args.output_dir: analytics.PRECOMPUTED_DIR = args.output_dir
+
+    report = analytics.run_batch(args.source, args.my_store, force_full=args.full, match=not args.skip_matching,
+                                 write_back=args.write_back)
+    for warning in report['warnings']: print(f"PERINGATAN: {warning}", file=sys.stderr)
+    if report['error']:
+        print(f"GAGAL: {report['error']}", file=sys.stderr)
+        return 1
+    manifest = report['manifest']
+    print(f"Versi data {manifest['version']} ({manifest['rows']:,} baris) -> {analytics._precomputed_dir()}")
+    for name, rows in manifest['views'].items(): print(f"  {name:<24}{rows:>10,} baris")
+    for stage, entry in report['stages'].items(): print(f"  [{stage}] {entry['Detik']:.3f} detik")
+    writeback = report.get('writeback')
+    if writeback:
+        print(f"Tulis balik: {writeback['api_calls']} panggilan API dalam {writeback['duration']:.2f} detik")
+        for title, entry in writeback['sheets'].items():
+            print(f"  {title:<36}{entry['Sel Dikirim']:>10,} sel dikirim ({entry['Mode']}, {entry['Panggilan Tulis']} panggilan tulis)")
+        for title, error in writeback['failed'].items(): print(f"GAGAL MENULIS {title}: {error}", file=sys.stderr)
+        if writeback['failed']: return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
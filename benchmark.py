@@ -0,0 +1,334 @@
+"""Benchmark performa pipeline dengan data sintetis, tanpa akses Google Sheets.
+
+Membangkitkan sheet REKAP (READY/HABIS per toko), DATABASE, dan kamus_brand yang realistis (katalog per brand &
+kategori, harga berubah berkala, nama produk kompetitor yang diacak), menyajikannya lewat spreadsheet palsu di
+memori, lalu mengukur setiap tahap: load_all_data (normalisasi), snapshot terakhir, pengelompokan minggu, diff
+Tab 5, agregasi Cek Brand Toko, merge HPP, dan pencocokan TF-IDF. Hasil ditulis ke laporan JSON yang bisa
+dibandingkan antar versi kode:
+
+    python benchmark.py                                   # 10rb / 100rb / 1jt baris
+    python benchmark.py --rows 100000 --stores 5 --days 30 --name-noise 0.5
+    python benchmark.py --rows 10000 --compare benchmark_report_lama.json
+"""
+import argparse
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import analytics
+
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000)
+MY_STORE = "TOKO SENDIRI"
+BRANDS = {  # Brand utama -> alias yang muncul di kolom BRAND
+    'ACER': ['Acer', 'PREDATOR'], 'ASUS': ['Asus', 'ROG'], 'LENOVO': ['Lenovo', 'LEGION'], 'HP': ['HP Inc', 'OMEN'],
+    'MSI': ['Msi'], 'LOGITECH': ['Logitech', 'LOGI'], 'REXUS': ['Rexus'], 'SAMSUNG': ['Samsung'],
+    'KINGSTON': ['Kingston', 'HYPERX'], 'SEAGATE': ['Seagate'], 'ADATA': ['Adata', 'XPG'], 'TP-LINK': ['Tplink'],
+}
+CATEGORIES = {  # Kategori -> (satuan kapasitas, pilihan kapasitas, rentang harga)
+    'LAPTOP': ('GB', (8, 16, 32), (5_000_000, 25_000_000)), 'MOUSE': ('DPI', (1600, 3200, 8000), (50_000, 1_500_000)),
+    'KEYBOARD': ('KEY', (61, 87, 104), (150_000, 2_500_000)), 'SSD': ('GB', (256, 512, 1024), (300_000, 3_000_000)),
+    'MONITOR': ('INCH', (22, 24, 27), (1_200_000, 8_000_000)), 'RAM': ('GB', (8, 16, 32), (250_000, 2_000_000)),
+    'ROUTER': ('MBPS', (300, 1200, 3000), (200_000, 2_500_000)), 'HEADSET': ('MM', (40, 50, 53), (100_000, 2_000_000)),
+}
+COLORS = ('BLACK', 'WHITE', 'SILVER', 'GREY', 'BLUE')
+MY_CARRY, COMPETITOR_CARRY = 0.8, 0.7     # Proporsi katalog yang dijual toko sendiri / kompetitor
+READY_RATIO = 0.85                         # Peluang produk berstatus READY pada suatu hari
+PRICE_EPOCH_DAYS = 14                      # Harga bisa berubah setiap 14 hari
+SEARCH_QUERIES = 50
+
+# ================================
+# SPREADSHEET PALSU & DATA SINTETIS
+# ================================
+class MemorySpreadsheet(analytics.LocalSpreadsheet):
+    """Pengganti gspread.Spreadsheet di memori ({judul sheet: list baris}); menghitung panggilan API."""
+
+    def __init__(self, sheets):
+        super().__init__(path=None)
+        self.sheets, self.calls = sheets, 0
+
+    def _titles(self):
+        return list(self.sheets)
+
+    def _sheet_values(self, title):
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.calls += 1
+        return super().worksheets()
+
+    def _write_sheet_values(self, title, rows):
+        self.sheets[title] = rows
+
+    def values_get(self, a1_range, params=None):
+        self.calls += 1
+        return super().values_get(a1_range, params)
+
+    def values_batch_get(self, ranges):
+        self.calls += 1
+        return {'valueRanges': [super(MemorySpreadsheet, self).values_get(rng) for rng in ranges]}
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.calls += 1
+        return super().add_worksheet(title, rows, cols, index)
+
+    def values_batch_update(self, body):
+        self.calls += 1
+        return super().values_batch_update(body)
+
+def _catalog(products, rng):
+    brands, categories = list(BRANDS), list(CATEGORIES)
+    catalog = []
+    for i in range(products):
+        brand, category = brands[i % len(brands)], categories[(i // len(brands)) % len(categories)]
+        unit, capacities, (low, high) = CATEGORIES[category]
+        name = f"{brand} {category} {chr(65 + i % 26)}{i:05d} {rng.choice(capacities)}{unit} {rng.choice(COLORS)}"
+        catalog.append({'brand': brand, 'category': category, 'name': name, 'price': int(rng.integers(low, high)) // 1000 * 1000})
+    return catalog
+
+def _noisy_name(name, rng):
+    """Nama versi toko lain: kata ditukar / satuan ditulis beda, kadang huruf kecil atau spasi ganda."""
+    noisy = analytics._perturb_name(name, rng)
+    if rng.random() < 0.3: noisy = noisy.lower()
+    if rng.random() < 0.2: noisy = noisy.replace(' ', '  ', 1)
+    return noisy
+
+def synthetic_sheets(stores=8, products=2000, days=60, name_noise=0.3, seed=42):
+    """Sheet sintetis {judul: list baris} berformat seperti respons Sheets API (baris sudah dipangkas)."""
+    rng = np.random.default_rng(seed)
+    catalog = _catalog(products, rng)
+    start = pd.Timestamp('2025-01-01')
+    dates = [(start + pd.Timedelta(days=d)).strftime('%d/%m/%Y') for d in range(days)]
+    numbers = [str(n) for n in range(501)]
+    sheets = {}
+    for store in range(stores):
+        is_mine = store == 0
+        title = MY_STORE if is_mine else f"KOMPETITOR {store:02d}"
+        carried = np.flatnonzero(rng.random(products) < (MY_CARRY if is_mine else COMPETITOR_CARRY))
+        names = [catalog[p]['name'] if is_mine or rng.random() >= name_noise else _noisy_name(catalog[p]['name'], rng) for p in carried]
+        brands = [str(rng.choice(BRANDS[catalog[p]['brand']])) if rng.random() < 0.2 else catalog[p]['brand'] for p in carried]
+        categories = [catalog[p]['category'] for p in carried]
+        skus = [f"SKU-{p:06d}" for p in carried]
+        store_factor = rng.uniform(0.9, 1.1, len(carried))
+        prices = {}  # (epoch, posisi) -> teks harga, dibuat sekali per periode harga
+
+        def price_text(epoch, j):
+            key = (epoch, j)
+            if key not in prices:
+                drift = 1 + 0.03 * np.sin(epoch + j)  # Perubahan harga deterministik per periode
+                prices[key] = f"Rp {int(catalog[carried[j]]['price'] * store_factor[j] * drift) // 1000 * 1000:,}".replace(',', '.')
+            return prices[key]
+
+        header = ['TANGGAL', 'NAMA', 'HARGA', 'TERJUAL/BLN', 'BRAND', 'STOK'] + (['SKU'] if is_mine else []) + ['KATEGORI']
+        ready, habis = [header], [list(header)]
+        for day, date in enumerate(dates):
+            is_ready = rng.random(len(carried)) < READY_RATIO
+            sold = rng.integers(0, 500, len(carried))
+            stock = rng.integers(1, 100, len(carried))
+            for j in range(len(carried)):
+                row = [date, names[j], price_text(day // PRICE_EPOCH_DAYS, j), numbers[sold[j]], brands[j],
+                       numbers[stock[j]] if is_ready[j] else '0'] + ([skus[j]] if is_mine else []) + [categories[j]]
+                (ready if is_ready[j] else habis).append(row)
+        sheets[f"{title} - REKAP - READY"] = ready
+        sheets[f"{title} - REKAP - HABIS"] = habis
+
+    database = [['SKU', 'NAMA', 'HPP (LATEST)', 'HPP (AVERAGE)']]
+    for p, item in enumerate(catalog):
+        if rng.random() < 0.03: continue  # SKU yang belum terdaftar di DATABASE
+        hpp = int(item['price'] * rng.uniform(0.75, 1.05))
+        database.append([f"SKU-{p:06d}", item['name'], '' if rng.random() < 0.05 else str(hpp), str(int(hpp * rng.uniform(0.95, 1.05)))])
+    sheets['DATABASE'] = database
+    sheets['kamus_brand'] = [['Alias', 'Brand_Utama']] + [[alias, brand] for brand, aliases in BRANDS.items() for alias in aliases]
+    return sheets
+
+def shape_for_rows(rows, stores, products=None, days=None):
+    """(products, days) agar jumlah baris REKAP mendekati `rows`; yang tidak diberikan diturunkan dari yang lain."""
+    listings_per_product = MY_CARRY + (stores - 1) * COMPETITOR_CARRY
+    if products is None:
+        days = days or 60
+        products = max(20, round(rows / (days * listings_per_product)))
+    else:
+        days = days or max(14, math.ceil(rows / (products * listings_per_product)))
+    return products, days
+
+# ================================
+# BENCHMARK NORMALISASI (PANEL ADMIN DASHBOARD)
+# ================================
+def _normalize_rekap_legacy(rekap_df, kamus_df):
+    """Pipeline normalisasi sebelum optimasi (tebak format tanggal, regex harga, kamus via iterrows), sebagai pembanding."""
+    kamus_brand = {row['Alias'].upper(): row['Brand_Utama'].upper() for _, row in kamus_df.iterrows()}
+    rekap_df = rekap_df.copy()
+    rekap_df.columns = [str(c).strip().upper() for c in rekap_df.columns]
+    rekap_df.rename(columns={'NAMA': 'Nama Produk', 'TERJUAL/BLN': 'Terjual per Bulan', 'TANGGAL': 'Tanggal', 'HARGA': 'Harga',
+                             'BRAND': 'Brand', 'STOK': 'Stok', 'TOKO': 'Toko', 'STATUS': 'Status'}, inplace=True)
+    rekap_df['Nama Produk'] = rekap_df['Nama Produk'].astype(str).str.strip()
+    rekap_df['Tanggal'] = pd.to_datetime(rekap_df['Tanggal'], errors='coerce', dayfirst=True)
+    rekap_df['Harga'] = pd.to_numeric(rekap_df['Harga'].astype(str).str.replace(r'[^\d]', '', regex=True), errors='coerce')
+    rekap_df['Terjual per Bulan'] = pd.to_numeric(rekap_df['Terjual per Bulan'], errors='coerce').fillna(0)
+    rekap_df.dropna(subset=analytics.REQUIRED_COLUMNS, inplace=True)
+    rekap_df['Omzet'] = (rekap_df['Harga'].fillna(0) * rekap_df['Terjual per Bulan'].fillna(0)).astype(int)
+    brand_upper = rekap_df['Brand'].str.upper()
+    rekap_df['Brand_Utama'] = brand_upper.map(kamus_brand).fillna(brand_upper)
+    return rekap_df
+
+def _synthetic_sheet_values(rows, rng, store):
+    """Baris mentah REKAP sintetis (format seperti hasil API Sheets): 500 produk yang dicatat ulang setiap hari,
+    ~1% baris bertanggal kosong, ~1/3 baris tanpa STOK."""
+    products = 500
+    dates = (pd.Timestamp('2025-01-01') + pd.to_timedelta(np.arange(rows) // products, unit='D')).strftime('%d/%m/%Y').tolist()
+    prices = rng.integers(10_000, 20_000_000, products) // 1000 * 1000
+    values = [['TANGGAL', 'NAMA', 'HARGA', 'TERJUAL/BLN', 'BRAND', 'STOK']]
+    for i in range(rows):
+        product = i % products
+        price = prices[product] + (i // products // 30) * 1000  # Harga naik tiap ~30 hari
+        row = ['' if i % 100 == 99 else dates[i], f" PRODUK {store} {product} ", f"Rp {price:,}".replace(',', '.'),
+               str(product % 50), f"BRAND{product % 40}", 'Tersedia']
+        values.append(row[:-1] if i % 3 == 0 else row)
+    return values
+
+def benchmark_normalization(total_rows=100_000, sheets=20, seed=42):
+    """Baris/detik normalisasi lama (sekuensial) vs baru (format terdeteksi, harga numpy, paralel) pada data sintetis.
+
+    Kedua jalur diakhiri concat + kompaksi seperti di `load_all_data`, dan ~1/3 baris dibuat lebih pendek
+    dari header (sel kosong di ujung baris tidak dikirim oleh API Sheets).
+    """
+    rng = np.random.default_rng(seed)
+    items = [(f"Toko {i} - REKAP - READY", _synthetic_sheet_values(total_rows // sheets, rng, i)) for i in range(sheets)]
+    kamus_df = pd.DataFrame({'Alias': [f"brand{i}" for i in range(40)], 'Brand_Utama': [f"UTAMA{i % 10}" for i in range(40)]})
+    results = []
+
+    started = time.perf_counter()
+    legacy = pd.concat([_normalize_rekap_legacy(analytics._rekap_sheet_to_df(title, values), kamus_df) for title, values in items], ignore_index=True)
+    legacy = analytics.compact_rekap(legacy)
+    results.append({'Pipeline': 'Sebelumnya (sekuensial, tebak format, regex)', 'Baris': len(legacy), 'Detik': time.perf_counter() - started})
+
+    started = time.perf_counter()
+    built = analytics._build_sheet_states(items, analytics._build_kamus_brand(kamus_df), analytics.new_fetch_report())
+    optimized = analytics.compact_rekap(pd.concat([state['frame'] for state in built.values()], ignore_index=True))
+    results.append({'Pipeline': f'Baru ({analytics.NORMALIZE_MAX_WORKERS} thread, format terdeteksi, harga numpy)', 'Baris': len(optimized), 'Detik': time.perf_counter() - started})
+
+    result = pd.DataFrame(results)
+    result['Baris/detik'] = result['Baris'] / result['Detik']
+    return result
+
+# ================================
+# PENGUKURAN
+# ================================
+def _timed(stages, stage, fn, rows=None):
+    started = time.perf_counter()
+    result = fn()
+    stages[stage] = {'seconds': round(time.perf_counter() - started, 4), 'rows': rows}
+    return result
+
+def run_size(target_rows, stores, products, days, name_noise, seed):
+    """Menjalankan semua tahap untuk satu ukuran data; mengembalikan dict hasil untuk laporan."""
+    stages = {}
+    sheets = _timed(stages, 'generate', lambda: synthetic_sheets(stores, products, days, name_noise, seed))
+    spreadsheet = MemorySpreadsheet(sheets)
+    key = f"benchmark-{target_rows}-{seed}"
+    rekap_df, database_df, report = _timed(stages, 'load_all_data', lambda: analytics.load_all_data(key, force_full=True, spreadsheet=spreadsheet))
+    if report['error']: raise RuntimeError(report['error'])
+    rows = len(rekap_df)
+    stages['load_all_data']['rows'] = rows
+    for stage, entry in report['stages'].items():
+        stages[f"load_all_data/{stage}"] = {'seconds': round(entry['Detik'], 4), 'rows': entry['Baris']}
+
+    version = report['data_version']
+    latest = _timed(stages, 'latest_snapshot', lambda: analytics.latest_snapshot(rekap_df, ['Toko', 'Nama Produk']), rows)
+    minggu = _timed(stages, 'week_bucketing', lambda: analytics.week_start(rekap_df['Tanggal']), rows)
+    with_week = rekap_df.assign(Minggu=minggu)
+    latest_weekly = _timed(stages, 'weekly_snapshot', lambda: analytics.latest_snapshot(with_week, ['Minggu', 'Toko', 'Nama Produk']), rows)
+    with_month = rekap_df.assign(Periode=analytics.bucket_start(rekap_df['Tanggal'], 'M'))
+    _timed(stages, 'monthly_snapshot', lambda: analytics.latest_snapshot(with_month, ['Periode', 'Toko', 'Nama Produk']), rows)
+    analytics.get_base_views(version, rekap_df, MY_STORE)  # Dimensi kalender (cache) di luar pengukuran
+    daily_omzet = _timed(stages, 'rolling_omzet', lambda: analytics.get_daily_omzet.__wrapped__(version, rekap_df, MY_STORE), rows)
+    daily_long = daily_omzet['daily'].reset_index().melt(id_vars='Tanggal', var_name='Toko', value_name='Omzet')
+    _timed(stages, 'chart_downsample', lambda: analytics.downsample_series(daily_long, 'Tanggal', 'Omzet', ['Toko'], 100), len(daily_long))
+    weeks = sorted(latest_weekly['Minggu'].unique())
+    if len(weeks) >= 2:
+        start_date, end_date = rekap_df['Tanggal'].min().date(), rekap_df['Tanggal'].max().date()
+        _timed(stages, 'wow_diff', lambda: analytics.week_over_week_diff.__wrapped__(version, start_date, end_date, weeks[-2], weeks[-1], latest_weekly), len(latest_weekly))
+
+    def cek_brand():
+        cube = analytics.get_brand_cube.__wrapped__(version, rekap_df)
+        last_day = rekap_df['Tanggal'].max()
+        for brand in list(BRANDS)[:3]:
+            analytics.brand_day_summary(cube, brand, last_day)
+            analytics.brand_share_trend(cube, brand, last_day - pd.Timedelta(weeks=analytics.BRAND_TREND_WEEKS), last_day)
+    _timed(stages, 'brand_cube', cek_brand, rows)
+
+    main_latest, competitor_latest = latest[latest['Toko'] == MY_STORE], latest[latest['Toko'] != MY_STORE]
+    _timed(stages, 'hpp_merge', lambda: analytics.hpp_comparison(main_latest, database_df), len(main_latest))
+    index = _timed(stages, 'tfidf_index', lambda: analytics.build_competitor_index.__wrapped__(version, competitor_latest), len(competitor_latest))
+    queries = main_latest['Nama Produk'].astype(str).head(SEARCH_QUERIES).tolist()
+    _timed(stages, 'tfidf_search', lambda: [analytics.tfidf_top_k(index, query) for query in queries], len(queries))
+    _timed(stages, 'tfidf_bulk_match', lambda: analytics.bulk_match_catalog(main_latest, index, top_k=1, block_by_brand=True), len(main_latest))
+    return {'target_rows': target_rows, 'rows': rows, 'stores': stores, 'products': products, 'days': days,
+            'memory_mb': round(analytics.frame_memory_mb(rekap_df), 1), 'stages': stages}
+
+def _best_of(results):
+    """Menggabungkan beberapa pengulangan: waktu minimum per tahap."""
+    best = dict(results[0], stages={})
+    for stage in results[0]['stages']:
+        best['stages'][stage] = min((r['stages'][stage] for r in results if stage in r['stages']), key=lambda e: e['seconds'])
+    return best
+
+def compare_reports(baseline, current):
+    """Tabel perbandingan (target baris, tahap) -> detik lama, detik baru, rasio baru/lama."""
+    rows = []
+    old = {(size['target_rows'], stage): entry['seconds'] for size in baseline['sizes'] for stage, entry in size['stages'].items()}
+    for size in current['sizes']:
+        for stage, entry in size['stages'].items():
+            before = old.get((size['target_rows'], stage))
+            rows.append({'Baris': size['target_rows'], 'Tahap': stage, 'Lama (s)': before, 'Baru (s)': entry['seconds'],
+                         'Rasio': round(entry['seconds'] / before, 2) if before else None})
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline dashboard dengan data sintetis (tanpa Google Sheets).")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="Target jumlah baris REKAP per ukuran.")
+    parser.add_argument("--stores", type=int, default=8, help="Jumlah toko (termasuk toko sendiri).")
+    parser.add_argument("--products", type=int, default=None, help="Ukuran katalog; bawaan diturunkan dari --rows dan --days.")
+    parser.add_argument("--days", type=int, default=None, help="Jumlah hari data (bawaan 60, atau diturunkan dari --products).")
+    parser.add_argument("--name-noise", type=float, default=0.3, help="Proporsi nama produk kompetitor yang diacak (0-1).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="Jumlah pengulangan per ukuran (diambil waktu tercepat).")
+    parser.add_argument("--output", default="benchmark_report.json", help="Path laporan JSON.")
+    parser.add_argument("--compare", default=None, help="Laporan JSON sebelumnya untuk dibandingkan.")
+    args = parser.parse_args(argv)
+
+    analytics.SNAPSHOT_DIR = tempfile.mkdtemp(prefix="benchmark_snapshot_")
+    analytics.TIMING_LOG_PATH = ""
+    report = {
+        'kind': 'benchmark', 'created_at': datetime.now().isoformat(timespec='seconds'), 'code_version': analytics.CODE_VERSION,
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                        'scikit-learn': sklearn.__version__, 'platform': platform.platform(), 'machine': platform.machine()},
+        'params': {'stores': args.stores, 'products': args.products, 'days': args.days, 'name_noise': args.name_noise,
+                   'seed': args.seed, 'repeat': args.repeat},
+        'sizes': [],
+    }
+    for target_rows in args.rows:
+        products, days = shape_for_rows(target_rows, args.stores, args.products, args.days)
+        print(f"== {target_rows:,} baris ({args.stores} toko x {products:,} produk x {days} hari)", flush=True)
+        result = _best_of([run_size(target_rows, args.stores, products, days, args.name_noise, args.seed) for _ in range(args.repeat)])
+        report['sizes'].append(result)
+        for stage, entry in result['stages'].items():
+            print(f"   {stage:<40}{entry['seconds']:>10.3f} s")
+
+    with open(args.output, 'w', encoding='utf-8') as f: json.dump(report, f, indent=2)
+    print(f"Laporan: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f: baseline = json.load(f)
+        print(f"Dibandingkan dengan versi kode {baseline.get('code_version')} ({baseline.get('created_at')}):")
+        print(compare_reports(baseline, report).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""Konfigurasi pytest: modul dashboard diimpor dari root repo tanpa runtime Streamlit (lihat batch.py)."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics  # Tanpa runtime Streamlit: log cache st.* diredam oleh analytics.quiet_streamlit_logging
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Snapshot, state tulis balik, dan cache embedding per tes di folder sementara; log waktu tidak ditulis."""
+    monkeypatch.setattr(analytics, 'SNAPSHOT_DIR', str(tmp_path / 'snapshot'))
+    monkeypatch.setattr(analytics, 'EMBEDDING_CACHE_DIR', str(tmp_path / 'embedding'))
+    monkeypatch.setattr(analytics, 'TIMING_LOG_PATH', '')
+    return tmp_path
@@ -0,0 +1,69 @@
+"""Resolusi Brand_Utama: kolom Brand di kamus, lalu alias di nama produk, lalu Brand / kata pertama nama."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import analytics
+
+KAMUS = analytics._build_kamus_brand(pd.DataFrame({
+    'Alias': ['Predator', 'Acer', 'Logi', 'Logitech', 'TP', 'TP LINK', 'Rog'],
+    'Brand_Utama': ['ACER', 'ACER', 'LOGITECH', 'LOGITECH', 'TPX', 'TP-LINK', 'ASUS'],
+}))
+
+def _resolve(brand, name, kamus=KAMUS):
+    return analytics._map_brand_utama(pd.DataFrame({'Brand': [brand], 'Nama Produk': [name]}), kamus)[0]
+
+@pytest.mark.parametrize('brand, name, expected', [
+    ('Predator', 'Laptop Gaming Helios', 'ACER'),     # 1. alias di kolom Brand
+    ('acer', 'Laptop Aspire 5', 'ACER'),
+    ('ASUS', 'Laptop Vivobook', 'ASUS'),             # 1. sudah berupa brand utama
+    ('Logi', 'Mouse ASUS ROG Edition', 'LOGITECH'),  # 1. menang atas alias di nama
+])
+def test_known_brand_column_wins(brand, name, expected):
+    assert _resolve(brand, name) == expected
+
+@pytest.mark.parametrize('brand, name, expected', [
+    ('Toko Resmi', 'Mouse Logitech G102', 'LOGITECH'),      # 2. alias di nama
+    ('', 'ROG Strix Logitech Bundle', 'ASUS'),              # 2. alias yang mulai paling awal
+    ('XYZ', 'Router tp-link Archer C6', 'TP-LINK'),         # 2. alias terpanjang pada posisi yang sama
+    ('XYZ', 'Router tp.link Archer', 'TP-LINK'),            # tanda baca diabaikan
+    ('XYZ', 'Kabel TP 2m', 'TPX'),
+])
+def test_alias_in_name_used_for_unknown_brand(brand, name, expected):
+    assert _resolve(brand, name) == expected
+
+@pytest.mark.parametrize('brand, name, expected', [
+    ('Zyrex', 'Laptop Sky 232', 'ZYREX'),                   # 3. Brand apa adanya
+    ('', '[PROMO] Ori Zyrex Laptop', 'ZYREX'),              # 3. kata pertama nama di luar tag & kata promosi
+    ('ORIGINAL', 'Bundle Samsung SSD', 'SAMSUNG'),
+])
+def test_fallback_to_brand_or_first_name_word(brand, name, expected):
+    assert _resolve(brand, name) == expected
+
+def test_empty_kamus_uses_fallback_only():
+    assert _resolve('', 'Promo Logitech Mouse', kamus={}) == 'LOGITECH'
+
+def test_scan_names_returns_none_without_alias():
+    resolver = analytics.BrandResolver(KAMUS)
+    assert resolver.scan_names(['MOUSE LOGI M170', 'KABEL DATA']) == ['LOGITECH', None]
+
+def test_brand_resolver_reused_for_same_kamus_across_threads():
+    kamus = {**KAMUS, 'UJI': 'UJI'}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        resolvers = list(pool.map(lambda _: analytics.brand_resolver(dict(kamus)), range(32)))
+    assert all(resolver is resolvers[0] for resolver in resolvers)
+    assert analytics.brand_resolver(KAMUS) is not resolvers[0]
+
+def test_brand_cube_keeps_fractional_terjual_like_sql():
+    rekap = pd.DataFrame({
+        'Tanggal': pd.to_datetime(['2026-01-05 08:00', '2026-01-05 09:00', '2026-01-05 10:00']),
+        'Toko': ['A', 'A', 'B'], 'Nama Produk': ['Mouse 1', 'Mouse 2', 'Mouse 3'],
+        'Brand_Utama': ['LOGITECH'] * 3, 'Status': ['Tersedia', 'Habis', 'Tersedia'],
+        'Harga': [100, 200, 300], 'Terjual per Bulan': [1.5, 2.25, 0.5], 'Omzet': [150, 450, 150],
+    })
+    summary = analytics.brand_day_summary(analytics.get_brand_cube('uji-terjual-pecahan', rekap), 'LOGITECH', '2026-01-05')
+    assert summary['Total Produk Terjual per Bulan'].tolist() == [3.75, 0.5]
+    analytics.save_query_store('uji', rekap, 'uji-terjual-pecahan', backend='sqlite')
+    sql_summary, _ = analytics.query_brand_day(analytics.open_query_store('uji', 'uji-terjual-pecahan', backend='sqlite'), 'LOGITECH', '2026-01-05')
+    pd.testing.assert_frame_equal(summary, sql_summary, check_dtype=False)
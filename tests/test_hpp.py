@@ -0,0 +1,83 @@
+"""Pencocokan SKU produk sendiri ke sheet DATABASE (`reconcile_hpp`) dan tabel rugi/untung (`hpp_comparison`)."""
+import pandas as pd
+import pytest
+
+import analytics
+
+needs_levenshtein = pytest.mark.skipif(analytics.Levenshtein is None, reason="python-levenshtein belum terpasang")
+
+def _database(rows):
+    return pd.DataFrame(rows, columns=['SKU', 'NAMA', 'HPP (LATEST)', 'HPP (AVERAGE)'])
+
+def _products(rows):
+    frame = pd.DataFrame(rows, columns=['SKU', 'Nama Produk', 'Harga'])
+    frame['Brand_Utama'] = frame['Nama Produk'].str.split().str[0].str.upper()
+    frame['Terjual per Bulan'], frame['Omzet'] = 1, frame['Harga']
+    return frame
+
+def _reconcile(products, database):
+    return analytics.reconcile_hpp(products, analytics.build_hpp_index(database, products['Brand_Utama'].unique()))
+
+def test_exact_and_normalized_matches():
+    database = _database([['LGT-9001', 'LOGITECH MOUSE 9001', '100000', ''], ['ACM 55', 'ACME KABEL', '', '20000']])
+    matches = _reconcile(_products([['LGT-9001', 'Logitech Mouse 9001', 90_000], ['acm-55', 'Acme Kabel', 25_000]]), database)
+    assert matches['Pencocokan HPP'].tolist() == [analytics.HPP_MATCH_EXACT, analytics.HPP_MATCH_NORMALIZED]
+    assert matches['SKU HPP'].tolist() == ['LGT-9001', 'ACM 55']
+    assert matches['HPP'].tolist() == [100_000, 20_000]  # HPP (AVERAGE) jika HPP (LATEST) kosong
+    assert matches['Skor HPP'].tolist() == [1.0, 1.0]
+
+def test_unknown_sku_without_candidates_is_unmatched():
+    matches = _reconcile(_products([['ZZZ-1', 'Zyrex Laptop', 1]]), _database([['LGT9001', 'LOGITECH MOUSE', '1', '']]))
+    assert matches['SKU HPP'].isna().all() and matches['Pencocokan HPP'].isna().all()
+
+@needs_levenshtein
+def test_fuzzy_match_for_store_prefixed_sku():
+    database = _database([['LGT9001', 'LOGITECH MOUSE G9001', '100000', '']])
+    matches = _reconcile(_products([['DBK-LGT9001', 'Logitech Mouse G9001', 90_000]]), database)
+    assert matches.at[0, 'Pencocokan HPP'] == analytics.HPP_MATCH_FUZZY
+    assert matches.at[0, 'SKU HPP'] == 'LGT9001'
+    assert analytics.HPP_FUZZY_MIN_SCORE <= matches.at[0, 'Skor HPP'] < 1.0
+
+@needs_levenshtein
+def test_trailing_digit_variant_is_not_proposed():
+    database = _database([['LGT9000', 'LOGITECH MOUSE 9000', '100000', '']])
+    matches = _reconcile(_products([['LGT9001', 'Logitech Mouse 9001', 90_000]]), database)
+    assert matches['SKU HPP'].isna().all()
+
+@needs_levenshtein
+def test_variant_penalty_prefers_non_variant_candidate():
+    database = _database([['LGT9000', 'LOGITECH MOUSE', '1', ''], ['LGT9001B', 'LOGITECH MOUSE', '2', '']])
+    matches = _reconcile(_products([['LGT9001', 'Logitech Mouse', 3]]), database)
+    assert matches.at[0, 'SKU HPP'] == 'LGT9001B'
+
+@needs_levenshtein
+def test_fuzzy_matches_are_one_to_one():
+    database = _database([['LGT9001', 'LOGITECH MOUSE G9001', '100000', '']])
+    products = _products([['LGT9001-XL', 'Logitech Mouse G9001 Hitam', 90_000], ['LGT9001X', 'Logitech Mouse G9001', 95_000]])
+    matches = _reconcile(products, database)
+    assert matches['SKU HPP'].fillna('').tolist() == ['', 'LGT9001']
+    # Kandidat dengan skor tertinggi yang menang, tidak bergantung urutan baris
+    reversed_matches = _reconcile(products.iloc[::-1].reset_index(drop=True), database)
+    assert matches.loc[matches['SKU HPP'].notna(), 'Skor HPP'].item() == reversed_matches['Skor HPP'].max()
+    assert reversed_matches['SKU HPP'].notna().sum() == 1
+
+@needs_levenshtein
+def test_row_taken_by_exact_match_is_not_reused():
+    database = _database([['LGT9001', 'LOGITECH MOUSE G9001', '100000', '']])
+    matches = _reconcile(_products([['LGT9001', 'Logitech Mouse G9001', 1], ['DBK-LGT9001', 'Logitech Mouse G9001', 2]]), database)
+    assert matches['Pencocokan HPP'].tolist() == [analytics.HPP_MATCH_EXACT, None]
+
+@needs_levenshtein
+def test_fuzzy_suggestions_only_count_towards_margin_when_opted_in():
+    database = _database([['LGT9001', 'LOGITECH MOUSE G9001', '100000', ''], ['ACM55', 'ACME KABEL', '20000', '']])
+    products = _products([['DBK-LGT9001', 'Logitech Mouse G9001', 90_000], ['ACM55', 'Acme Kabel', 25_000]])
+    default = analytics.hpp_comparison(products, database)
+    assert default['rugi'].empty
+    assert default['untung']['SKU'].tolist() == ['ACM55']
+    assert default['tidak_ditemukan']['SKU'].tolist() == ['DBK-LGT9001']
+    assert default['usulan']['SKU HPP'].tolist() == ['LGT9001']
+    opted_in = analytics.hpp_comparison(products, database, use_fuzzy=True)
+    assert opted_in['rugi']['SKU'].tolist() == ['DBK-LGT9001']
+    assert opted_in['rugi']['Selisih'].tolist() == [-10_000]
+    strict = analytics.hpp_comparison(products, database, min_score=1.0, use_fuzzy=True)
+    assert strict['tidak_ditemukan']['SKU'].tolist() == ['DBK-LGT9001']
@@ -0,0 +1,61 @@
+"""Parsing harga & deteksi format TANGGAL pada normalisasi REKAP."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import analytics
+
+def _regex_price(values):
+    return pd.to_numeric(values.astype(str).str.replace(r'[^0-9]', '', regex=True), errors='coerce')
+
+# ================================
+# parse_price
+# ================================
+@pytest.mark.parametrize('text, expected', [
+    ('Rp 1.250.000', 1_250_000), ('15000', 15_000), ('Rp15,000', 15_000), ('IDR 7 500', 7_500), ('0', 0),
+])
+def test_parse_price_joins_all_digits(text, expected):
+    assert analytics.parse_price(pd.Series([text]))[0] == expected
+
+@pytest.mark.parametrize('text', ['', 'Rp -', 'habis', 'nan'])
+def test_parse_price_without_digits_is_nan(text):
+    assert np.isnan(analytics.parse_price(pd.Series([text]))[0])
+
+def test_parse_price_matches_regex_path_and_keeps_index():
+    values = pd.Series(['Rp 1.250.000', '', 'x' * (analytics.PRICE_VECTOR_MAX_CHARS + 5) + '42', '9' * 19, 'Rp 2.000', None],
+                       index=[10, 11, 12, 13, 14, 15])
+    result = analytics.parse_price(values)
+    assert result.index.equals(values.index)
+    pd.testing.assert_series_equal(result, _regex_price(values).astype(float), check_names=False)
+
+def test_parse_price_numeric_cells():
+    assert analytics.parse_price(pd.Series([15000, 2500]).astype(object)).tolist() == [15000, 2500]
+
+# ================================
+# detect_date_format
+# ================================
+@pytest.mark.parametrize('values, expected', [
+    (['01/02/2025', '13/02/2025'], '%d/%m/%Y'),
+    (['01/02/2025 08:30:00', '13/02/2025 17:05:59'], '%d/%m/%Y %H:%M:%S'),
+    (['2025-02-01', '2025-02-13'], '%Y-%m-%d'),
+    (['01-02-2025', '28-02-2025'], '%d-%m-%Y'),
+    (['01/02/25', '13/02/25'], '%d/%m/%y'),
+])
+def test_detect_date_format(values, expected):
+    assert analytics.detect_date_format(pd.Series(values)) == expected
+
+def test_detect_date_format_is_day_first():
+    # 01/02/2025 cocok dengan kedua urutan; format hari lebih dulu diuji lebih dulu
+    assert analytics.detect_date_format(pd.Series(['01/02/2025', '03/04/2025'])) == '%d/%m/%Y'
+
+def test_detect_date_format_ignores_blank_cells():
+    assert analytics.detect_date_format(pd.Series(['', ' ', '05/06/2025'])) == '%d/%m/%Y'
+
+@pytest.mark.parametrize('values', [[], ['', ''], ['01/02/2025', '2025-02-13'], ['kemarin']])
+def test_detect_date_format_none_when_no_single_format_fits(values):
+    assert analytics.detect_date_format(pd.Series(values, dtype=object)) is None
+
+def test_parse_dates_retries_rows_that_do_not_match_format():
+    parsed = analytics.parse_dates(pd.Series(['01/02/2025', '2025-02-13', '']), '%d/%m/%Y')
+    assert parsed.tolist()[:2] == [pd.Timestamp('2025-02-01'), pd.Timestamp('2025-02-13')]
+    assert pd.isna(parsed[2])
@@ -0,0 +1,103 @@
+"""Sinkronisasi delta sheet REKAP (`sync_rekap_data`): baris baru ditambahkan, sheet yang ditulis ulang diambil penuh."""
+import pandas as pd
+
+import analytics
+from benchmark import MemorySpreadsheet
+
+TITLE = "Toko A - REKAP - READY"
+HEADER = ['TANGGAL', 'NAMA', 'HARGA', 'TERJUAL/BLN', 'BRAND']
+
+def _row(day, name, price):
+    return [f"{day:02d}/01/2025", name, f"Rp {price:,}".replace(',', '.'), '3', 'ACME']
+
+def _sheets():
+    return {TITLE: [HEADER] + [_row(day, f"PRODUK {i}", 10_000 * (i + 1)) for day in (1, 2) for i in range(3)]}
+
+def _sync(spreadsheet, state, force_full=False):
+    rekap_df, _, report = analytics.sync_rekap_data(spreadsheet, state, force_full=force_full)
+    return rekap_df, report['sync'].get(TITLE)
+
+def _full(sheets):
+    return _sync(MemorySpreadsheet(sheets), {'sheets': {}, 'kamus': None})[0]
+
+def _same(left, right):
+    columns = ['Tanggal', 'Nama Produk', 'Harga', 'Toko']
+    pd.testing.assert_frame_equal(left[columns].astype({'Nama Produk': str, 'Toko': str}).reset_index(drop=True),
+                                  right[columns].astype({'Nama Produk': str, 'Toko': str}).reset_index(drop=True))
+
+def _synced():
+    sheets, state = _sheets(), {'sheets': {}, 'kamus': None}
+    spreadsheet = MemorySpreadsheet(sheets)
+    _, sync = _sync(spreadsheet, state)
+    assert sync == {'Mode': 'penuh', 'Baris Diproses': 6}
+    return sheets, spreadsheet, state
+
+def test_appended_rows_are_synced_as_delta():
+    sheets, spreadsheet, state = _synced()
+    sheets[TITLE] += [_row(3, "PRODUK 0", 11_000), _row(3, "PRODUK 9", 5_000)]
+    rekap_df, sync = _sync(spreadsheet, state)
+    assert sync == {'Mode': 'delta', 'Baris Diproses': 2}
+    _same(rekap_df, _full(sheets))
+
+def test_unchanged_sheet_processes_no_rows():
+    _, spreadsheet, state = _synced()
+    rekap_df, sync = _sync(spreadsheet, state)
+    assert sync == {'Mode': 'delta', 'Baris Diproses': 0}
+    assert len(rekap_df) == 6
+
+def test_edited_anchor_row_triggers_rewrite():
+    sheets, spreadsheet, state = _synced()
+    sheets[TITLE][-1] = _row(2, "PRODUK 2", 99_000)
+    rekap_df, sync = _sync(spreadsheet, state)
+    assert sync['Mode'] == 'ditulis ulang'
+    assert rekap_df['Harga'].max() == 99_000
+    _same(rekap_df, _full(sheets))
+
+def test_changed_header_triggers_rewrite():
+    sheets, spreadsheet, state = _synced()
+    sheets[TITLE] = [HEADER + ['STOK']] + [row + ['Tersedia'] for row in sheets[TITLE][1:]]
+    _, sync = _sync(spreadsheet, state)
+    assert sync['Mode'] == 'ditulis ulang'
+
+def test_deleted_rows_trigger_rewrite():
+    sheets, spreadsheet, state = _synced()
+    del sheets[TITLE][-2:]
+    rekap_df, sync = _sync(spreadsheet, state)
+    assert sync == {'Mode': 'ditulis ulang', 'Baris Diproses': 4}
+    _same(rekap_df, _full(sheets))
+
+def test_backdated_new_rows_trigger_rewrite():
+    sheets, spreadsheet, state = _synced()
+    sheets[TITLE].append(_row(1, "PRODUK 7", 7_000))
+    rekap_df, sync = _sync(spreadsheet, state)
+    assert sync['Mode'] == 'ditulis ulang'
+    _same(rekap_df, _full(sheets))
+
+def test_removed_sheet_is_dropped_from_state():
+    sheets, spreadsheet, state = _synced()
+    del sheets[TITLE]
+    _, sync = _sync(spreadsheet, state)
+    assert sync == {'Mode': 'dihapus', 'Baris Diproses': 0}
+    assert state['sheets'] == {}
+
+def test_force_full_rebuilds_every_sheet():
+    _, spreadsheet, state = _synced()
+    _, sync = _sync(spreadsheet, state, force_full=True)
+    assert sync == {'Mode': 'penuh', 'Baris Diproses': 6}
+
+# ================================
+# load_all_data: pesan error
+# ================================
+def test_connection_error_only_for_open_spreadsheet(monkeypatch):
+    def refuse(source): raise ConnectionError("ditolak")
+    monkeypatch.setattr(analytics, 'open_spreadsheet', refuse)
+    rekap_df, _, report = analytics.load_all_data('kunci-koneksi')
+    assert rekap_df is None
+    assert report['error'] == "GAGAL KONEKSI/OPEN SPREADSHEET: ditolak"
+
+def test_sync_error_reports_exception_type(monkeypatch):
+    def broken_sync(spreadsheet, state, force_full=False): raise KeyError("Tanggal")
+    monkeypatch.setattr(analytics, 'sync_rekap_data', broken_sync)
+    rekap_df, _, report = analytics.load_all_data('kunci-sinkronisasi', spreadsheet=MemorySpreadsheet(_sheets()))
+    assert rekap_df is None
+    assert report['error'].startswith("GAGAL SINKRONISASI DATA (KeyError)")
@@ -0,0 +1,115 @@
+"""Tulis balik inkremental (`write_views`) ke spreadsheet palsu di memori, serta pembentukan blok & panggilan API."""
+import json
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from benchmark import MemorySpreadsheet
+
+TITLE = "OUTPUT - Ringkasan"
+
+def _frame(rows=5):
+    return pd.DataFrame({'Toko': [f"Toko {i}" for i in range(rows)], 'Omzet': [1000 * (i + 1) for i in range(rows)],
+                         'Rasio': [0.5] * rows})
+
+def _sheet(spreadsheet):
+    return [[str(value) for value in row] for row in spreadsheet.sheets[TITLE]]
+
+def _expected(frame):
+    return [[str(col) for col in frame.columns]] + [[str(analytics._cell_value(v)) for v in row] for row in frame.itertuples(index=False)]
+
+def _write(spreadsheet, frame, force=False):
+    report = analytics.write_views(spreadsheet, 'kunci', {TITLE: frame}, force=force)
+    assert report['failed'] == {}
+    return report['sheets'][TITLE]
+
+# ================================
+# write_views
+# ================================
+def test_first_write_creates_sheet_with_all_cells():
+    spreadsheet, frame = MemorySpreadsheet({}), _frame()
+    entry = _write(spreadsheet, frame)
+    assert entry['Mode'] == 'sheet baru'
+    assert entry['Sel Dikirim'] == entry['Sel Berubah'] == 6 * 3
+    assert _sheet(spreadsheet) == _expected(frame)
+
+def test_one_cell_change_sends_one_cell():
+    spreadsheet, frame = MemorySpreadsheet({}), _frame()
+    _write(spreadsheet, frame)
+    frame.loc[2, 'Omzet'] = 99
+    calls_before = spreadsheet.calls
+    entry = _write(spreadsheet, frame)
+    assert entry['Mode'] == 'diff'
+    assert (entry['Sel Berubah'], entry['Sel Dikirim'], entry['Range'], entry['Panggilan Tulis']) == (1, 1, 1, 1)
+    assert spreadsheet.calls - calls_before == 2  # daftar sheet + satu values_batch_update
+    assert _sheet(spreadsheet) == _expected(frame)
+
+def test_unchanged_frame_sends_nothing():
+    spreadsheet, frame = MemorySpreadsheet({}), _frame()
+    _write(spreadsheet, frame)
+    entry = _write(spreadsheet, frame)
+    assert (entry['Sel Dikirim'], entry['Panggilan Tulis']) == (0, 0)
+
+def test_shrinking_table_drops_old_rows():
+    spreadsheet = MemorySpreadsheet({})
+    _write(spreadsheet, _frame(5))
+    smaller = _frame(2)
+    entry = _write(spreadsheet, smaller)
+    assert entry['Baris'] == 3
+    assert _sheet(spreadsheet) == _expected(smaller)
+
+def test_force_rereads_sheet_and_repairs_manual_edits():
+    spreadsheet, frame = MemorySpreadsheet({}), _frame()
+    _write(spreadsheet, frame)
+    spreadsheet.sheets[TITLE][1][0] = "diubah manual"
+    assert _write(spreadsheet, frame)['Sel Dikirim'] == 0  # State hash lokal tidak tahu ada perubahan di sheet
+    entry = _write(spreadsheet, frame, force=True)
+    assert entry['Mode'] == 'baca acuan'
+    assert entry['Sel Dikirim'] == 1
+    assert _sheet(spreadsheet) == _expected(frame)
+
+def test_nullable_integer_column_is_json_safe_and_stable():
+    frame = pd.DataFrame({'Toko': ['A', 'B'], 'Stok': pd.array([1, None], dtype='Int64')})
+    cells = analytics.frame_to_cells(frame)
+    assert cells.tolist() == [['Toko', 'Stok'], ['A', 1], ['B', '']]
+    json.dumps(cells.tolist(), allow_nan=False)  # NaN bukan JSON yang valid untuk values_batch_update
+    spreadsheet = MemorySpreadsheet({})
+    _write(spreadsheet, frame)
+    assert _write(spreadsheet, frame, force=True)['Sel Berubah'] == 0
+
+# ================================
+# diff_blocks & pack_write_calls
+# ================================
+def _hashes(shape, changed=()):
+    hashes = np.arange(1, shape[0] * shape[1] + 1, dtype=np.uint64).reshape(shape)
+    modified = hashes.copy()
+    for cell in changed: modified[cell] += np.uint64(1000)
+    return hashes, modified
+
+def test_diff_blocks_merges_consecutive_rows_with_same_columns():
+    old, new = _hashes((10, 6), [(2, 1), (2, 3), (3, 1), (3, 3), (4, 1), (4, 3)])
+    assert analytics.diff_blocks(old, new) == [(2, 4, 1, 3)]
+
+def test_diff_blocks_splits_on_gap_or_different_columns():
+    old, new = _hashes((10, 6), [(1, 0), (2, 0), (2, 4), (5, 0), (5, 4)])
+    assert analytics.diff_blocks(old, new) == [(1, 1, 0, 0), (2, 2, 0, 4), (5, 5, 0, 4)]
+
+def test_diff_blocks_grown_table_includes_new_cells():
+    old, _ = _hashes((2, 2))
+    new = np.vstack([old, np.array([[7, 8]], dtype=np.uint64)])
+    assert analytics.diff_blocks(old, new) == [(2, 2, 0, 1)]
+
+def test_pack_write_calls_splits_block_at_cell_limit():
+    calls = analytics.pack_write_calls([(0, 9, 0, 3)], max_cells=12)  # 10 baris x 4 kolom, 3 baris per potongan
+    pieces = [piece for call in calls for piece in call]
+    assert pieces == [(0, 2, 0, 3), (3, 5, 0, 3), (6, 8, 0, 3), (9, 9, 0, 3)]
+    assert all(sum((r1 - r0 + 1) * (c1 - c0 + 1) for r0, r1, c0, c1 in call) <= 12 for call in calls)
+
+def test_pack_write_calls_groups_small_blocks_into_one_call():
+    blocks = [(row, row, 0, 1) for row in range(0, 20, 2)]
+    assert analytics.pack_write_calls(blocks, max_cells=100) == [blocks]
+    assert [len(call) for call in analytics.pack_write_calls(blocks, max_cells=100, max_ranges=4)] == [4, 4, 2]
+
+def test_pack_write_calls_row_wider_than_limit_still_sent():
+    assert analytics.pack_write_calls([(0, 1, 0, 49)], max_cells=10) == [[(0, 0, 0, 49)], [(1, 1, 0, 49)]]